@@ -15,6 +15,8 @@ import bot_core.pose_t as pose_t
 import bot_param.update_t as update_t
 
 from pybot.vision.camera_utils import construct_K, DepthCamera
+from pybot.geometry.rigid_transform import RigidTransformArray
+from pybot.utils.pose_utils import PoseTrajectory
 from pybot.vision.image_utils import im_resize
 
 from pybot.externals.log_utils import Decoder, LogReader, LogController
@@ -240,6 +242,27 @@ class LCMLogReader(LogReader):
     def get_first_frame(self): 
         return self.get_frame_with_index(0)
 
+    def pose_trajectory(self, channel='POSE', **kwargs): 
+        """
+        Timestamp-indexed trajectory (in seconds) of the bot_core.pose_t
+        messages on channel, for time-accurate pose look ups of frames 
+        (see PoseTrajectory for kwargs)
+        """
+        utimes, pos, orientation = [], [], []
+        for ev in lcm.EventLog(self.filename, 'r'): 
+            if ev.channel != channel: 
+                continue
+            msg = pose_t.decode(ev.data)
+            utimes.append(msg.utime)
+            pos.append(msg.pos)
+            orientation.append(msg.orientation)
+
+        # pose_t orientation is (w,x,y,z)
+        poses = RigidTransformArray(
+            xyzw=np.roll(np.float64(orientation).reshape(-1,4), shift=-1, axis=1), 
+            tvec=np.float64(pos).reshape(-1,3))
+        return PoseTrajectory(np.int64(utimes) * 1e-6, poses, **kwargs)
+
 class LCMLogController(LogController): 
     def __init__(self, dataset): 
         """
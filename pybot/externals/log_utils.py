@@ -364,6 +364,7 @@ class LogDB(object):
 
         self.frame_index_ = None
         self.frame_name2idx_, self.frame_idx2name_ = None, None
+        self.trajectory_ = None
         self._index()
         self.print_index_info()
 
@@ -371,6 +372,11 @@ class LogDB(object):
     def index(self): 
         return self.frame_index_
 
+    @property
+    def trajectory(self): 
+        """ Timestamp-indexed poses (PoseTrajectory), if available """
+        return self.trajectory_
+
     def _index(self): 
         raise NotImplementedError()
 
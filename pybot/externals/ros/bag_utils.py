@@ -9,7 +9,6 @@ import cv2
 import time
 import os.path
 
-import tf
 import rosbag
 import rospy
 # from message_filters import ApproximateTimeSynchronizer
@@ -20,12 +19,14 @@ from cv_bridge import CvBridge, CvBridgeError
 from cv_bridge.boost.cv_bridge_boost import cvtColor2
 from tf2_msgs.msg import TFMessage
 
-from pybot.utils.misc import Accumulator
+from pybot.utils.misc import Accumulator, print_yellow
+from pybot.utils.pose_utils import PoseTrajectory
 from pybot.externals.log_utils import Decoder, LogReader, LogController, LogDB
 from pybot.vision.image_utils import im_resize
 from pybot.vision.imshow_utils import imshow_cv
 from pybot.vision.camera_utils import CameraIntrinsic
 from pybot.geometry.rigid_transform import RigidTransform
+from pybot.externals.ros.tf_buffer import TFBuffer
 from pybot.utils.dataset.sun3d_utils import SUN3DAnnotationDB
 
 class GazeboDecoder(Decoder): 
@@ -288,8 +289,9 @@ class ROSBagReader(LogReader):
         if self.start_idx < 0 or self.start_idx > 100: 
             raise ValueError('start_idx in ROSBagReader expects a percentage [0,100], provided {:}'.format(self.start_idx))
 
-        # TF relations
+        # TF relations, and offline TF buffer (indexed on first use)
         self.relations_map_ = {}
+        self.tf_buffer_ = None
         print('-' * 120 + '\n{:}\n'.format(self.log) + '-' * 120)
         
         # # Gazebo states (if available)
@@ -340,62 +342,58 @@ class ROSBagReader(LogReader):
         print('{} :: Done loading {} in {:5.2f} seconds'.format(self.__class__.__name__, filename, time.time() - st))
         return bag
 
-    def tf(self, from_tf, to_tf): 
+    @property
+    def tf_buffer(self): 
+        """
+        Offline TF buffer, indexed with a single pass over 
+        /tf and /tf_static (no ROS master required)
+        """
+        if self.tf_buffer_ is None: 
+            st = time.time()
+            topics = ['/tf', '/tf_static']
+            msgs = {topic: [] for topic in topics}
+            for (channel, msg, t) in self.log.read_messages(topics=topics): 
+                msgs[channel].append(msg)
+            self.tf_buffer_ = TFBuffer.from_messages(msgs['/tf'], static_msgs=msgs['/tf_static'])
+            print('{} :: Indexed {} in {:5.2f} seconds'
+                  .format(self.__class__.__name__, self.tf_buffer_, time.time() - st))
+        return self.tf_buffer_
+
+    def tf(self, from_tf, to_tf, t=None): 
+        """
+        Pose of to_tf w.r.t from_tf, either established via 
+        establish_tfs, or looked up at time t [s] 
+        (see TFBuffer.lookup, frame ids with or without the leading '/')
+        """
+        key = (from_tf.lstrip('/'), to_tf.lstrip('/'))
+        if t is None and key in self.relations_map_: 
+            return self.relations_map_[key]
         try: 
-            return self.relations_map_[(from_tf, to_tf)]
-        except: 
-            raise KeyError('Relations map does not contain {:}=>{:} tranformation'.format(from_tf, to_tf))
+            return self.tf_buffer.lookup(from_tf, to_tf, t)
+        except (KeyError, RuntimeError), e: 
+            raise KeyError('Relations map does not contain {:}=>{:} tranformation, {}'
+                           .format(from_tf, to_tf, e))
 
     def establish_tfs(self, relations):
         """
         Perform a one-time look up of all the requested
-        *static* relations between frames (available via /tf)
+        *static* relations between frames (available via /tf), 
+        at the latest common time of each relation
         """
-
-        # Init node and tf listener
-        rospy.init_node(self.__class__.__name__, disable_signals=True)
-        tf_listener = tf.TransformListener()
-
-        # Create tf decoder
-        tf_dec = TfDecoderAndPublisher(channel='/tf')
-
-        # Establish tf relations
         print('{} :: Establishing tfs from ROSBag'.format(self.__class__.__name__))
-        for self.idx, (channel, msg, t) in enumerate(self.log.read_messages(topics='/tf')): 
-            tf_dec.decode(msg)
-            for (from_tf, to_tf) in relations:  
-
-                # If the relations have been added already, skip
-                if (from_tf, to_tf) in self.relations_map_: 
-                    continue
-                    
-                # Check if the frames exist yet
-                if not tf_listener.frameExists(from_tf) or not tf_listener.frameExists(to_tf): 
-                    continue
-
-                # Retrieve the transform with common time
-                try:
-                    tcommon = tf_listener.getLatestCommonTime(from_tf, to_tf)
-                    (trans,rot) = tf_listener.lookupTransform(from_tf, to_tf, tcommon)
-                    self.relations_map_[(from_tf,to_tf)] = RigidTransform(tvec=trans, xyzw=rot)
-                    # print('\tSuccessfully received transform: {:} => {:} {:}'
-                    #       .format(from_tf, to_tf, self.relations_map_[(from_tf,to_tf)]))
-                except (tf.LookupException, tf.ConnectivityException, tf.ExtrapolationException) as e:
-                    # print e
-                    pass
-
-            # Finish up once we've established all the requested tfs
-            if len(self.relations_map_) == len(relations): 
-                break
-
-        try: 
-            tfs = [self.relations_map_[(from_tf,to_tf)] for (from_tf, to_tf) in relations] 
-            for (from_tf, to_tf) in relations: 
-                print('\tSuccessfully received transform:\n\t\t {:} => {:} {:}'
-                      .format(from_tf, to_tf, self.relations_map_[(from_tf,to_tf)]))
-
-        except: 
-            raise RuntimeError('Error concerning tf lookup')
+        keys = [(from_tf.lstrip('/'), to_tf.lstrip('/')) for (from_tf, to_tf) in relations]
+        for (from_tf, to_tf) in keys: 
+            if (from_tf, to_tf) in self.relations_map_: 
+                continue
+            try: 
+                self.relations_map_[(from_tf,to_tf)] = self.tf_buffer.lookup(from_tf, to_tf)
+            except (KeyError, RuntimeError), e: 
+                raise RuntimeError('Error concerning tf lookup {:}=>{:}, {}'.format(from_tf, to_tf, e))
+
+        tfs = [self.relations_map_[key] for key in keys] 
+        for (from_tf, to_tf) in keys: 
+            print('\tSuccessfully received transform:\n\t\t {:} => {:} {:}'
+                  .format(from_tf, to_tf, self.relations_map_[(from_tf,to_tf)]))
         print('{} :: Established {:} relations\n'.format(self.__class__.__name__, len(tfs)))
         
         return tfs 
@@ -436,6 +434,14 @@ class ROSBagReader(LogReader):
                 # Finish up
             if len(checked) == len(relations_lut):
                 break
+
+        # Check that the frames are part of the tf tree 
+        # (only warn, they may be published outside the bag)
+        missing = [frame_id for frame_id in relations_lut.itervalues() 
+                   if not self.tf_buffer.has_frame(frame_id)]
+        if len(missing): 
+            print_yellow('{} :: TF Check warning, frames {:} not available in /tf, /tf_static'
+                         .format(self.__class__.__name__, missing))
         print('{} :: Checked {:} relations\n'.format(self.__class__.__name__, len(checked)))
         return  
 
@@ -548,9 +554,19 @@ class BagFrame(object):
 
 
 class BagDB(LogDB): 
-    def __init__(self, dataset): 
+    def __init__(self, dataset, pose_channel=None, tf_relation=None, max_gap=0.5, max_extrapolation=0.1): 
         """
+        pose_channel: Channel decoded to RigidTransform (e.g. NavMsgDecoder, 
+           PoseStampedMsgDecoder) used to interpolate frame poses, 
+           see PoseTrajectory for max_gap, max_extrapolation [s]
+        tf_relation: (from_tf, to_tf) frames used instead of pose_channel, 
+           frame poses are looked up in the dataset's offline TF buffer
         """
+        self.pose_channel_ = pose_channel
+        self.tf_relation_ = tf_relation
+        self.max_gap_ = max_gap
+        self.max_extrapolation_ = max_extrapolation
+
         # Load logdb with ground truth metadata
         # Read annotations from index.json {fn -> annotations}
         try: 
@@ -562,18 +578,40 @@ class BagDB(LogDB):
         LogDB.__init__(self, dataset, meta=meta)
 
     def _index(self): 
-        pass
+        """
+        Constructs a timestamp-indexed trajectory from tf_relation, 
+        or pose_channel
+        """
+        if self.tf_relation_ is not None: 
+            from_tf, to_tf = self.tf_relation_
+            self.trajectory_ = self.dataset.tf_buffer.trajectory(
+                from_tf, to_tf, max_gap=self.max_gap_, max_extrapolation=self.max_extrapolation_)
+            print('{} :: Indexed {}'.format(self.__class__.__name__, self.trajectory_))
+            return
+
+        if self.pose_channel_ is None: 
+            return
+
+        self.trajectory_ = PoseTrajectory.from_items(
+            ((t.to_sec(), pose) for (t, ch, pose) in 
+             self.dataset.iteritems(topics=[self.pose_channel_])), 
+            max_gap=self.max_gap_, max_extrapolation=self.max_extrapolation_)
+        print('{} :: Indexed {}'.format(self.__class__.__name__, self.trajectory_))
 
     def iterframes(self): 
         """
         Ground truth reader interface for Images [with time, pose,
-        annotation] : lookup corresponding annotation, and filled in
-        poses from nearest available timestamp
+        annotation] : lookup corresponding annotation, and poses 
+        interpolated at the image timestamp (if indexed with a 
+        pose_channel)
         """
         self.check_ground_truth_availability()
 
+        trajectory = self.trajectory_ \
+                     if self.trajectory_ is not None and len(self.trajectory_) else None
         for rgb_idx, (t, ch, data) in enumerate(self.dataset.iteritems(topics=['/camera/rgb/image_raw/compressed_triggered'])):
-            frame = BagFrame(rgb_idx, t, data, None, self.annotationdb['rgb/{:08d}.jpg'.format(rgb_idx)]) 
+            pose = trajectory.query(t.to_sec()) if trajectory is not None else None
+            frame = BagFrame(rgb_idx, t, data, pose, self.annotationdb['rgb/{:08d}.jpg'.format(rgb_idx)]) 
             yield (frame.timestamp, rgb_idx, frame)
                    
 
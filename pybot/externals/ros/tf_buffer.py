@@ -0,0 +1,289 @@
+"""
+Offline TF buffer (no rospy / ROS master required)
+
+Transform tree of time-indexed per-edge transform series
+(parent => child), that resolves and caches the chain of edges
+between any two frames, and looks up transforms at arbitrary
+(batched) timestamps with PoseTrajectory interpolation.
+"""
+
+# License: MIT
+
+import numpy as np
+from collections import defaultdict
+
+from pybot.utils.pose_utils import PoseTrajectory
+from pybot.geometry.rigid_transform import RigidTransform, RigidTransformArray
+
+class TFBuffer(object):
+    """
+    Transform tree buffer for offline TF lookups
+
+    Each edge holds the series of poses of the child frame
+    w.r.t. its parent frame (as published on /tf). Static
+    transforms (/tf_static) are valid at all times.
+
+    lookup(from_tf, to_tf, t) follows the tf.TransformListener
+    lookupTransform(target, source, t) convention, and returns
+    the pose of to_tf w.r.t from_tf (p_{from,to}).
+
+    Frame ids are stored without the leading '/' (tf2), and
+    '/map' and 'map' refer to the same frame everywhere.
+
+    Chains (from_tf => common ancestor => to_tf) are resolved once
+    and cached until the tree structure changes, and chains that
+    only consist of static edges are cached pre-composed.
+
+    max_gap, max_extrapolation: see PoseTrajectory [s]
+
+    """
+    def __init__(self, max_gap=np.inf, max_extrapolation=0.):
+        self.max_gap_ = max_gap
+        self.max_extrapolation_ = max_extrapolation
+
+        # child -> parent, and (parent, child) -> PoseTrajectory
+        self.parent_ = {}
+        self.edges_ = {}
+        self.static_ = set()
+
+        # (from_tf, to_tf) -> (up edges, down edges), and
+        # (from_tf, to_tf) -> RigidTransform for static chains
+        self.chains_ = {}
+        self.static_chains_ = {}
+
+    def __repr__(self):
+        return '{}: frames: {}, edges: {} ({} static)'.format(
+            self.__class__.__name__, len(self.frames), len(self.edges_), len(self.static_))
+
+    def __len__(self):
+        return len(self.edges_)
+
+    # Building the tree
+
+    def extend(self, parent, child, timestamps, poses, static=False):
+        """
+        Add the poses of child w.r.t parent at the given timestamps [s]
+        (list of RigidTransforms, or RigidTransformArray)
+        """
+        parent, child = TFBuffer._frame(parent), TFBuffer._frame(child)
+        if parent == child:
+            raise ValueError('TF edge from {} to itself'.format(parent))
+
+        # Re-parenting replaces the edge (as in tf)
+        if self.parent_.get(child, parent) != parent:
+            print('{} :: Re-parenting {} from {} to {}'
+                  .format(self.__class__.__name__, child, self.parent_[child], parent))
+            self._remove_edge(self.parent_[child], child)
+
+        key = (parent, child)
+        if key not in self.edges_:
+            self.parent_[child] = parent
+            self.edges_[key] = PoseTrajectory(
+                max_gap=np.inf if static else self.max_gap_,
+                max_extrapolation=np.inf if static else self.max_extrapolation_)
+            if static:
+                self.static_.add(key)
+            self._invalidate()
+
+        # Static edges only hold the latest transform
+        if static:
+            if not isinstance(poses, RigidTransformArray):
+                poses = RigidTransformArray.from_list(poses)
+            self.edges_[key] = PoseTrajectory(timestamps[-1:], poses[-1:], max_extrapolation=np.inf)
+            self.static_chains_ = {}
+        else:
+            self.edges_[key].extend(timestamps, poses)
+
+    def set_transform(self, parent, child, t, pose, static=False):
+        self.extend(parent, child, [t], [pose], static=static)
+
+    def _remove_edge(self, parent, child):
+        self.edges_.pop((parent, child), None)
+        self.static_.discard((parent, child))
+        self.parent_.pop(child, None)
+        self._invalidate()
+
+    def _invalidate(self):
+        self.chains_ = {}
+        self.static_chains_ = {}
+
+    @staticmethod
+    def _frame(frame):
+        """ Frame id without the leading '/' (tf1 => tf2 names) """
+        return frame.lstrip('/')
+
+    @staticmethod
+    def _message_items(msg):
+        """ (parent, child, t, xyzw, tvec) from a tf2_msgs/TFMessage """
+        for tfm in msg.transforms:
+            tr, rot = tfm.transform.translation, tfm.transform.rotation
+            yield (TFBuffer._frame(tfm.header.frame_id), TFBuffer._frame(tfm.child_frame_id),
+                   tfm.header.stamp.to_sec(),
+                   (rot.x, rot.y, rot.z, rot.w), (tr.x, tr.y, tr.z))
+
+    def add_messages(self, msgs, static=False):
+        """
+        Add transforms from an iterable of tf2_msgs/TFMessage,
+        collected per-edge and inserted with a single extend each
+        """
+        items = defaultdict(list)
+        for msg in msgs:
+            for (parent, child, t, xyzw, tvec) in TFBuffer._message_items(msg):
+                items[(parent, child)].append((t,) + xyzw + tvec)
+
+        for (parent, child), data in items.iteritems():
+            data = np.array(data, dtype=np.float64)
+            self.extend(parent, child, data[:,0],
+                        RigidTransformArray(data[:,1:5], data[:,5:8]), static=static)
+        return self
+
+    @classmethod
+    def from_messages(cls, msgs, static_msgs=[], **kwargs):
+        """ From /tf, and /tf_static TFMessages """
+        return cls(**kwargs).add_messages(static_msgs, static=True).add_messages(msgs)
+
+    # Chain resolution
+
+    def _path_to_root(self, frame):
+        path = [frame]
+        while path[-1] in self.parent_:
+            path.append(self.parent_[path[-1]])
+            if len(path) > len(self.parent_) + 1:
+                raise RuntimeError('{} :: Cycle in tf tree at {}'
+                                   .format(self.__class__.__name__, frame))
+        return path
+
+    def chain(self, from_tf, to_tf):
+        """
+        Resolve (and cache) the chain of edges between two frames,
+        via their lowest common ancestor a:
+
+           p_{from,to} = (p_{a,..,from})^-1 * p_{a,..,to}
+
+        Returns (up, down) lists of (parent, child) edges from
+        the common ancestor down to from_tf, and to_tf respectively
+        """
+        from_tf, to_tf = TFBuffer._frame(from_tf), TFBuffer._frame(to_tf)
+        key = (from_tf, to_tf)
+        try:
+            return self.chains_[key]
+        except KeyError:
+            pass
+
+        for frame in key:
+            if not self.has_frame(frame):
+                raise KeyError('{} :: Frame {} does not exist'
+                               .format(self.__class__.__name__, frame))
+
+        path_from, path_to = self._path_to_root(from_tf), self._path_to_root(to_tf)
+        ancestors = set(path_to)
+        common = next((f for f in path_from if f in ancestors), None)
+        if common is None:
+            raise RuntimeError('{} :: Frames {} and {} are not connected'
+                               .format(self.__class__.__name__, from_tf, to_tf))
+
+        def edges(path):
+            path = path[:path.index(common)+1][::-1]
+            return [(path[j], path[j+1]) for j in xrange(len(path)-1)]
+
+        self.chains_[key] = (edges(path_from), edges(path_to))
+        return self.chains_[key]
+
+    def _compose(self, edges, t):
+        """ Compose the edges of a chain at timestamps t [N] """
+        poses = RigidTransformArray.identity(len(t))
+        valid = np.ones(len(t), dtype=np.bool)
+        for edge in edges:
+            p, v = self.edges_[edge].query(t)
+            poses, valid = poses.oplus(p), valid & v
+        return poses, valid
+
+    def latest_common_time(self, from_tf, to_tf):
+        """
+        Latest time at which all the (non-static) edges of the
+        chain have data (None for static chains)
+        """
+        up, down = self.chain(from_tf, to_tf)
+        ts = [self.edges_[e].timestamps[-1] for e in up + down if e not in self.static_]
+        return min(ts) if len(ts) else None
+
+    def is_static(self, from_tf, to_tf):
+        up, down = self.chain(from_tf, to_tf)
+        return all(e in self.static_ for e in up + down)
+
+    def lookup(self, from_tf, to_tf, t=None):
+        """
+        Pose of to_tf w.r.t from_tf at timestamps t [s]
+
+        t [None]: at the latest common time of the chain
+        t [scalar]: returns RigidTransform, or None if the
+           lookup requires extrapolating beyond the limits
+        t [N]: returns (RigidTransformArray [N], valid [N])
+        """
+        from_tf, to_tf = TFBuffer._frame(from_tf), TFBuffer._frame(to_tf)
+        if from_tf == to_tf:
+            if t is None or np.ndim(t) == 0:
+                return RigidTransform.identity()
+            return RigidTransformArray.identity(len(t)), np.ones(len(t), dtype=np.bool)
+
+        up, down = self.chain(from_tf, to_tf)
+        if t is None:
+            t = self.latest_common_time(from_tf, to_tf)
+            t = 0. if t is None else t
+
+        tq = np.atleast_1d(np.asarray(t, dtype=np.float64)).ravel()
+        scalar = np.ndim(t) == 0
+
+        # Fully static chains are composed once
+        if self.is_static(from_tf, to_tf):
+            key = (from_tf, to_tf)
+            if key not in self.static_chains_:
+                pu, _ = self._compose(up, tq[:1])
+                pd, _ = self._compose(down, tq[:1])
+                self.static_chains_[key] = pd.ominus(pu)[0]
+            p = self.static_chains_[key]
+            if scalar:
+                return p
+            return RigidTransformArray.from_list([p])[np.zeros(len(tq), dtype=np.int64)], \
+                np.ones(len(tq), dtype=np.bool)
+
+        pu, vu = self._compose(up, tq)
+        pd, vd = self._compose(down, tq)
+        poses, valid = pd.ominus(pu), vu & vd
+        if scalar:
+            return poses[0] if valid[0] else None
+        return poses, valid
+
+    def can_transform(self, from_tf, to_tf, t=None):
+        try:
+            if t is None:
+                self.chain(from_tf, to_tf)
+                return True
+            return self.lookup(from_tf, to_tf, t) is not None
+        except (KeyError, RuntimeError):
+            return False
+
+    def trajectory(self, from_tf, to_tf, **kwargs):
+        """
+        PoseTrajectory of to_tf w.r.t from_tf, evaluated at
+        all the timestamps of the (non-static) edges in the chain
+        """
+        up, down = self.chain(from_tf, to_tf)
+        ts = [self.edges_[e].timestamps for e in up + down if e not in self.static_]
+        ts = np.unique(np.concatenate(ts)) if len(ts) else np.zeros(1)
+        poses, valid = self.lookup(from_tf, to_tf, ts)
+        return PoseTrajectory(ts[valid], poses[np.where(valid)[0]], **kwargs)
+
+    # Properties
+
+    def has_frame(self, frame):
+        frame = TFBuffer._frame(frame)
+        return frame in self.parent_ or frame in self.parent_.itervalues()
+
+    @property
+    def frames(self):
+        return set(self.parent_.keys()) | set(self.parent_.values())
+
+    @property
+    def edges(self):
+        return self.edges_.keys()
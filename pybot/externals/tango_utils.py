@@ -18,8 +18,9 @@ from pybot.vision.image_utils import im_resize
 from pybot.vision.camera_utils import CameraIntrinsic
 from pybot.geometry.rigid_transform import RigidTransform
 from pybot.utils.dataset.sun3d_utils import SUN3DAnnotationDB
-from pybot.utils.pose_utils import PoseSampler
+from pybot.utils.pose_utils import PoseSampler, PoseTrajectory
 from pybot.utils.misc import Accumulator
+from pybot.utils.frame_cache import get_frame_cache
 
 
 TANGO_RGB_CHANNEL = 'RGB'
@@ -365,9 +366,13 @@ class TangoFrame(object):
         return 'TangoFrame::img={}'.format(self.img_msg_)
 
 class TangoDB(LogDB): 
-    def __init__(self, dataset): 
+    def __init__(self, dataset, cache=None): 
         """
+        cache: Optional decoded-frame cache (FrameCache, or True for the 
+           process-wide cache) for TangoFrame.img, e.g. when revisiting 
+           frames with iterframes_indices
         """
+        self.cache_ = get_frame_cache(cache)
         # Load logdb with ground truth metadata
         # Read annotations from index.json {fn -> annotations}
         try: 
@@ -380,7 +385,8 @@ class TangoDB(LogDB):
 
         LogDB.__init__(self, dataset, meta=meta)
         
-    def _index(self, pose_channel=TANGO_VIO_CHANNEL, rgb_channel=TANGO_RGB_CHANNEL): 
+    def _index(self, pose_channel=TANGO_VIO_CHANNEL, rgb_channel=TANGO_RGB_CHANNEL, 
+               max_gap=0.5, max_extrapolation=0.1): 
         """
         Constructs a look up table for the following variables: 
         
@@ -389,31 +395,39 @@ class TangoDB(LogDB):
             self.frame_name2idx_: idx -> rgb/img.png
 
         where TangoFrame (index_in_the_dataset, timestamp, )
+        with the pose interpolated at the image timestamp. 
+        
+        Images further than max_gap [s] from bracketing poses, or 
+        max_extrapolation [s] outside the trajectory are skipped.
         """
 
-        # 1. Iterate through both poses and images, and construct frames
-        # with look up table for filename str -> (timestamp, pose, annotation) 
-        poses = []
+        # 1. Iterate through both poses and images, and construct a 
+        # trajectory indexed by timestamp (in seconds) for pose look ups
         pose_decode = lambda msg_item: \
                       self.dataset.decoder[pose_channel].decode(msg_item)
 
         # Note: Control flow for idx is critical since start_idx could
         # potentially change the offset and destroy the pose_index
+        ts, poses, img_items = [], [], []
         for idx, (t, ch, msg) in enumerate(self.dataset.itercursors()): 
-            pose = None
             if ch == pose_channel: 
                 try: 
-                    pose = pose_decode(msg)
+                    poses.append(pose_decode(msg))
+                    ts.append(t * 1e-9)
                 except: 
-                    pose = None
-            poses.append(pose)
-
-        # Find valid and missing poses
-        # pose_inds: log_index -> closest_valid_index
-        valid_arr = np.array(
-            map(lambda item: item is not None, poses), dtype=np.bool)
-        pose_inds = TangoDB._nn_pose_fill(valid_arr)
-        if np.any(pose_inds < 0): 
+                    pass
+            elif ch == rgb_channel: 
+                img_items.append((idx, t, msg))
+        self.trajectory_ = PoseTrajectory(ts, poses, max_gap=max_gap, 
+                                          max_extrapolation=max_extrapolation)
+
+        # 2. Interpolate poses at all image timestamps in one query
+        if len(self.trajectory_): 
+            img_poses, valid = self.trajectory_.query(
+                np.float64([t for (_, t, _) in img_items]) * 1e-9)
+        else: 
+            img_poses, valid = None, np.zeros(len(img_items), dtype=np.bool)
+        if not np.all(valid): 
             print('{} :: TangoDB poses are not fully synchronized, '
                   'skipping few'.format(self.__class__.__name__))
 
@@ -421,13 +435,17 @@ class TangoDB(LogDB):
         # self.frame_index_:  rgb/img.png -> TangoFrame
         # self.frame_idx2name_: idx -> rgb/img.png
         # self.frame_name2idx_: rgb/img.png -> idx
-        img_decode = lambda msg_item: \
-                    self.dataset.decoder[rgb_channel].decode(msg_item)
+        img_decoder = self.dataset.decoder[rgb_channel]
+        img_decode = lambda msg_item: img_decoder.decode(msg_item)
+        if self.cache_ is not None: 
+            img_decode = lambda msg_item: self.cache_.get(
+                (os.path.join(img_decoder.directory_, msg_item), 
+                 tuple(img_decoder.shape_), img_decoder.color_), 
+                lambda: img_decoder.decode(msg_item))
         self.frame_index_ = OrderedDict([
-            (img_msg, TangoFrame(idx, t, img_msg, poses[pose_inds[idx]], 
+            (img_msg, TangoFrame(idx, t, img_msg, img_poses[j], 
                                  self.annotationdb[img_msg], img_decode))
-            for idx, (t, ch, img_msg) in enumerate(self.dataset.itercursors()) \
-            if ch == rgb_channel and pose_inds[idx] >= 0
+            for j, (idx, t, img_msg) in enumerate(img_items) if valid[j]
         ])
         self.frame_idx2name_ = OrderedDict([
             (idx, k) for idx, k in enumerate(self.frame_index_.keys())
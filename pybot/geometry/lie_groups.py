@@ -0,0 +1,299 @@
+"""
+Closed-form exponential / logarithm maps, and Jacobians for
+SO(3), SE(3) and Sim(3).
+
+All functions operate on stacks of N elements:
+   SO(3): w [N x 3] <-> R [N x 3 x 3] (or quaternions [N x 4], xyzw)
+   SE(3): xi = (v, w) [N x 6] <-> T [N x 4 x 4], [R t; 0 1]
+   Sim(3): zeta = (v, w, l) [N x 7] <-> S [N x 4 x 4], [sR t; 0 1], s=exp(l)
+
+Single elements ([3], [6], [7] tangents or [3 x 3], [4 x 4] matrices)
+are supported and returned without the leading dimension.
+
+Tangent vectors are ordered translation first, then rotation
+(and log-scale for Sim(3)), and the Jacobians follow
+T(xi + dxi) ~= exp(J_l(xi) dxi) T(xi) ~= T(xi) exp(J_r(xi) dxi).
+
+Ref:
+   T. Barfoot, State Estimation for Robotics, 2017
+   E. Eade, Lie Groups for 2D and 3D Transformations, 2013
+"""
+# License: MIT
+
+import numpy as np
+from pybot.geometry.quaternion import batch_quaternion_normalize, batch_quaternion_from_matrix
+
+# Below these angles the closed-form coefficients are replaced
+# by their Taylor expansions to avoid catastrophic cancellation
+_EPS_SO3 = 1e-5
+_EPS_SE3 = 1e-3
+
+def _stack(x, d):
+    """ Reshape to [N x d] (or [N x d x d]), and flag single elements """
+    x = np.asarray(x, dtype=np.float64)
+    single = x.ndim == (1 if isinstance(d, int) else 2)
+    shape = (-1, d) if isinstance(d, int) else (-1,) + d
+    return x.reshape(shape), single
+
+def _unstack(x, single):
+    return x[0] if single else x
+
+def _theta(w):
+    """ Rotation angle, and its square """
+    th2 = np.sum(w * w, axis=-1)
+    th = np.sqrt(th2)
+    return th, th2
+
+def _safe(th, small):
+    """ Angle with small entries replaced (used only in the closed-form branch) """
+    return np.where(small, 1., th)
+
+###############################################################################
+# SO(3)
+
+def so3_hat(w):
+    """ [N x 3] -> [N x 3 x 3] skew-symmetric (cross-product) matrices """
+    w, single = _stack(w, 3)
+    W = np.zeros((len(w),3,3))
+    W[:,0,1], W[:,0,2] = -w[:,2], w[:,1]
+    W[:,1,0], W[:,1,2] = w[:,2], -w[:,0]
+    W[:,2,0], W[:,2,1] = -w[:,1], w[:,0]
+    return _unstack(W, single)
+
+def so3_vee(W):
+    """ [N x 3 x 3] skew-symmetric matrices -> [N x 3] """
+    W, single = _stack(W, (3,3))
+    w = np.vstack([W[:,2,1] - W[:,1,2],
+                   W[:,0,2] - W[:,2,0],
+                   W[:,1,0] - W[:,0,1]]).T * 0.5
+    return _unstack(w, single)
+
+def _so3_coeffs(th, th2):
+    """ a = sin(t)/t, b = (1-cos(t))/t^2, c = (t-sin(t))/t^3 """
+    small = th < _EPS_SE3
+    t, t2 = _safe(th, small), np.where(small, 1., th2)
+    s, co = np.sin(t), np.cos(t)
+    a = np.where(small, 1. - th2 / 6., s / t)
+    b = np.where(small, 0.5 - th2 / 24., (1. - co) / t2)
+    c = np.where(small, 1./6 - th2 / 120., (t - s) / (t2 * t))
+    return a, b, c
+
+def so3_exp(w):
+    """ Rodrigues' formula: [N x 3] axis-angle -> [N x 3 x 3] rotations """
+    w, single = _stack(w, 3)
+    th, th2 = _theta(w)
+    a, b, _ = _so3_coeffs(th, th2)
+    W = so3_hat(w)
+    R = np.eye(3) + a[:,None,None] * W + b[:,None,None] * np.matmul(W, W)
+    return _unstack(R, single)
+
+def so3_log(R):
+    """ [N x 3 x 3] rotations -> [N x 3] axis-angle, theta in [0, pi] """
+    R, single = _stack(R, (3,3))
+    return _unstack(so3_log_quaternion(batch_quaternion_from_matrix(R)), single)
+
+def so3_exp_quaternion(w):
+    """ [N x 3] axis-angle -> [N x 4] unit quaternions (xyzw) """
+    w, single = _stack(w, 3)
+    th, th2 = _theta(w)
+    small = th < _EPS_SO3
+    t = _safe(th, small)
+    k = np.where(small, 0.5 - th2 / 48., np.sin(0.5 * t) / t)
+    q = np.hstack([k[:,None] * w, np.cos(0.5 * th)[:,None]])
+    return _unstack(q, single)
+
+def so3_log_quaternion(q):
+    """ [N x 4] quaternions (xyzw) -> [N x 3] axis-angle, theta in [0, pi] """
+    q, single = _stack(q, 4)
+    q = batch_quaternion_normalize(q)
+    q = np.where(q[:,3:] < 0, -q, q)
+    v, qw = q[:,:3], q[:,3]
+    n = np.sqrt(np.sum(v * v, axis=1))
+    small = n < _EPS_SO3
+    k = np.where(small, 2. / qw * (1. - n * n / (3. * qw * qw)),
+                 2. * np.arctan2(n, qw) / _safe(n, small))
+    return _unstack(k[:,None] * v, single)
+
+def so3_left_jacobian(w):
+    """ J_l(w) = sum_k [w]^k / (k+1)!, [N x 3] -> [N x 3 x 3] """
+    w, single = _stack(w, 3)
+    th, th2 = _theta(w)
+    _, b, c = _so3_coeffs(th, th2)
+    W = so3_hat(w)
+    J = np.eye(3) + b[:,None,None] * W + c[:,None,None] * np.matmul(W, W)
+    return _unstack(J, single)
+
+def so3_right_jacobian(w):
+    """ J_r(w) = J_l(-w) """
+    return so3_left_jacobian(-np.asarray(w, dtype=np.float64))
+
+def so3_left_jacobian_inverse(w):
+    """ J_l(w)^-1, [N x 3] -> [N x 3 x 3] (singular at theta = 2 pi) """
+    w, single = _stack(w, 3)
+    th, th2 = _theta(w)
+    small = th < _EPS_SE3
+    t, t2 = _safe(th, small), np.where(small, 1., th2)
+    d = np.where(small, 1./12 + th2 / 720.,
+                 (1. - 0.5 * t * np.sin(t) / (1. - np.cos(t))) / t2)
+    W = so3_hat(w)
+    J = np.eye(3) - 0.5 * W + d[:,None,None] * np.matmul(W, W)
+    return _unstack(J, single)
+
+def so3_right_jacobian_inverse(w):
+    """ J_r(w)^-1 = J_l(-w)^-1 """
+    return so3_left_jacobian_inverse(-np.asarray(w, dtype=np.float64))
+
+###############################################################################
+# SE(3)
+
+def se3_hat(xi):
+    """ [N x 6] -> [N x 4 x 4] twist matrices """
+    xi, single = _stack(xi, 6)
+    X = np.zeros((len(xi),4,4))
+    X[:,:3,:3] = so3_hat(xi[:,3:])
+    X[:,:3,3] = xi[:,:3]
+    return _unstack(X, single)
+
+def se3_exp(xi):
+    """ [N x 6] twists (v, w) -> [N x 4 x 4] rigid transforms """
+    xi, single = _stack(xi, 6)
+    v, w = xi[:,:3], xi[:,3:]
+    th, th2 = _theta(w)
+    a, b, c = _so3_coeffs(th, th2)
+    W = so3_hat(w)
+    W2 = np.matmul(W, W)
+    T = np.zeros((len(xi),4,4))
+    T[:,:3,:3] = np.eye(3) + a[:,None,None] * W + b[:,None,None] * W2
+    V = np.eye(3) + b[:,None,None] * W + c[:,None,None] * W2
+    T[:,:3,3] = np.einsum('nij,nj->ni', V, v)
+    T[:,3,3] = 1
+    return _unstack(T, single)
+
+def se3_log(T):
+    """ [N x 4 x 4] (or [N x 3 x 4]) rigid transforms -> [N x 6] twists (v, w) """
+    T = np.asarray(T, dtype=np.float64)
+    single = T.ndim == 2
+    T = T.reshape((-1,) + T.shape[-2:])
+    w = so3_log(T[:,:3,:3])
+    Vinv = so3_left_jacobian_inverse(w)
+    v = np.einsum('nij,nj->ni', Vinv, T[:,:3,3])
+    return _unstack(np.hstack([v, w]), single)
+
+def _se3_q(xi):
+    """ Q(v, w) block of the SE(3) left Jacobian [Barfoot, 7.86] """
+    v, w = xi[:,:3], xi[:,3:]
+    th, th2 = _theta(w)
+    small = th < _EPS_SE3
+    t, t2 = _safe(th, small), np.where(small, 1., th2)
+    s, co = np.sin(t), np.cos(t)
+    t4 = t2 * t2
+    c1 = np.where(small, 1./6 - th2 / 120., (t - s) / (t2 * t))
+    c2 = np.where(small, 1./24 - th2 / 720., (t2 + 2. * co - 2.) / (2. * t4))
+    c3 = np.where(small, 1./120 - th2 / 2520., (2. * t - 3. * s + t * co) / (2. * t4 * t))
+
+    V, W = so3_hat(v), so3_hat(w)
+    WV, VW = np.matmul(W, V), np.matmul(V, W)
+    WVW = np.matmul(WV, W)
+    WWV = np.matmul(W, WV)
+    VWW = np.matmul(VW, W)
+    WVWW = np.matmul(WVW, W)
+    WWVW = np.matmul(W, WVW)
+    return 0.5 * V + c1[:,None,None] * (WV + VW + WVW) + \
+        c2[:,None,None] * (WWV + VWW - 3. * WVW) + \
+        c3[:,None,None] * (WVWW + WWVW)
+
+def se3_left_jacobian(xi):
+    """ [N x 6] -> [N x 6 x 6] SE(3) left Jacobians """
+    xi, single = _stack(xi, 6)
+    Jw = so3_left_jacobian(xi[:,3:])
+    J = np.zeros((len(xi),6,6))
+    J[:,:3,:3] = J[:,3:,3:] = Jw
+    J[:,:3,3:] = _se3_q(xi)
+    return _unstack(J, single)
+
+def se3_right_jacobian(xi):
+    """ J_r(xi) = J_l(-xi) """
+    return se3_left_jacobian(-np.asarray(xi, dtype=np.float64))
+
+def se3_left_jacobian_inverse(xi):
+    """ [N x 6] -> [N x 6 x 6] inverse SE(3) left Jacobians """
+    xi, single = _stack(xi, 6)
+    Jinv = so3_left_jacobian_inverse(xi[:,3:])
+    J = np.zeros((len(xi),6,6))
+    J[:,:3,:3] = J[:,3:,3:] = Jinv
+    J[:,:3,3:] = -np.matmul(np.matmul(Jinv, _se3_q(xi)), Jinv)
+    return _unstack(J, single)
+
+def se3_right_jacobian_inverse(xi):
+    """ J_r(xi)^-1 = J_l(-xi)^-1 """
+    return se3_left_jacobian_inverse(-np.asarray(xi, dtype=np.float64))
+
+def se3_adjoint(T):
+    """ [N x 4 x 4] -> [N x 6 x 6] adjoints, Ad(T) xi = log(T exp(xi) T^-1) """
+    T = np.asarray(T, dtype=np.float64)
+    single = T.ndim == 2
+    T = T.reshape((-1,) + T.shape[-2:])
+    R = T[:,:3,:3]
+    A = np.zeros((len(T),6,6))
+    A[:,:3,:3] = A[:,3:,3:] = R
+    A[:,:3,3:] = np.matmul(so3_hat(T[:,:3,3]), R)
+    return _unstack(A, single)
+
+###############################################################################
+# Sim(3)
+
+def _sim3_coeffs(th, th2, l):
+    """
+    W(w, l) = a I + b [w] + c [w]^2 = int_0^1 exp(l s) exp([w] s) ds
+    """
+    small_l = np.fabs(l) < _EPS_SE3
+    small_t = th < _EPS_SE3
+    ls = np.where(small_l, 1., l)
+    el = np.exp(l)
+    a = np.where(small_l, 1. + l / 2. + l * l / 6., (el - 1.) / ls)
+
+    # Limits as theta -> 0: int s exp(l s), int s^2/2 exp(l s)
+    b0 = np.where(small_l, 0.5 + l / 3., (el * (ls - 1.) + 1.) / (ls * ls))
+    c0 = np.where(small_l, 1./6 + l / 8.,
+                  (el * (ls * ls - 2. * ls + 2.) - 2.) / (2. * ls * ls * ls))
+
+    t, t2 = _safe(th, small_t), np.where(small_t, 1., th2)
+    s, co = np.sin(t), np.cos(t)
+    d = l * l + t2
+    Is = (el * (l * s - t * co) + t) / d
+    Ic = (el * (l * co + t * s) - l) / d
+    b = np.where(small_t, b0, Is / t)
+    c = np.where(small_t, c0, (a - Ic) / t2)
+    return a, b, c
+
+def sim3_exp(zeta):
+    """ [N x 7] (v, w, log-scale) -> [N x 4 x 4] similarities [sR t; 0 1] """
+    zeta, single = _stack(zeta, 7)
+    v, w, l = zeta[:,:3], zeta[:,3:6], zeta[:,6]
+    th, th2 = _theta(w)
+    a, b, c = _sim3_coeffs(th, th2, l)
+    W = so3_hat(w)
+    W2 = np.matmul(W, W)
+    S = np.zeros((len(zeta),4,4))
+    S[:,:3,:3] = np.exp(l)[:,None,None] * so3_exp(w)
+    V = a[:,None,None] * np.eye(3) + b[:,None,None] * W + c[:,None,None] * W2
+    S[:,:3,3] = np.einsum('nij,nj->ni', V, v)
+    S[:,3,3] = 1
+    return _unstack(S, single)
+
+def sim3_log(S):
+    """ [N x 4 x 4] similarities [sR t; 0 1] -> [N x 7] (v, w, log-scale) """
+    S = np.asarray(S, dtype=np.float64)
+    single = S.ndim == 2
+    S = S.reshape((-1,) + S.shape[-2:])
+    sR = S[:,:3,:3]
+    s = np.cbrt(np.linalg.det(sR))
+    l = np.log(s)
+    w = so3_log(sR / s[:,None,None])
+    th, th2 = _theta(w)
+    a, b, c = _sim3_coeffs(th, th2, l)
+    W = so3_hat(w)
+    V = a[:,None,None] * np.eye(3) + b[:,None,None] * W + \
+        c[:,None,None] * np.matmul(W, W)
+    v = np.linalg.solve(V, S[:,:3,3:])[:,:,0]
+    return _unstack(np.hstack([v, w, l[:,None]]), single)
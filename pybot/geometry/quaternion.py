@@ -15,14 +15,17 @@ class Quaternion(object):
        : (qx, qy, qz, qw)
     
     """
+    __slots__ = ('q_', 'R_')
+
     def __init__ (self, q=[0,0,0,1]):
         if isinstance(q, Quaternion): 
-            self.q = q.q.copy()
-        else:
-            try: 
-                self.q = np.array(q, np.float64)
-            except:
-                raise TypeError("Quaternion can not be initialized from {:}".format(type(q)))
+            # Buffers are read-only, share them (and the cached matrix)
+            self.q_, self.R_ = q.q_, q.R_
+            return
+        try: 
+            self.q = q
+        except:
+            raise TypeError("Quaternion can not be initialized from {:}".format(type(q)))
         
         self.normalize()
     
@@ -32,6 +35,23 @@ class Quaternion(object):
     def __getitem__ (self, i):
         return self.q[i]
 
+    def __getstate__(self): 
+        return (self.q_,)
+
+    def __setstate__(self, state): 
+        self.q = state[0]
+
+    @property
+    def q(self): 
+        """ Read-only (x,y,z,w) buffer, assign to q to modify """
+        return self.q_
+
+    @q.setter
+    def q(self, q): 
+        q = np.array(q, np.float64)
+        q.flags.writeable = False
+        self.q_, self.R_ = q, None
+
     # Basic operations
 
     def __mul__(self, other):
@@ -47,10 +67,10 @@ class Quaternion(object):
         """ Check validity of unit-quaternion norm """
         norm = self.norm()
         if abs(norm - 1) > 1e-6:
-            self.q /= norm
+            self.q = self.q / norm
 
     def norm(self): 
-        return np.linalg.norm(self.q)
+        return math.sqrt(self.q.dot(self.q))
 
     def dot(self, other): 
         return self.q.dot(other.q)
@@ -193,8 +213,12 @@ class Quaternion(object):
 
     @property
     def R(self): 
-        """ Returns 3x3 transformation matrix """ 
-        return self.to_matrix()[:3,:3]
+        """ Returns 3x3 rotation matrix (read-only, cached until q changes) """ 
+        if self.R_ is None: 
+            R = self.to_matrix()[:3,:3].copy()
+            R.flags.writeable = False
+            self.R_ = R
+        return self.R_
 
     @property
     def x(self): 
@@ -226,6 +250,267 @@ class Quaternion(object):
         return self.to_rpy()
 
 
+###############################################################################
+# Batched operations on [N x 4] quaternion stacks (qx, qy, qz, qw)
+# All functions broadcast over the leading dimensions
+
+def batch_quaternion_normalize(q):
+    """ Normalize [N x 4] quaternions to unit-norm """
+    q = np.asarray(q, dtype=np.float64)
+    return q / np.linalg.norm(q, axis=-1)[...,np.newaxis]
+
+def batch_quaternion_multiply(q1, q0):
+    """ Multiply [N x 4] quaternions (q1 * q0), see tf.quaternion_multiply """
+    q1, q0 = np.asarray(q1, dtype=np.float64), np.asarray(q0, dtype=np.float64)
+    x0, y0, z0, w0 = q0[...,0], q0[...,1], q0[...,2], q0[...,3]
+    x1, y1, z1, w1 = q1[...,0], q1[...,1], q1[...,2], q1[...,3]
+    return np.stack([ x1*w0 + y1*z0 - z1*y0 + w1*x0,
+                     -x1*z0 + y1*w0 + z1*x0 + w1*y0,
+                      x1*y0 - y1*x0 + z1*w0 + w1*z0,
+                     -x1*x0 - y1*y0 - z1*z0 + w1*w0], axis=-1)
+
+def batch_quaternion_conjugate(q):
+    """ Conjugate of [N x 4] quaternions """
+    qc = np.array(q, dtype=np.float64, copy=True)
+    qc[...,:3] *= -1
+    return qc
+
+def batch_quaternion_rotate(q, v):
+    """
+    Rotate [N x 3] vectors with [N x 4] unit quaternions
+    (v' = v + 2w (u x v) + 2 u x (u x v), u = [qx, qy, qz])
+    """
+    q, v = np.asarray(q, dtype=np.float64), np.asarray(v)
+    u, w = q[...,:3], q[...,3:4]
+    uv = np.cross(u, v)
+    return v + 2 * (w * uv + np.cross(u, uv))
+
+def batch_quaternion_matrix(q):
+    """ Returns [N x 3 x 3] rotation matrices from [N x 4] quaternions """
+    return tf.batch_quaternion_matrix(q)[...,:3,:3]
+
+def batch_quaternion_from_matrix(M):
+    """
+    Returns [N x 4] quaternions from [N x 3 x 3] or [N x 4 x 4]
+    rotation matrices, see tf.batch_quaternion_from_matrix
+    """
+    return tf.batch_quaternion_from_matrix(M)
+
+def batch_quaternion_slerp(q0, q1, fraction):
+    """
+    Spherical linear interpolation between [N x 4] quaternions
+    q0 (fraction=0) and q1 (fraction=1) along the shortest path.
+    fraction may be a scalar or an [N] array
+    """
+    q0, q1 = batch_quaternion_normalize(q0), batch_quaternion_normalize(q1)
+    fraction = np.asarray(fraction, dtype=np.float64)[...,np.newaxis]
+
+    d = np.sum(q0 * q1, axis=-1)[...,np.newaxis]
+    q1 = np.where(d < 0, -q1, q1)
+    d = np.clip(np.fabs(d), 0, 1)
+
+    # Direct linear interpolation for numerically unstable regions
+    omega = np.arccos(d)
+    sin_omega = np.sin(omega)
+    small = sin_omega < 1e-6
+    sin_omega[small] = 1
+    a = np.where(small, 1 - fraction, np.sin((1 - fraction) * omega) / sin_omega)
+    b = np.where(small, fraction, np.sin(fraction * omega) / sin_omega)
+    return batch_quaternion_normalize(a * q0 + b * q1)
+
+def batch_euler_from_matrix(M, axes='sxyz'):
+    """
+    Returns [N x 3] Euler angles from [N x 3 x 3] (or [N x 4 x 4])
+    rotation matrices, see tf.batch_euler_from_matrix
+    """
+    return tf.batch_euler_from_matrix(M, axes=axes)
+
+
+###############################################################################
+class QuaternionArray(object):
+    """
+    Vectorized Quaternion class, holds N quaternions
+    in a single [N x 4] buffer
+       : (qx, qy, qz, qw)
+
+    Indexing with an integer returns a Quaternion, while
+    slicing returns a QuaternionArray (a view for basic slices).
+
+    """
+    def __init__ (self, q=[[0,0,0,1]]):
+        if isinstance(q, (Quaternion, QuaternionArray)):
+            q = q.q
+        try:
+            q = np.array(q, np.float64).reshape(-1,4)
+        except:
+            raise TypeError("QuaternionArray can not be initialized from {:}".format(type(q)))
+        self.q = batch_quaternion_normalize(q)
+
+    @classmethod
+    def from_data(cls, q, copy=True):
+        """ Wrap an existing [N x 4] buffer without re-normalizing """
+        a = cls.__new__(cls)
+        a.q = np.array(q, np.float64, copy=copy)
+        return a
+
+    def __repr__ (self):
+        return 'QuaternionArray (N={:})\n{:}'.format(len(self), self.q)
+
+    def __len__(self):
+        return len(self.q)
+
+    def __getitem__ (self, i):
+        if isinstance(i, (int, np.integer)):
+            return Quaternion(self.q[i])
+        return QuaternionArray.from_data(self.q[i], copy=False)
+
+    def __iter__(self):
+        for j in xrange(len(self)):
+            yield self[j]
+
+    # Basic operations
+
+    def __mul__(self, other):
+        """ Multiply quaternions element-wise with another (or broadcast a single one) """
+        if isinstance(other, float):
+            return QuaternionArray.from_data(self.q * other, copy=False)
+        elif isinstance(other, (Quaternion, QuaternionArray)):
+            return QuaternionArray.from_data(batch_quaternion_multiply(self.q, other.q), copy=False)
+        else:
+            raise TypeError('QuaternionArray multiply error')
+
+    def normalize(self):
+        """ Normalize (in-place) to unit-quaternions """
+        self.q /= self.norm()[:,np.newaxis]
+
+    def norm(self):
+        return np.linalg.norm(self.q, axis=1)
+
+    def dot(self, other):
+        return np.sum(self.q * other.q, axis=-1)
+
+    def inverse(self):
+        """ Invert rotations assuming unit quaternions """
+        return QuaternionArray.from_data(batch_quaternion_conjugate(self.q), copy=False)
+
+    def conjugate(self):
+        """ Quaternion conjugate """
+        return QuaternionArray.from_data(batch_quaternion_conjugate(self.q), copy=False)
+
+    def rotate(self, v):
+        """
+        Rotate vectors with these quaternions:
+           [N x 3] vectors: element-wise rotation
+           [3] vector: rotated by each of the N quaternions
+           [M x 3] vectors: rotated by the quaternion (if N=1)
+        """
+        v = np.asarray(v)
+        if len(self) == 1 and v.ndim == 2:
+            return batch_quaternion_rotate(self.q[0], v)
+        return batch_quaternion_rotate(self.q, v)
+
+    def slerp(self, other, fraction):
+        """ SLERP towards other (fraction=0: self, fraction=1: other) """
+        return QuaternionArray.from_data(batch_quaternion_slerp(self.q, other.q, fraction), copy=False)
+
+    def interpolate(self, other, this_weight):
+        """ SLERP with the same weighting convention as Quaternion.interpolate """
+        this_weight = np.asarray(this_weight)
+        assert(np.all(this_weight >= 0) and np.all(this_weight <= 1))
+        return self.slerp(other, 1 - this_weight)
+
+    # To conversions
+
+    def to_wxyz(self):
+        return np.roll(self.q, shift=1, axis=1)
+
+    def to_xyzw(self):
+        """ Return (x,y,z,w) representation """
+        return self.q
+
+    def to_rpy(self, axes='rxyz'):
+        """ Return [N x 3] Euler angles with XYZ convention """
+        return tf.batch_euler_from_quaternion(self.q, axes=axes)
+
+    def to_matrix(self):
+        """ Returns [N x 4 x 4] transformation matrices """
+        T = np.zeros((len(self),4,4), dtype=np.float64)
+        T[:,:3,:3] = batch_quaternion_matrix(self.q)
+        T[:,3,3] = 1
+        return T
+
+    def to_list(self):
+        return list(self)
+
+    # From conversions
+
+    @classmethod
+    def from_wxyz(cls, q):
+        return cls(np.roll(q, shift=-1, axis=-1))
+
+    @classmethod
+    def from_xyzw(cls, q):
+        return cls(q)
+
+    @classmethod
+    def from_rpy(cls, roll, pitch, yaw, axes='rxyz'):
+        """ Construct from [N] Euler angles """
+        q = tf.batch_quaternion_from_euler(roll, pitch, yaw, axes=axes)
+        return cls.from_data(q.reshape(-1,4), copy=False)
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """ From [N x 3 x 3] rotation or [N x 4 x 4] transformation matrices """
+        return cls.from_data(batch_quaternion_from_matrix(matrix).reshape(-1,4), copy=False)
+
+    @classmethod
+    def from_list(cls, quats):
+        return cls.from_data(np.vstack([q.q for q in quats]).reshape(-1,4), copy=False)
+
+    # Properties
+
+    @classmethod
+    def identity(cls, N=1):
+        return cls(np.tile([0.,0.,0.,1.], (N,1)))
+
+    @property
+    def matrix(self):
+        """ Returns [N x 4 x 4] transformation matrices """
+        return self.to_matrix()
+
+    @property
+    def R(self):
+        """ Returns [N x 3 x 3] rotation matrices """
+        return batch_quaternion_matrix(self.q)
+
+    @property
+    def x(self):
+        return self.q[:,0]
+
+    @property
+    def y(self):
+        return self.q[:,1]
+
+    @property
+    def z(self):
+        return self.q[:,2]
+
+    @property
+    def w(self):
+        return self.q[:,3]
+
+    @property
+    def wxyz(self):
+        return self.to_wxyz()
+
+    @property
+    def xyzw(self):
+        return self.to_xyzw()
+
+    @property
+    def rpy(self):
+        return self.to_rpy()
+
 
 ###############################################################################
 if __name__ == "__main__":
@@ -6,7 +6,10 @@ General-purpose class for rigid-body transformations.
 
 import numpy as np
 import transformations as tf
-from pybot.geometry.quaternion import Quaternion
+from pybot.geometry.quaternion import Quaternion, QuaternionArray, \
+    batch_quaternion_multiply, batch_quaternion_conjugate, batch_quaternion_matrix
+from pybot.geometry.lie_groups import so3_exp_quaternion, so3_log_quaternion, \
+    so3_left_jacobian, so3_left_jacobian_inverse, se3_exp, se3_log, sim3_exp, sim3_log
 
 ###############################################################################
 def normalize_vec(v): 
@@ -100,10 +103,50 @@ class RigidTransform(object):
     tvec: Translation (xyz)
     
     """
+    __slots__ = ('quat_', 'tvec_', 'T_', 'TR_')
+
     def __init__(self, xyzw=[0.,0.,0.,1.], tvec=[0.,0.,0.]):
         """ Initialize a RigidTransform with Quaternion and 3D Position """
         self.quat = Quaternion(xyzw)
-        self.tvec = np.array(tvec)
+        self.tvec = tvec
+
+    def __getstate__(self): 
+        """ 
+        Pickle support for __slots__ (protocols 0/1), 
+        cached matrices are not serialized
+        """
+        state = dict(getattr(self, '__dict__', {}))
+        for klass in type(self).__mro__: 
+            for k in getattr(klass, '__slots__', ()): 
+                if k not in ('T_', 'TR_') and hasattr(self, k): 
+                    state[k] = getattr(self, k)
+        return state
+
+    def __setstate__(self, state): 
+        self.T_, self.TR_ = None, None
+        for k, v in state.iteritems(): 
+            setattr(self, k, v)
+
+    @property
+    def quat(self): 
+        return self.quat_
+
+    @quat.setter
+    def quat(self, quat): 
+        self.quat_, self.T_ = quat, None
+
+    @property
+    def tvec(self): 
+        """ Read-only (x,y,z) buffer, assign to tvec to modify """
+        return self.tvec_
+
+    @tvec.setter
+    def tvec(self, tvec): 
+        if not (isinstance(tvec, np.ndarray) and 
+                tvec.dtype == np.float64 and not tvec.flags.writeable): 
+            tvec = np.array(tvec, dtype=np.float64)
+            tvec.flags.writeable = False
+        self.tvec_, self.T_ = tvec, None
 
     def __repr__(self):
         return 'rpy (rxyz): %s tvec: %s' % \
@@ -123,8 +166,7 @@ class RigidTransform(object):
         if isinstance(other, RigidTransform):
             return self.oplus(other)
         else:          
-            X = np.hstack([other, np.ones((len(other),1))]).T
-            return (np.dot(self.matrix, X).T)[:,:3]
+            return self.apply(other)
 
     def __rmul__(self, other): 
         raise NotImplementedError('Right multiply not implemented yet!')                    
@@ -153,9 +195,53 @@ class RigidTransform(object):
         """
         return self * p_tr
 
+    def apply(self, points, out=None, dtype=None): 
+        """
+        Transform a point set (X_2 = p_21 * X_1) 
+
+        points: [... x 3] array, e.g. [N x 3] or organized [H x W x 3]
+        out:    optional C-contiguous buffer of the same shape to write 
+                into (may be points itself, the input is then copied 
+                once before being overwritten)
+        dtype:  output precision, defaults to the input precision 
+                (float32 stays float32, everything else is float64)
+        """
+        X = np.asarray(points)
+        if X.shape[-1] != 3: 
+            raise ValueError('Expected [... x 3] points, got {}'.format(X.shape))
+
+        if dtype is None: 
+            dtype = X.dtype if X.dtype in (np.float32, np.float64) else np.float64
+        dtype = np.dtype(dtype)
+
+        if out is None: 
+            out = np.empty(X.shape, dtype=dtype)
+        elif out.shape != X.shape or out.dtype != dtype or not out.flags.c_contiguous: 
+            raise ValueError('Output buffer must be C-contiguous {} with shape {}, got {} {}'
+                             .format(dtype, X.shape, out.dtype, out.shape))
+
+        # Flatten to [N x 3] views, only the input is copied 
+        # (if non-contiguous, of a different precision, or aliased 
+        # by out, since np.dot cannot read from the buffer it writes to)
+        X = np.ascontiguousarray(X.reshape(-1,3), dtype=dtype)
+        Xo = out.reshape(-1,3)
+        if np.may_share_memory(X, Xo): 
+            X = X.copy()
+        R = self._cached_R(dtype)
+        np.dot(X, R.T, out=Xo)
+        Xo += self.tvec.astype(dtype, copy=False)
+        return out
+
+    def _cached_R(self, dtype=np.float64): 
+        """ 
+        3x3 rotation in the requested precision 
+        (float64 is the cached Quaternion.R itself)
+        """
+        return self.quat.R.astype(dtype, copy=False)
+
     def rotate_vec(self, v): 
         if v.ndim == 2: 
-            return np.vstack(map(lambda v_: self.quat.rotate(v_), v))
+            return QuaternionArray(self.quat).rotate(v)
         else: 
             assert(v.ndim == 1 or (v.ndim == 2 and v.shape[0] == 1))
             return self.quat.rotate(v)
@@ -163,15 +249,34 @@ class RigidTransform(object):
 
     def interpolate(self, other, w): 
         """
-        LERP interpolation on rotation, and linear interpolation on position 
+        SLERP interpolation on rotation, and linear interpolation on position 
+        Note: w weights the rotation towards self (Quaternion.interpolate
+        convention) and the position towards other, unlike 
+        RigidTransformArray.interpolate and interpolate_geodesic 
+        (w=0: self, w=1: other for both rotation and position)
+
         Other approaches: 
         https://www.cvl.isy.liu.se/education/graduate/geometry-for-computer-vision-2014/geometry2014/lecture7.pdf
         """
         assert(w >= 0 and w <= 1.0)
-        return self.from_Rt(self.rotation.interpolate(other.rotation, w).R, self.t + w * (other.t - self.t))
+        return RigidTransform(self.quat.interpolate(other.quat, w), self.t + w * (other.t - self.t))
+
+    def interpolate_geodesic(self, other, w): 
+        """
+        Interpolate along the SE(3) geodesic (screw motion) 
+        self * exp(w * log(self^-1 * other)) (w=0: self, w=1: other)
+        """
+        assert(w >= 0 and w <= 1.0)
+        return self.oplus(RigidTransform.exp(w * self.inverse().oplus(other).log()))
+
+    def log(self): 
+        """ SE(3) logarithm, returns the twist (v, w) [6] """
+        return se3_log(self.matrix)
 
-        # return self.from_Rt(self.R * expm3(w * logm(self.R.T * other.R)), self.t + w * (other.t - self.t))
-        # return self.from_matrix(self.matrix * expm(w * logm((self.inverse() * other).matrix)))
+    @classmethod
+    def exp(cls, xi): 
+        """ SE(3) exponential of the twist xi = (v, w) [6] """
+        return cls.from_matrix(se3_exp(xi))
 
     # def interpolate(self, other_transform, this_weight):
     #     assert this_weight >= 0 and this_weight <= 1
@@ -190,13 +295,11 @@ class RigidTransform(object):
 
     def to_matrix(self):
         """ Returns a 4x4 homogenous matrix of the form [R t; 0 1] """
-        result = self.quat.to_matrix()
-        result[:3, 3] = self.tvec
-        return result
+        return self.matrix.copy()
 
     def to_Rt(self):
         """ Returns rotation R, and translational vector t """
-        T = self.to_matrix()
+        T = self.matrix
         return T[:3,:3].copy(), T[:3,3].copy()
 
     def to_rpyxyz(self, axes='rxyz'):
@@ -265,6 +368,285 @@ class RigidTransform(object):
 
     @property
     def matrix(self): 
+        """ 
+        4x4 homogenous matrix (read-only), rebuilt only when 
+        quat or tvec change 
+        """
+        R = self.quat.R
+        if self.T_ is None or self.TR_ is not R: 
+            T = np.eye(4)
+            T[:3,:3] = R
+            T[:3,3] = self.tvec
+            T.flags.writeable = False
+            self.T_, self.TR_ = T, R
+        return self.T_
+
+###############################################################################
+class RigidTransformArray(object):
+    """
+    Batched SE(3) rigid transforms backed by a single contiguous
+    [N x 7] buffer (qx, qy, qz, qw, tx, ty, tz). All operations
+    (compose, inverse, relative poses, point transformation) are
+    vectorized over the N poses, and support broadcasting against
+    a single RigidTransform (or a RigidTransformArray of length 1).
+
+    Indexing with an integer returns a RigidTransform, while slicing
+    returns a RigidTransformArray (a view for basic slices).
+
+    """
+    def __init__(self, xyzw=np.float64([[0.,0.,0.,1.]]), tvec=np.float64([[0.,0.,0.]])):
+        """ Initialize with [N x 4] quaternions and [N x 3] positions """
+        xyzw = QuaternionArray(xyzw).q
+        tvec = np.asarray(tvec, dtype=np.float64).reshape(-1,3)
+        if len(xyzw) != len(tvec):
+            raise ValueError('RigidTransformArray xyzw and tvec lengths mismatch {:} != {:}'
+                             .format(len(xyzw), len(tvec)))
+        self.data_ = np.empty((len(xyzw),7), dtype=np.float64)
+        self.data_[:,:4] = xyzw
+        self.data_[:,4:] = tvec
+
+    @classmethod
+    def from_data(cls, data, copy=True):
+        """ Wrap an existing [N x 7] (xyzw, tvec) buffer """
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim != 2 or data.shape[1] != 7:
+            raise ValueError('RigidTransformArray expects [N x 7] data, provided {:}'.format(data.shape))
+        a = cls.__new__(cls)
+        a.data_ = data.copy() if copy else data
+        return a
+
+    def __repr__(self):
+        return 'RigidTransformArray (N={:})\n\txyzw: {:}\n\ttvec: {:}'.format(
+            len(self), np.array_str(self.xyzw, precision=2, suppress_small=True),
+            np.array_str(self.tvec, precision=2, suppress_small=True))
+
+    def __len__(self):
+        return len(self.data_)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return RigidTransform(self.data_[i,:4], self.data_[i,4:])
+        return RigidTransformArray.from_data(self.data_[i], copy=False)
+
+    def __iter__(self):
+        for j in xrange(len(self)):
+            yield self[j]
+
+    def __mul__(self, other):
+        """
+        Left-multiply RigidTransformArray with another
+
+        Two variants:
+           RigidTransform/RigidTransformArray: Identical to oplus operation
+           ndarray: transform [M x 3] point set with every pose [N x M x 3]
+
+        """
+        if isinstance(other, (RigidTransform, RigidTransformArray)):
+            return self.oplus(other)
+        else:
+            X = np.asarray(other)
+            return QuaternionArray.from_data(self.xyzw[:,np.newaxis,:], copy=False).rotate(X[np.newaxis,:,:]) + \
+                self.tvec[:,np.newaxis,:]
+
+    # Basic operations
+
+    def inverse(self):
+        """ Returns the element-wise inverse of all poses """
+        qinv = self.quat.inverse()
+        return RigidTransformArray.from_data(
+            np.hstack([qinv.q, qinv.rotate(-self.tvec)]), copy=False)
+
+    def oplus(self, other):
+        """ Element-wise composition (self * other) with broadcasting """
+        if isinstance(other, RigidTransform):
+            other = RigidTransformArray.from_list([other])
+        if not isinstance(other, RigidTransformArray):
+            raise TypeError("Type inconsistent", type(other), other.__class__)
+        t = self.quat.rotate(other.tvec) + self.tvec
+        r = self.quat * other.quat
+        return RigidTransformArray.from_data(np.hstack([r.q, t]), copy=False)
+
+    def ominus(self, other):
+        """ Pose of self wrt other: other.inverse() * self """
+        if isinstance(other, RigidTransform):
+            other = RigidTransformArray.from_list([other])
+        return other.inverse().oplus(self)
+
+    def relative(self, step=1):
+        """
+        Relative poses between every pose and the pose
+        step indices ahead: p_{k,k+step} = p_k.inverse() * p_{k+step}
+        """
+        return self[step:].ominus(self[:-step])
+
+    def accumulate(self):
+        """
+        Compose the sequence of (relative) poses cumulatively
+        [p_0, p_0 * p_1, p_0 * p_1 * p_2, ...], computed as a
+        parallel prefix scan (log N vectorized compositions)
+        """
+        out = self.copy()
+        offset = 1
+        while offset < len(out):
+            out.data_[offset:] = out[:-offset].oplus(out[offset:]).data_
+            offset *= 2
+        return out
+
+    def rotate_vec(self, v):
+        """ Rotate [N x 3] vectors element-wise (or a single [3] vector) """
+        return self.quat.rotate(v)
+
+    def interpolate(self, other, w):
+        """
+        Element-wise SLERP interpolation on rotation, and linear
+        interpolation on position (w=0: self, w=1: other).
+        w may be a scalar or an [N] array of weights
+
+        Note: RigidTransform.interpolate instead weights the 
+        rotation towards self (w=0: other rotation)
+        """
+        if isinstance(other, RigidTransform):
+            other = RigidTransformArray.from_list([other])
+        w = np.asarray(w, dtype=np.float64)
+        assert(np.all(w >= 0) and np.all(w <= 1.0))
+        q = self.quat.slerp(other.quat, w)
+        t = self.tvec + w[...,np.newaxis] * (other.tvec - self.tvec)
+        return RigidTransformArray.from_data(np.hstack([q.q, t]), copy=False)
+
+    def interpolate_geodesic(self, other, w):
+        """
+        Element-wise interpolation along the SE(3) geodesics 
+        (w=0: self, w=1: other), see RigidTransform.interpolate_geodesic
+        """
+        if isinstance(other, RigidTransform):
+            other = RigidTransformArray.from_list([other])
+        w = np.asarray(w, dtype=np.float64)
+        assert(np.all(w >= 0) and np.all(w <= 1.0))
+        xi = self.inverse().oplus(other).log()
+        return self.oplus(RigidTransformArray.exp(w[...,np.newaxis] * xi))
+
+    def log(self):
+        """ SE(3) logarithms, returns [N x 6] twists (v, w) """
+        w = so3_log_quaternion(self.xyzw)
+        v = np.einsum('nij,nj->ni', so3_left_jacobian_inverse(w), self.tvec)
+        return np.hstack([v, w])
+
+    @classmethod
+    def exp(cls, xi):
+        """ SE(3) exponentials of [N x 6] twists xi = (v, w) """
+        xi = np.asarray(xi, dtype=np.float64).reshape(-1,6)
+        t = np.einsum('nij,nj->ni', so3_left_jacobian(xi[:,3:]), xi[:,:3])
+        return cls.from_data(np.hstack([so3_exp_quaternion(xi[:,3:]), t]), copy=False)
+
+    def perturb(self, xi, left=False):
+        """
+        Perturb the poses with [N x 6] (or [6]) twists, 
+        right: T * exp(xi), left: exp(xi) * T
+        """
+        dT = RigidTransformArray.exp(xi)
+        return dT.oplus(self) if left else self.oplus(dT)
+
+    def copy(self):
+        return RigidTransformArray.from_data(self.data_, copy=True)
+
+    # (To) Conversions
+
+    def to_matrix(self):
+        """ Returns [N x 4 x 4] homogenous matrices of the form [R t; 0 1] """
+        T = np.zeros((len(self),4,4), dtype=np.float64)
+        T[:,:3,:3] = self.quat.R
+        T[:,:3,3] = self.tvec
+        T[:,3,3] = 1
+        return T
+
+    def to_Rt(self):
+        """ Returns [N x 3 x 3] rotations R, and [N x 3] translations t """
+        return self.quat.R, self.tvec.copy()
+
+    def to_rpyxyz(self, axes='rxyz'):
+        """ Returns [N x 6] (roll, pitch, yaw, x, y, z) """
+        return np.hstack([self.quat.to_rpy(axes=axes), self.tvec])
+
+    def to_list(self):
+        return list(self)
+
+    # (From) Conversions
+
+    @classmethod
+    def from_Rt(cls, R, t):
+        return cls(QuaternionArray.from_matrix(R), t)
+
+    @classmethod
+    def from_matrix(cls, T):
+        """ From [N x 4 x 4] or [N x 3 x 4] homogenous matrices """
+        T = np.asarray(T, dtype=np.float64)
+        return cls(QuaternionArray.from_matrix(T[:,:3,:3]), T[:,:3,3])
+
+    @classmethod
+    def from_rpyxyz(cls, rpyxyz, axes='rxyz'):
+        """ From [N x 6] (roll, pitch, yaw, x, y, z) """
+        rpyxyz = np.asarray(rpyxyz, dtype=np.float64).reshape(-1,6)
+        q = QuaternionArray.from_rpy(rpyxyz[:,0], rpyxyz[:,1], rpyxyz[:,2], axes=axes)
+        return cls(q, rpyxyz[:,3:])
+
+    @classmethod
+    def from_list(cls, poses):
+        """ From a list of RigidTransforms """
+        if not len(poses):
+            return cls.from_data(np.empty((0,7)), copy=False)
+        return cls.from_data(np.vstack([np.hstack([p.quat.q, p.tvec]) for p in poses]), copy=False)
+
+    @classmethod
+    def identity(cls, N=1):
+        data = np.zeros((N,7), dtype=np.float64)
+        data[:,3] = 1
+        return cls.from_data(data, copy=False)
+
+    # Properties
+
+    @property
+    def data(self):
+        return self.data_
+
+    @property
+    def quat(self):
+        """ QuaternionArray view into the rotation buffer """
+        return QuaternionArray.from_data(self.data_[:,:4], copy=False)
+
+    @property
+    def rotation(self):
+        return self.quat
+
+    @property
+    def orientation(self):
+        return self.quat
+
+    @property
+    def xyzw(self):
+        return self.data_[:,:4]
+
+    @property
+    def wxyz(self):
+        return np.roll(self.xyzw, shift=1, axis=1)
+
+    @property
+    def tvec(self):
+        return self.data_[:,4:]
+
+    @property
+    def t(self):
+        return self.tvec
+
+    @property
+    def translation(self):
+        return self.tvec
+
+    @property
+    def R(self):
+        return self.quat.R
+
+    @property
+    def matrix(self):
         return self.to_matrix()
 
 ###############################################################################
@@ -272,12 +654,16 @@ class DualQuaternion(object):
     """
     SE(3) rigid transform class that allows compounding of 6-DOF poses
     and provides common transformations that are commonly seen in geometric problems.
+
+    Unit dual quaternion: real + eps * dual 
+       real: Rotation (xyzw)
+       dual: 0.5 * (tvec, 0) * real (xyzw)
         
     """
     def __init__(self, xyzw=[0.,0.,0.,1.], tvec=[0.,0.,0.]):
-        """ Initialize a RigidTransform with Quaternion and 3D Position """
-        self.real = Quaternion(xyzw)
-        self.dual = ( Quaternion(xyzw=[tvec[0], tvec[1], tvec[2], 0.]) * self.real ) * 0.5
+        """ Initialize a DualQuaternion with Quaternion and 3D Position """
+        self.real = np.array(Quaternion(xyzw).q)
+        self.dual = 0.5 * tf.quaternion_multiply([tvec[0], tvec[1], tvec[2], 0.], self.real)
 
     def __repr__(self):
         return 'real: %s dual: %s' % \
@@ -289,21 +675,20 @@ class DualQuaternion(object):
 
     def __mul__(self, other):
         """ 
-        Left-multiply RigidTransform with another rigid transform
+        Left-multiply DualQuaternion with another dual quaternion
         
         Two variants: 
-           RigidTransform: Identical to oplus operation
-           ndarray: transform [N x 3] point set (X_2 = p_21 * X_1)
+           DualQuaternion: Identical to oplus operation (self * other)
+           float: scale real and dual parts
 
         """
         if isinstance(other, DualQuaternion):
-            return DualQuaternion.from_dq(other.real * self.real, 
-                                          other.dual * self.real + other.real * self.dual)
+            return DualQuaternion.from_dq(
+                tf.quaternion_multiply(self.real, other.real), 
+                tf.quaternion_multiply(self.real, other.dual) + 
+                tf.quaternion_multiply(self.dual, other.real))
         elif isinstance(other, float):
             return DualQuaternion.from_dq(self.real * other, self.dual * other)
-        # elif isinstance(other, nd.array): 
-        #     X = np.hstack([other, np.ones((len(other),1))]).T
-        #     return (np.dot(self.matrix, X).T)[:,:3]
         else: 
             raise TypeError('__mul__ typeerror {:}'.format(type(other)))
             
@@ -313,20 +698,39 @@ class DualQuaternion(object):
     # Basic operations
 
     def normalize(self): 
-        """ Check validity of unit-quaternion norm """
-        self.real.normalize()
-        self.dual.noramlize()
+        """ Normalize to a unit dual quaternion (|real| = 1, real . dual = 0) """
+        n = np.linalg.norm(self.real)
+        r, d = self.real / n, self.dual / n
+        self.real, self.dual = r, d - r.dot(d) * r
 
     def dot(self, other): 
         return self.real.dot(other.real)
 
     def inverse(self):
-        """ Returns a new RigidTransform that corresponds to the inverse of this one """
-        qinv = self.dual.inverse()
-        return DualQuaternion.from_dq(qinv.q, qinv.rotate(- self.tvec))
+        """ Returns a new DualQuaternion that corresponds to the inverse of this one """
+        return self.conjugate()
 
     def conjugate(self): 
-        return DualQuaternion.from_dq(self.real.conjugate(), self.dual.conjugate())
+        """ Quaternion conjugate (inverse for unit dual quaternions) """
+        return DualQuaternion.from_dq(tf.quaternion_conjugate(self.real), 
+                                      tf.quaternion_conjugate(self.dual))
+
+    def log(self): 
+        """ SE(3) logarithm, returns the twist (v, w) [6] """
+        return se3_log(self.to_matrix())
+
+    @classmethod
+    def exp(cls, xi): 
+        """ SE(3) exponential of the twist xi = (v, w) [6] """
+        return cls.from_matrix(se3_exp(xi))
+
+    def interpolate(self, other, w): 
+        """ 
+        Screw linear interpolation (ScLERP), i.e. along the 
+        SE(3) geodesic (w=0: self, w=1: other)
+        """
+        assert(w >= 0 and w <= 1.0)
+        return self * DualQuaternion.exp(w * (self.inverse() * other).log())
 
     # To conversions
 
@@ -347,18 +751,17 @@ class DualQuaternion(object):
     def to_xyzw(self):
         return self.rotation.to_xyzw()
 
+    def to_rigid_transform(self): 
+        return RigidTransform(self.real, self.translation)
+
     # From conversions
 
     @classmethod
     def from_dq(cls, r, d):
-        if not isinstance(r, DualQuaternion): 
-            raise TypeError('r is not DualQuaternion')
-        if not not isinstance(d, DualQuaternion): 
-            raise TypeError('d is not DualQuaternion')
-
+        """ From real, and dual parts (xyzw) """
         a = cls()
-        a.real = r
-        a.dual = d
+        a.real = np.asarray(r, dtype=np.float64)
+        a.dual = np.asarray(d, dtype=np.float64)
         return a
 
     @classmethod
@@ -372,28 +775,282 @@ class DualQuaternion(object):
     def from_matrix(cls, T):
         return cls(Quaternion.from_matrix(T), T[:3,3])
 
+    @classmethod
+    def from_rigid_transform(cls, p): 
+        return cls(p.quat, p.tvec)
+
     # Properties
 
     @property
     def rotation(self): 
-        return self.real
+        return Quaternion(self.real)
 
     @property
     def translation(self): 
-        t = self.dual.q * self.real.conjugate()
-        return np.array([t.x, t.y, t.z]) * 2.0
+        t = tf.quaternion_multiply(self.dual, tf.quaternion_conjugate(self.real))
+        return t[:3] * 2.0
 
     @classmethod
     def identity(cls):
         return cls()
 
     
+###############################################################################
+class DualQuaternionArray(object):
+    """
+    Batched unit dual quaternions backed by a single contiguous
+    [N x 8] buffer (real xyzw, dual xyzw), see DualQuaternion. 
+
+    Supports weighted dual-quaternion linear blending (DLB), 
+    iterative (bi-invariant) averaging, and conversions to/from 
+    [N x 4 x 4] matrix stacks, all vectorized over the N elements.
+
+    Indexing with an integer returns a DualQuaternion, while slicing
+    returns a DualQuaternionArray (a view for basic slices).
+
+    Ref: 
+       L. Kavan et al., Geometric Skinning with Approximate 
+       Dual Quaternion Blending, 2008
+    """
+    def __init__(self, xyzw=np.float64([[0.,0.,0.,1.]]), tvec=np.float64([[0.,0.,0.]])):
+        """ Initialize with [N x 4] quaternions and [N x 3] positions """
+        real = QuaternionArray(xyzw).q
+        tvec = np.asarray(tvec, dtype=np.float64).reshape(-1,3)
+        if len(real) != len(tvec):
+            raise ValueError('DualQuaternionArray xyzw and tvec lengths mismatch {:} != {:}'
+                             .format(len(real), len(tvec)))
+        t = np.hstack([tvec, np.zeros((len(tvec),1))])
+        self.data_ = np.hstack([real, 0.5 * batch_quaternion_multiply(t, real)])
+
+    @classmethod
+    def from_data(cls, data, copy=True):
+        """ Wrap an existing [N x 8] (real, dual) buffer """
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim != 2 or data.shape[1] != 8:
+            raise ValueError('DualQuaternionArray expects [N x 8] data, provided {:}'.format(data.shape))
+        a = cls.__new__(cls)
+        a.data_ = data.copy() if copy else data
+        return a
+
+    def __repr__(self):
+        return 'DualQuaternionArray (N={:})\n\treal: {:}\n\tdual: {:}'.format(
+            len(self), np.array_str(self.real, precision=2, suppress_small=True),
+            np.array_str(self.dual, precision=2, suppress_small=True))
+
+    def __len__(self):
+        return len(self.data_)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return DualQuaternion.from_dq(self.data_[i,:4].copy(), self.data_[i,4:].copy())
+        return DualQuaternionArray.from_data(self.data_[i], copy=False)
+
+    def __iter__(self):
+        for j in xrange(len(self)):
+            yield self[j]
+
+    def __add__(self, other):
+        return DualQuaternionArray.from_data(self.data_ + other.data_, copy=False)
+
+    def __mul__(self, other):
+        """
+        Left-multiply DualQuaternionArray with another
+
+        Two variants:
+           DualQuaternion/DualQuaternionArray: element-wise 
+              composition (self * other) with broadcasting
+           float/ndarray: scale real and dual parts (scalar or [N] weights)
+
+        """
+        if isinstance(other, (DualQuaternion, DualQuaternionArray)):
+            r0, d0 = self.real, self.dual
+            r1, d1 = np.atleast_2d(other.real), np.atleast_2d(other.dual)
+            return DualQuaternionArray.from_data(np.hstack([
+                batch_quaternion_multiply(r0, r1),
+                batch_quaternion_multiply(r0, d1) + batch_quaternion_multiply(d0, r1)]), copy=False)
+        elif isinstance(other, (float, np.ndarray)):
+            w = np.asarray(other, dtype=np.float64).reshape(-1,1)
+            return DualQuaternionArray.from_data(self.data_ * w, copy=False)
+        else:
+            raise TypeError('__mul__ typeerror {:}'.format(type(other)))
+
+    # Basic operations
+
+    def normalize(self):
+        """ Normalize (in-place) to unit dual quaternions (|real| = 1, real . dual = 0) """
+        self.data_ /= np.linalg.norm(self.real, axis=1)[:,np.newaxis]
+        r, d = self.real, self.dual
+        d -= np.sum(r * d, axis=1)[:,np.newaxis] * r
+
+    def dot(self, other):
+        return np.sum(self.real * np.atleast_2d(other.real), axis=-1)
+
+    def inverse(self):
+        """ Returns the element-wise inverse (conjugate) of all unit dual quaternions """
+        return self.conjugate()
+
+    def conjugate(self):
+        """ Quaternion conjugate of real and dual parts """
+        data = self.data_.copy()
+        data[:,:3] *= -1
+        data[:,4:7] *= -1
+        return DualQuaternionArray.from_data(data, copy=False)
+
+    def copy(self):
+        return DualQuaternionArray.from_data(self.data_, copy=True)
+
+    def blend(self, weights=None, pivot=None):
+        """
+        Dual-quaternion linear blending (DLB)
+
+        Weighted sum of the dual quaternions, followed by normalization.
+        Each element is sign-aligned with the pivot (default: the element 
+        with the largest weight) so that antipodal representations of 
+        the same transform do not cancel out. 
+
+        weights: [N] weights for a single blend (default: uniform), 
+           or [M x N] weights for M blends of the same N elements
+        
+        Returns a DualQuaternion ([N] weights), or a 
+        DualQuaternionArray of length M ([M x N] weights)
+        """
+        N = len(self)
+        if not N:
+            raise ValueError('DualQuaternionArray.blend requires at least one element')
+        W = np.ones(N) / N if weights is None else np.asarray(weights, dtype=np.float64)
+        single = W.ndim == 1
+        W = np.atleast_2d(W)
+        if W.shape[1] != N:
+            raise ValueError('DualQuaternionArray.blend weights mismatch {:} != {:}'
+                             .format(W.shape[1], N))
+
+        # Sign-align every element with the pivot of each blend: [M x N]
+        pivots = np.argmax(W, axis=1) if pivot is None else np.broadcast_to(pivot, len(W))
+        sign = np.where(np.dot(self.real[pivots], self.real.T) < 0, -1., 1.)
+        out = DualQuaternionArray.from_data(np.dot(W * sign, self.data_), copy=False)
+        out.normalize()
+        return out[0] if single else out
+
+    def average(self, weights=None, max_iterations=20, tol=1e-10):
+        """
+        Iterative (bi-invariant) weighted average of N rigid transforms
+
+        Initialized with DLB, and refined by averaging the SE(3) 
+        logarithms in the tangent space of the current estimate
+        (dual-quaternion iterative blending), until the update 
+        is below tol or max_iterations are reached.
+
+        Returns a DualQuaternion
+        """
+        w = np.ones(len(self)) / len(self) if weights is None \
+            else np.asarray(weights, dtype=np.float64).ravel()
+        w = w / np.sum(w)
+        b = self.blend(w)
+        for _ in xrange(max_iterations):
+            binv = DualQuaternionArray.from_list([b.inverse()])
+            xi = (binv * self).to_rigid_transform_array().log()
+            dxi = np.dot(w, xi)
+            b = b * DualQuaternion.exp(dxi)
+            b.normalize()
+            if np.dot(dxi, dxi) < tol * tol:
+                break
+        return b
+
+    # (To) Conversions
+
+    def to_matrix(self):
+        """ Returns [N x 4 x 4] homogenous matrices of the form [R t; 0 1] """
+        T = np.zeros((len(self),4,4), dtype=np.float64)
+        T[:,:3,:3] = batch_quaternion_matrix(self.real)
+        T[:,:3,3] = self.translation
+        T[:,3,3] = 1
+        return T
+
+    def to_Rt(self):
+        """ Returns [N x 3 x 3] rotations R, and [N x 3] translations t """
+        return batch_quaternion_matrix(self.real), self.translation
+
+    def to_rigid_transform_array(self):
+        return RigidTransformArray(self.real, self.translation)
+
+    def to_list(self):
+        return list(self)
+
+    # (From) Conversions
+
+    @classmethod
+    def from_dq(cls, r, d):
+        """ From [N x 4] real, and [N x 4] dual parts (xyzw) """
+        return cls.from_data(np.hstack([np.asarray(r, dtype=np.float64).reshape(-1,4),
+                                        np.asarray(d, dtype=np.float64).reshape(-1,4)]), copy=False)
+
+    @classmethod
+    def from_Rt(cls, R, t):
+        return cls(QuaternionArray.from_matrix(R), t)
+
+    @classmethod
+    def from_matrix(cls, T):
+        """ From [N x 4 x 4] or [N x 3 x 4] homogenous matrices """
+        T = np.asarray(T, dtype=np.float64)
+        return cls(QuaternionArray.from_matrix(T[:,:3,:3]), T[:,:3,3])
+
+    @classmethod
+    def from_rigid_transform_array(cls, poses):
+        return cls(poses.quat, poses.tvec)
+
+    @classmethod
+    def from_list(cls, dqs):
+        """ From a list of DualQuaternions """
+        if not len(dqs):
+            return cls.from_data(np.empty((0,8)), copy=False)
+        return cls.from_data(np.vstack([np.hstack([dq.real, dq.dual]) for dq in dqs]), copy=False)
+
+    @classmethod
+    def identity(cls, N=1):
+        data = np.zeros((N,8), dtype=np.float64)
+        data[:,3] = 1
+        return cls.from_data(data, copy=False)
+
+    # Properties
+
+    @property
+    def data(self):
+        return self.data_
+
+    @property
+    def real(self):
+        return self.data_[:,:4]
+
+    @property
+    def dual(self):
+        return self.data_[:,4:]
+
+    @property
+    def rotation(self):
+        return QuaternionArray(self.real)
+
+    @property
+    def translation(self):
+        """ [N x 3] translations, t = 2 * dual * conj(real) / |real|^2 """
+        t = batch_quaternion_multiply(self.dual, batch_quaternion_conjugate(self.real))
+        return 2.0 * t[:,:3] / np.sum(self.real * self.real, axis=1)[:,np.newaxis]
+
+    @property
+    def matrix(self):
+        return self.to_matrix()
+
 ###############################################################################
 class Sim3(RigidTransform): 
+    __slots__ = ('scale',)
+
     def __init__(self, xyzw=[0.,0.,0.,1.], tvec=[0.,0.,0.], scale=1.0):    
         RigidTransform.__init__(self, xyzw=xyzw, tvec=tvec)
         self.scale = scale
 
+    def _cached_R(self, dtype=np.float64): 
+        """ Scaled rotation (R / s), consistent with to_matrix """
+        return RigidTransform._cached_R(self, dtype) / np.dtype(dtype).type(self.scale)
+
     @classmethod
     def from_matrix(cls, T):
         sR_t = np.eye(4)
@@ -401,13 +1058,53 @@ class Sim3(RigidTransform):
         return cls(Quaternion.from_matrix(sR_t), T[:3,3], scale=1.0 / T[3,3])
 
     def to_matrix(self):
-        result = self.quat.to_matrix()
+        result = np.eye(4)
+        result[:3, :3] = self.quat.R / self.scale
         result[:3, 3] = self.tvec
         result[3, 3] = 1.0 / self.scale
-        result[:3, :3] /= self.scale
         return result
 
+    @property
+    def matrix(self): 
+        return self.to_matrix()
+
+    def to_similarity(self): 
+        """ 
+        Returns the 4x4 similarity [sR t; 0 1] acting on points as 
+        Sim3 * X (i.e. s = 1 / scale) 
+        """
+        S = np.eye(4)
+        S[:3,:3] = self.quat.R / self.scale
+        S[:3,3] = self.tvec
+        return S
+
+    @classmethod
+    def from_similarity(cls, S): 
+        """ From a 4x4 similarity [sR t; 0 1], see to_similarity """
+        s = np.cbrt(np.linalg.det(S[:3,:3]))
+        T = np.eye(4)
+        T[:3,:3] = S[:3,:3] / s
+        return cls(Quaternion.from_matrix(T), S[:3,3], scale=1.0 / s)
+
+    def log(self): 
+        """ Sim(3) logarithm of to_similarity(), returns (v, w, log(s)) [7] """
+        return sim3_log(self.to_similarity())
+
+    @classmethod
+    def exp(cls, zeta): 
+        """ Sim(3) exponential of zeta = (v, w, log(s)) [7] """
+        return cls.from_similarity(sim3_exp(zeta))
+
+    def interpolate(self, other, w): 
+        """ Interpolate along the Sim(3) geodesic (w=0: self, w=1: other) """
+        assert(w >= 0 and w <= 1.0)
+        S0 = self.to_similarity()
+        dS = np.linalg.solve(S0, other.to_similarity())
+        return Sim3.from_similarity(np.dot(S0, sim3_exp(w * sim3_log(dS))))
+
 class Pose(RigidTransform): 
+    __slots__ = ('id',)
+
     def __init__(self, pid, xyzw=[0.,0.,0.,1.], tvec=[0.,0.,0.]):
         RigidTransform.__init__(self, xyzw=xyzw, tvec=tvec)
         self.id = pid
@@ -1225,6 +1225,260 @@ def quaternion_from_matrix(matrix):
     return q
 
 
+def _axes_tuple(axes):
+    """Return (firstaxis, parity, repetition, frame), and (i, j, k) for axes."""
+    try:
+        firstaxis, parity, repetition, frame = _AXES2TUPLE[axes.lower()]
+    except (AttributeError, KeyError):
+        _ = _TUPLE2AXES[axes]
+        firstaxis, parity, repetition, frame = axes
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+    return (firstaxis, parity, repetition, frame), (i, j, k)
+
+
+def batch_euler_matrix(ai, aj, ak, axes='sxyz'):
+    """Return stacked homogeneous rotation matrices from Euler angles.
+
+    ai, aj, ak : arrays of Euler's roll, pitch and yaw angles
+    axes : One of 24 axis sequences as string or encoded tuple
+
+    Same as euler_matrix, for angles of any (broadcastable) shape [...],
+    returns [... x 4 x 4] matrices.
+
+    >>> angles = (4.0*math.pi) * (numpy.random.random((10, 3)) - 0.5)
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    M0 = [euler_matrix(axes=axes, *a) for a in angles]
+    ...    M1 = batch_euler_matrix(axes=axes, *angles.T)
+    ...    if not numpy.allclose(M0, M1): print axes, "failed"
+    >>> batch_euler_matrix(1, 2, 3, (0, 1, 0, 1)).shape
+    (4, 4)
+
+    """
+    (_, parity, repetition, frame), (i, j, k) = _axes_tuple(axes)
+
+    ai, aj, ak = numpy.broadcast_arrays(
+        *[numpy.array(a, dtype=numpy.float64) for a in (ai, aj, ak)])
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        ai, aj, ak = -ai, -aj, -ak
+
+    si, sj, sk = numpy.sin(ai), numpy.sin(aj), numpy.sin(ak)
+    ci, cj, ck = numpy.cos(ai), numpy.cos(aj), numpy.cos(ak)
+    cc, cs = ci*ck, ci*sk
+    sc, ss = si*ck, si*sk
+
+    M = numpy.zeros(ai.shape + (4, 4), dtype=numpy.float64)
+    M[..., 3, 3] = 1.0
+    if repetition:
+        M[..., i, i] = cj
+        M[..., i, j] = sj*si
+        M[..., i, k] = sj*ci
+        M[..., j, i] = sj*sk
+        M[..., j, j] = -cj*ss+cc
+        M[..., j, k] = -cj*cs-sc
+        M[..., k, i] = -sj*ck
+        M[..., k, j] = cj*sc+cs
+        M[..., k, k] = cj*cc-ss
+    else:
+        M[..., i, i] = cj*ck
+        M[..., i, j] = sj*sc-cs
+        M[..., i, k] = sj*cc+ss
+        M[..., j, i] = cj*sk
+        M[..., j, j] = sj*ss+cc
+        M[..., j, k] = sj*cs-sc
+        M[..., k, i] = -sj
+        M[..., k, j] = cj*si
+        M[..., k, k] = cj*ci
+    return M
+
+
+def batch_euler_from_matrix(matrix, axes='sxyz'):
+    """Return stacked Euler angles from rotation matrices.
+
+    axes : One of 24 axis sequences as string or encoded tuple
+
+    Same as euler_from_matrix, for [... x 3 x 3] or [... x 4 x 4]
+    matrices, returns [... x 3] angles (ai, aj, ak).
+
+    >>> angles = (4.0*math.pi) * (numpy.random.random((10, 3)) - 0.5)
+    >>> angles[0, 1] = math.pi / 2  # gimbal lock
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    R = [euler_matrix(axes=axes, *a) for a in angles]
+    ...    A0 = [euler_from_matrix(R0, axes) for R0 in R]
+    ...    A1 = batch_euler_from_matrix(R, axes)
+    ...    if not numpy.allclose(A0, A1): print axes, "failed"
+
+    """
+    (_, parity, repetition, frame), (i, j, k) = _axes_tuple(axes)
+
+    M = numpy.array(matrix, dtype=numpy.float64, copy=False)[..., :3, :3]
+    if repetition:
+        sy = numpy.sqrt(M[..., i, j]*M[..., i, j] + M[..., i, k]*M[..., i, k])
+        valid = sy > _EPS
+        ax = numpy.where(valid, numpy.arctan2( M[..., i, j],  M[..., i, k]),
+                                numpy.arctan2(-M[..., j, k],  M[..., j, j]))
+        ay = numpy.arctan2( sy,       M[..., i, i])
+        az = numpy.where(valid, numpy.arctan2( M[..., j, i], -M[..., k, i]), 0.0)
+    else:
+        cy = numpy.sqrt(M[..., i, i]*M[..., i, i] + M[..., j, i]*M[..., j, i])
+        valid = cy > _EPS
+        ax = numpy.where(valid, numpy.arctan2( M[..., k, j],  M[..., k, k]),
+                                numpy.arctan2(-M[..., j, k],  M[..., j, j]))
+        ay = numpy.arctan2(-M[..., k, i],  cy)
+        az = numpy.where(valid, numpy.arctan2( M[..., j, i],  M[..., i, i]), 0.0)
+
+    if parity:
+        ax, ay, az = -ax, -ay, -az
+    if frame:
+        ax, az = az, ax
+    return numpy.stack([ax, ay, az], axis=-1)
+
+
+def batch_euler_from_quaternion(quaternion, axes='sxyz'):
+    """Return stacked Euler angles from [... x 4] quaternions.
+
+    >>> q = [random_quaternion() for _ in range(10)]
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    A0 = [euler_from_quaternion(q0, axes) for q0 in q]
+    ...    A1 = batch_euler_from_quaternion(q, axes)
+    ...    if not numpy.allclose(A0, A1): print axes, "failed"
+
+    """
+    return batch_euler_from_matrix(batch_quaternion_matrix(quaternion), axes)
+
+
+def batch_quaternion_from_euler(ai, aj, ak, axes='sxyz'):
+    """Return stacked quaternions from Euler angles and axis sequence.
+
+    ai, aj, ak : arrays of Euler's roll, pitch and yaw angles
+    axes : One of 24 axis sequences as string or encoded tuple
+
+    Same as quaternion_from_euler, for angles of any (broadcastable)
+    shape [...], returns [... x 4] quaternions.
+
+    >>> angles = (4.0*math.pi) * (numpy.random.random((10, 3)) - 0.5)
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    q0 = [quaternion_from_euler(axes=axes, *a) for a in angles]
+    ...    q1 = batch_quaternion_from_euler(axes=axes, *angles.T)
+    ...    if not numpy.allclose(q0, q1): print axes, "failed"
+
+    """
+    (_, parity, repetition, frame), (i, j, k) = _axes_tuple(axes)
+
+    ai, aj, ak = numpy.broadcast_arrays(
+        *[numpy.array(a, dtype=numpy.float64) for a in (ai, aj, ak)])
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        aj = -aj
+
+    ai, aj, ak = ai / 2.0, aj / 2.0, ak / 2.0
+    ci, si = numpy.cos(ai), numpy.sin(ai)
+    cj, sj = numpy.cos(aj), numpy.sin(aj)
+    ck, sk = numpy.cos(ak), numpy.sin(ak)
+    cc, cs = ci*ck, ci*sk
+    sc, ss = si*ck, si*sk
+
+    quaternion = numpy.empty(ai.shape + (4, ), dtype=numpy.float64)
+    if repetition:
+        quaternion[..., i] = cj*(cs + sc)
+        quaternion[..., j] = sj*(cc + ss)
+        quaternion[..., k] = sj*(cs - sc)
+        quaternion[..., 3] = cj*(cc - ss)
+    else:
+        quaternion[..., i] = cj*sc - sj*cs
+        quaternion[..., j] = cj*ss + sj*cc
+        quaternion[..., k] = cj*cs - sj*sc
+        quaternion[..., 3] = cj*cc + sj*ss
+    if parity:
+        quaternion[..., j] *= -1
+
+    return quaternion
+
+
+def batch_quaternion_matrix(quaternion):
+    """Return stacked homogeneous rotation matrices from [... x 4] quaternions.
+
+    >>> q = [random_quaternion() for _ in range(10)] + [[0, 0, 0, 0]]
+    >>> M0 = [quaternion_matrix(q0) for q0 in q]
+    >>> numpy.allclose(M0, batch_quaternion_matrix(q))
+    True
+
+    """
+    q = numpy.array(quaternion, dtype=numpy.float64)[..., :4]
+    nq = numpy.sum(q*q, axis=-1)
+    valid = nq >= _EPS
+    q = q * numpy.sqrt(2.0 / numpy.where(valid, nq, 1.0))[..., numpy.newaxis]
+    q[~valid] = 0.0
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+
+    M = numpy.zeros(q.shape[:-1] + (4, 4), dtype=numpy.float64)
+    M[..., 0, 0] = 1.0-y*y-z*z
+    M[..., 0, 1] = x*y-z*w
+    M[..., 0, 2] = x*z+y*w
+    M[..., 1, 0] = x*y+z*w
+    M[..., 1, 1] = 1.0-x*x-z*z
+    M[..., 1, 2] = y*z-x*w
+    M[..., 2, 0] = x*z-y*w
+    M[..., 2, 1] = y*z+x*w
+    M[..., 2, 2] = 1.0-x*x-y*y
+    M[..., 3, 3] = 1.0
+    return M
+
+
+def batch_quaternion_from_matrix(matrix):
+    """Return stacked quaternions from rotation matrices.
+
+    Same as quaternion_from_matrix (including the sign convention),
+    for [... x 4 x 4] or [... x 3 x 3] matrices, returns [... x 4].
+
+    >>> R = [random_rotation_matrix() for _ in range(10)]
+    >>> R += [rotation_matrix(math.pi, d) for d in numpy.eye(3)]
+    >>> q0 = [quaternion_from_matrix(R0) for R0 in R]
+    >>> numpy.allclose(q0, batch_quaternion_from_matrix(R))
+    True
+    >>> numpy.allclose(q0, batch_quaternion_from_matrix(numpy.array(R)[:, :3, :3]))
+    True
+
+    """
+    M = numpy.array(matrix, dtype=numpy.float64, copy=False)
+    shape = M.shape[:-2]
+    M = M.reshape((-1, ) + M.shape[-2:])
+    m33 = M[:, 3, 3] if M.shape[-1] == 4 else numpy.ones(len(M))
+    diag = numpy.stack([M[:, 0, 0], M[:, 1, 1], M[:, 2, 2]], axis=-1)
+    t = numpy.sum(diag, axis=-1) + m33
+
+    # Largest diagonal element (i) for the non-w branches
+    i = numpy.where(diag[:, 1] > diag[:, 0], 1, 0)
+    i = numpy.where(diag[:, 2] > diag[numpy.arange(len(M)), i], 2, i)
+
+    q = numpy.empty((len(M), 4), dtype=numpy.float64)
+    wmask = t > m33
+    Mw = M[wmask]
+    q[wmask, 3] = t[wmask]
+    q[wmask, 2] = Mw[:, 1, 0] - Mw[:, 0, 1]
+    q[wmask, 1] = Mw[:, 0, 2] - Mw[:, 2, 0]
+    q[wmask, 0] = Mw[:, 2, 1] - Mw[:, 1, 2]
+
+    for ii, jj, kk in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        mask = ~wmask & (i == ii)
+        Mm = M[mask]
+        t[mask] = Mm[:, ii, ii] - (Mm[:, jj, jj] + Mm[:, kk, kk]) + m33[mask]
+        qm = numpy.empty((len(Mm), 4), dtype=numpy.float64)
+        qm[:, ii] = t[mask]
+        qm[:, jj] = Mm[:, ii, jj] + Mm[:, jj, ii]
+        qm[:, kk] = Mm[:, kk, ii] + Mm[:, ii, kk]
+        qm[:, 3] = Mm[:, kk, jj] - Mm[:, jj, kk]
+        q[mask] = qm
+
+    q *= (0.5 / numpy.sqrt(t * m33))[:, numpy.newaxis]
+    return q.reshape(shape + (4, ))
+
+
 def quaternion_multiply(quaternion1, quaternion0):
     """Return multiplication of two quaternions.
 
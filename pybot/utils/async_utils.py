@@ -0,0 +1,222 @@
+"""
+Bounded, order-preserving background prefetching
+
+prefetch_map(func, items) evaluates func on a pool of worker threads,
+at most prefetch items ahead of the consumer, and yields the results
+in the order of items. Exceptions raised by func are re-raised in the
+consumer (with their original traceback), and closing the generator
+(or breaking out of the loop) stops the workers.
+
+ProcessDecoder does the same with a pool of (forked) worker
+processes, for CPU-bound decoding (e.g. imread + resize). Decoded
+arrays are handed back through a ring of shared-memory slots instead
+of being pickled, and only the slot index, shape and dtype travel
+through the result queue.
+"""
+
+# License: MIT
+
+import sys
+import ctypes
+import threading
+import traceback
+import multiprocessing as mp
+import numpy as np
+from Queue import Queue, Empty
+from collections import deque
+
+class _Slot(object):
+    """ Result placeholder for a single item """
+    __slots__ = ['done', 'value', 'exc_info']
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+    def get(self):
+        # Wait with a timeout (interruptible by KeyboardInterrupt)
+        while not self.done.wait(0.1):
+            pass
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+def _worker(func, tasks, stop):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        item, slot = task
+        if not stop.is_set():
+            try:
+                slot.value = func(item)
+            except BaseException:
+                slot.exc_info = sys.exc_info()
+        slot.done.set()
+
+def prefetch_map(func, items, prefetch=8, workers=1):
+    """
+    Ordered map of func over items, computed in the background
+    by workers threads, at most prefetch items ahead (bounded memory)
+
+    prefetch [0]: evaluate synchronously in the consumer thread
+    """
+    if prefetch <= 0 or workers <= 0:
+        for item in items:
+            yield func(item)
+        return
+
+    tasks, stop = Queue(), threading.Event()
+    threads = [threading.Thread(target=_worker, args=(func, tasks, stop))
+               for _ in xrange(workers)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    pending = deque()
+    items = iter(items)
+    try:
+        for item in items:
+            slot = _Slot()
+            pending.append(slot)
+            tasks.put((item, slot))
+            if len(pending) > prefetch:
+                yield pending.popleft().get()
+        while len(pending):
+            yield pending.popleft().get()
+    finally:
+        stop.set()
+        for _ in threads:
+            tasks.put(None)
+        for t in threads:
+            t.join()
+
+def _decode_worker(func, tasks, results, buf, slot_bytes):
+    """ Decode tasks (idx, slot, item) into the shared ring buffer """
+    ring = np.ctypeslib.as_array(buf)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        idx, slot, item = task
+        try:
+            im = np.ascontiguousarray(func(item))
+            if im.nbytes <= slot_bytes:
+                view = ring[slot * slot_bytes:slot * slot_bytes + im.nbytes]
+                view[:] = im.reshape(-1).view(np.uint8)
+                results.put((idx, slot, im.shape, im.dtype.str, None, None))
+            else:
+                # Larger than a slot, fall back to pickling
+                results.put((idx, slot, None, None, im, None))
+        except Exception:
+            results.put((idx, slot, None, None, None,
+                         'Failed to decode {}\n{}'.format(item, traceback.format_exc())))
+
+class ProcessDecoder(object):
+    """
+    Ordered, multi-process map of a decoding function func(item) =>
+    np.ndarray, that returns decoded frames via shared memory
+
+    processes: Number of worker processes (default: cpu_count)
+    ring_size: Number of shared-memory slots, i.e. frames decoded
+       ahead of the consumer (default: 2 * processes)
+    slot_bytes: Size of each slot (default: size of the first frame,
+       that is decoded in the calling process). Frames that do not fit
+       are pickled back instead.
+    copy: Yield copies of the slots. If False, yielded frames are
+       views into shared memory, only valid until the next iteration.
+
+    Workers are forked for every imap call (func can be a closure),
+    and are shut down when the generator is exhausted or closed.
+    """
+    def __init__(self, func, processes=None, ring_size=None, slot_bytes=None, copy=True):
+        self.func = func
+        self.processes = processes or mp.cpu_count()
+        self.ring_size = ring_size or 2 * self.processes
+        self.slot_bytes = slot_bytes
+        self.copy = copy
+
+    def __repr__(self):
+        return '{}: processes: {}, ring_size: {}, slot_bytes: {}'.format(
+            self.__class__.__name__, self.processes, self.ring_size, self.slot_bytes)
+
+    def _get(self, results, workers):
+        """ Next result, checking that the workers are still alive """
+        while True:
+            try:
+                return results.get(timeout=0.5)
+            except Empty:
+                if not all(w.is_alive() for w in workers):
+                    raise RuntimeError('{} :: Decoding worker died unexpectedly'
+                                       .format(self.__class__.__name__))
+
+    def imap(self, items):
+        items = iter(items)
+        try:
+            first = np.ascontiguousarray(self.func(next(items)))
+        except StopIteration:
+            return
+        yield first
+
+        slot_bytes = self.slot_bytes or max(first.nbytes, 1)
+        buf = mp.RawArray(ctypes.c_uint8, slot_bytes * self.ring_size)
+        ring = np.ctypeslib.as_array(buf)
+        tasks, results = mp.Queue(), mp.Queue()
+        workers = [mp.Process(target=_decode_worker, args=(self.func, tasks, results, buf, slot_bytes))
+                   for _ in xrange(self.processes)]
+        for w in workers:
+            w.daemon = True
+            w.start()
+
+        free = deque(xrange(self.ring_size))
+        done, submitted, nxt, held = {}, 0, 0, None
+        exhausted = False
+        try:
+            while True:
+                # Release the slot of the previously yielded view
+                if held is not None:
+                    free.append(held)
+                    held = None
+
+                # Fill the ring
+                while len(free) and not exhausted:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    tasks.put((submitted, free.popleft(), item))
+                    submitted += 1
+                if nxt == submitted:
+                    return
+
+                # Wait for the next frame (in order)
+                while nxt not in done:
+                    idx, slot, shape, dtype, im, err = self._get(results, workers)
+                    done[idx] = (slot, shape, dtype, im, err)
+                slot, shape, dtype, im, err = done.pop(nxt)
+                nxt += 1
+                if err is not None:
+                    raise RuntimeError('{} :: {}'.format(self.__class__.__name__, err))
+                if im is not None:
+                    free.append(slot)
+                    yield im
+                    continue
+
+                dtype = np.dtype(dtype)
+                nbytes = int(np.prod(shape)) * dtype.itemsize
+                view = ring[slot * slot_bytes:slot * slot_bytes + nbytes].view(dtype).reshape(shape)
+                if self.copy:
+                    free.append(slot)
+                    yield view.copy()
+                else:
+                    held = slot
+                    yield view
+        finally:
+            for _ in workers:
+                tasks.put(None)
+            for w in workers:
+                w.join(timeout=1.0)
+                if w.is_alive():
+                    w.terminate()
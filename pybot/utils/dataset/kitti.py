@@ -11,7 +11,7 @@ from pybot.utils.dataset_readers import natural_sort, \
     FileReader, DatasetReader, ImageDatasetReader, \
     StereoDatasetReader, VelodyneDatasetReader
 
-from pybot.geometry.rigid_transform import RigidTransform
+from pybot.geometry.rigid_transform import RigidTransform, RigidTransformArray
 from pybot.vision.camera_utils import StereoCamera
 
 def kitti_stereo_calib(sequence, scale=1.0): 
@@ -32,16 +32,20 @@ def kitti_stereo_calib(sequence, scale=1.0):
 #     baseline_px = 386.1448 * scale
 #     return get_calib_params(f, f, cx, cy, baseline_px=baseline_px)
 
+def kitti_load_pose_array(fn): 
+    """ Load poses as a single (vectorized) RigidTransformArray """
+    X = (np.fromfile(fn, dtype=np.float64, sep=' ')).reshape(-1,3,4)
+    return RigidTransformArray.from_matrix(X)
+
 def kitti_load_poses(fn): 
-    X = (np.fromfile(fn, dtype=np.float64, sep=' ')).reshape(-1,12)
-    return map(lambda p: RigidTransform.from_Rt(p[:3,:3], p[:3,3]), 
-                map(lambda x: x.reshape(3,4), X))
+    return kitti_load_pose_array(fn).to_list()
 
 def kitti_poses_to_str(poses): 
-    return "\r\n".join(map(lambda x: " ".join(map(str, 
-                                                  (x.matrix[:3,:4]).flatten())), poses))
+    return "\r\n".join(map(lambda x: " ".join(map(str, x)), kitti_poses_to_mat(poses)))
 
 def kitti_poses_to_mat(poses): 
+    if isinstance(poses, RigidTransformArray): 
+        return poses.to_matrix()[:,:3,:4].reshape(-1,12)
     return np.vstack(map(lambda x: (x.matrix[:3,:4]).flatten(), poses)).astype(np.float64)
 
 
@@ -49,6 +53,9 @@ class KITTIDatasetReader(object):
     """
     KITTIDatasetReader: ImageDatasetReader + VelodyneDatasetReader + Calib
     http://www.cvlibs.net/datasets/kitti/setup.php
+
+    velodyne_kwargs: VelodyneDatasetReader options, e.g. 
+       dict(mmap=True, max_range=50, voxel_size=0.2) 
     """
     kitti_00_02 = StereoCamera.from_calib_params(718.86, 718.86, 607.19, 185.22, 
                                                  baseline_px=386.1448, shape=np.int32([376, 1241]))
@@ -64,7 +71,7 @@ class KITTIDatasetReader(object):
                  left_template='image_0/%06i.png', 
                  right_template='image_1/%06i.png', 
                  velodyne_template='velodyne/%06i.bin',
-                 start_idx=0, max_files=50000, scale=1.0): 
+                 start_idx=0, max_files=50000, scale=1.0, undistort=False, velodyne_kwargs=None): 
 
         # Set args
         self.sequence = sequence
@@ -73,25 +80,28 @@ class KITTIDatasetReader(object):
         # Get calib
         self.calib = kitti_stereo_calib(sequence, scale=scale)
 
-        # Read stereo images
+        # Read stereo images (optionally undistorted and rescaled 
+        # with a single remap, using the full-resolution calib)
         seq_directory = os.path.join(os.path.expanduser(directory), 'sequences', sequence)
         self.stereo = StereoDatasetReader(directory=seq_directory, 
                                           left_template=os.path.join(seq_directory,left_template), 
                                           right_template=os.path.join(seq_directory,right_template), 
-                                          start_idx=start_idx, max_files=max_files, scale=scale)
+                                          start_idx=start_idx, max_files=max_files, scale=scale, 
+                                          calib=kitti_stereo_calib(sequence) if undistort else None)
 
         # Read poses
         try: 
             pose_fn = os.path.join(os.path.expanduser(directory), 'poses', ''.join([sequence, '.txt']))
-            self.poses = FileReader(pose_fn, process_cb=kitti_load_poses)
+            self.poses = FileReader(pose_fn, process_cb=kitti_load_pose_array)
         except Exception as e:
             self.poses = repeat(None)
 
         try: 
-            # Read velodyne
+            # Read velodyne (optionally memory-mapped / filtered 
+            # on load, see VelodyneDatasetReader)
             self.velodyne = VelodyneDatasetReader(
                 template=os.path.join(seq_directory,velodyne_template), 
-                start_idx=start_idx, max_files=max_files
+                start_idx=start_idx, max_files=max_files, **(velodyne_kwargs or {})
             )
         except Exception as e: 
             self.velodyne = repeat(None)
@@ -111,6 +121,13 @@ class KITTIDatasetReader(object):
         """
         return self.velodyne.iteritems(*args, **kwargs)
 
+    def iter_velodyne_batches(self, *args, **kwargs): 
+        """
+        for X, offsets in dataset.iter_velodyne_batches(batch_size=8): 
+          X_i = X[offsets[i]:offsets[i+1]]
+        """
+        return self.velodyne.iterbatches(*args, **kwargs)
+
     def iter_stereo_velodyne_frames(self, *args, **kwargs):         
         return izip(self.left.iteritems(*args, **kwargs), 
                     self.right.iteritems(*args, **kwargs), 
@@ -244,11 +261,12 @@ class KITTIRawDatasetReader(KITTIDatasetReader):
                  right_template='image_01/data/%010i.png', 
                  velodyne_template='velodyne_points/data/%010i.bin', 
                  oxt_template='oxts/data/%010i.txt',
-                 start_idx=0, max_files=50000, scale=1.0): 
+                 start_idx=0, max_files=50000, scale=1.0, velodyne_kwargs=None): 
         super(KITTIRawDatasetReader, self).__init__(directory, sequence, 
                                                     left_template=left_template, right_template=right_template, 
                                                     velodyne_template=velodyne_template, 
-                                                    start_idx=start_idx, max_files=max_files, scale=scale)
+                                                    start_idx=start_idx, max_files=max_files, scale=scale, 
+                                                    velodyne_kwargs=velodyne_kwargs)
 
         # Read stereo images
         self.stereo = StereoDatasetReader(directory=directory, 
@@ -266,7 +284,7 @@ class KITTIRawDatasetReader(KITTIDatasetReader):
         # Read velodyne
         self.velodyne = VelodyneDatasetReader(
             template=os.path.join(directory,velodyne_template), 
-            start_idx=start_idx, max_files=max_files
+            start_idx=start_idx, max_files=max_files, **(velodyne_kwargs or {})
         )
 
         # Read oxts
@@ -344,6 +362,13 @@ class OmnicamDatasetReader(object):
     def iter_velodyne_frames(self, *args, **kwargs):         
         return self.velodyne.iteritems(*args, **kwargs)
 
+    def iter_velodyne_batches(self, *args, **kwargs): 
+        """
+        for X, offsets in dataset.iter_velodyne_batches(batch_size=8): 
+          X_i = X[offsets[i]:offsets[i+1]]
+        """
+        return self.velodyne.iterbatches(*args, **kwargs)
+
     def iter_stereo_velodyne_frames(self, *args, **kwargs):         
         return izip(self.left.iteritems(*args, **kwargs), 
                     self.right.iteritems(*args, **kwargs), 
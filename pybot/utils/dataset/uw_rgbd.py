@@ -20,9 +20,10 @@ from pybot.utils.dataset_readers import read_dir, read_files, natural_sort, \
 from pybot.vision.draw_utils import annotate_bbox
 from pybot.vision.camera_utils import kinect_v1_params, \
     Camera, CameraIntrinsic, CameraExtrinsic, \
-    check_visibility, get_object_bbox
+    batch_check_visibility, batch_get_object_bbox
+from pybot.vision.zbuffer import ZBuffer
 
-from pybot.geometry.rigid_transform import Quaternion, RigidTransform
+from pybot.geometry.rigid_transform import Quaternion, RigidTransform, RigidTransformArray
 from pybot.externals.plyfile import PlyData
 
 # __categories__ = ['flashlight', 'cap', 'cereal_box', 'coffee_mug', 'soda_can']
@@ -286,7 +287,7 @@ class UWRGBDSceneDataset(UWRGBDDataset):
         RGB-D reader 
         Given mask, depth, and rgb files build an read iterator with appropriate process_cb
         """
-        def __init__(self, files, meta_file, aligned_file, version, name=''): 
+        def __init__(self, files, meta_file, aligned_file, version, name='', cache=None): 
             self.name = name
             self.version = version
 
@@ -295,8 +296,8 @@ class UWRGBDSceneDataset(UWRGBDDataset):
 
             # RGB, Depth
             # TODO: Check depth seems scaled by 256 not 16
-            self.rgb = ImageDatasetReader.from_filenames(self.rgb_files)
-            self.depth = ImageDatasetReader.from_filenames(self.depth_files)
+            self.rgb = ImageDatasetReader.from_filenames(self.rgb_files, cache=cache)
+            self.depth = ImageDatasetReader.from_filenames(self.depth_files, cache=cache)
 
             # BBOX
             self.bboxes = UWRGBDSceneDataset._reader.load_bboxes(meta_file, version) \
@@ -413,10 +414,10 @@ class UWRGBDSceneDataset(UWRGBDDataset):
 
             if version == 'v1': 
                 P = np.loadtxt(os.path.expanduser(fn), usecols=(2,3,4,5,6,7,8), dtype=np.float64)
-                return map(lambda p: RigidTransform(Quaternion.from_wxyz(p[:4]), p[4:]), P)
+                return RigidTransformArray(xyzw=np.roll(P[:,:4], shift=-1, axis=1), tvec=P[:,4:])
             elif version == 'v2': 
                 P = np.loadtxt(os.path.expanduser(fn), dtype=np.float64)
-                return map(lambda p: RigidTransform(Quaternion.from_wxyz(p[:4]), p[4:]), P)
+                return RigidTransformArray(xyzw=np.roll(P[:,:4], shift=-1, axis=1), tvec=P[:,4:])
             else: 
                 raise ValueError('''Version %s not supported. '''
                                  '''Check dataset and choose either v1 or v2 scene dataset''' % version)
@@ -524,9 +525,12 @@ class UWRGBDSceneDataset(UWRGBDDataset):
             draw_utils.publish_pose_list('aligned_poses', [RigidTransform(tvec=obj.center) for obj in self.map_info.objects], 
                                          texts=[str(obj.label) for obj in self.map_info.objects])
 
-        def get_bboxes(self, pose): 
+        def get_bboxes(self, pose, handle_occlusions=False, min_visible_fraction=0.25): 
             """
-            Support for occlusion handling is incomplete/bug-ridden
+            Bounding boxes of the visible clusters for a single pose. 
+            With handle_occlusions, clusters are rasterized into a 
+            z-buffer (see ZBuffer), and clusters with less than 
+            min_visible_fraction of their footprint visible are dropped
             """
 
             # 1. Get pose for a particular frame, 
@@ -538,47 +542,67 @@ class UWRGBDSceneDataset(UWRGBDDataset):
                 print 'Failed to find pose'
                 return None
 
-            # 2. Determine bounding boxes for visible clusters
-            object_centers = np.vstack([obj.center for obj in self.map_info.objects])
-            visible_inds, = np.where(check_visibility(self.map_info.camera, object_centers))
-
-            object_candidates = []
-            for ind in visible_inds:
-                obj = self.map_info.objects[ind]
-                label = obj.label
-                pts2d, coords, depth = get_object_bbox(self.map_info.camera, obj.points, subsample=3, scale=1)
-                if coords is not None: 
-                    object_candidates.append(
-                        AttrDict(
-                            target=obj.label, 
-                            category=UWRGBDDataset.target_unhash[obj.label], 
-                            coords=coords, 
-                            depth=depth, 
-                            uid=obj.uid))
-
-            # # 3. Ensure occlusions are handled, sort by increasing depth, and filter 
-            # # based on overlapping threshold
-            # sorted_object_candidates = sorted(object_candidates, key=lambda obj: obj.depth)
-            
-            # # Occlusion mask
-            # im_sz = self.map_info.camera.shape[:2]
-            # occ_mask = np.zeros(shape=im_sz, dtype=np.uint8)
-            
-            # # Non-occluded object_candidates
-            # nonocc_object_candidates = []
-            # for obj in sorted_object_candidates: 
-            #     x0, y0, x1, y1 = obj.coords
-            #     xc, yc = (x0 + x1) / 2, (y0 + y1) / 2
+            # 2. Determine bounding boxes for visible clusters, 
+            # and (optionally) filter out occluded clusters
+            object_candidates = self.get_sequence_bboxes(
+                RigidTransformArray.from_list([pose]), handle_occlusions=handle_occlusions, 
+                min_visible_fraction=min_visible_fraction)[0]
 
-            #     # If the bbox center is previously occupied, skip
-            #     if occ_mask[yc,xc]: 
-            #         continue
+            return object_candidates
 
-            #     # Set as occupied
-            #     occ_mask[y0:y1,x0:x1] = 1
-            #     nonocc_object_candidates.append(obj)
+        def get_sequence_bboxes(self, poses=None, num_threads=None, 
+                                handle_occlusions=False, min_visible_fraction=0.25): 
+            """
+            Bounding boxes of the visible clusters for all the 
+            provided poses (defaults to the scene's poses), computed 
+            in a single batched projection (see batch_get_object_bbox)
 
-            return object_candidates
+            handle_occlusions: Rasterize the clusters of each frame into 
+               a z-buffer, and drop clusters with less than 
+               min_visible_fraction of their footprint visible
+            """
+            poses = self.poses if poses is None else poses
+            camera, objects = self.map_info.camera, self.map_info.objects
+            camera_poses = poses.inverse()
+            if not len(objects): 
+                return [[] for _ in xrange(len(poses))]
+
+            # Visible clusters, and their bounding boxes [K x M]
+            object_centers = np.vstack([obj.center for obj in objects])
+            visible = batch_check_visibility(camera, camera_poses, object_centers, 
+                                             num_threads=num_threads)
+            coords, depths, valid = batch_get_object_bbox(camera, camera_poses, 
+                                                          [obj.points for obj in objects], 
+                                                          subsample=3, scale=1, 
+                                                          num_threads=num_threads)
+            valid &= visible
+
+            # Occlusion handling (one z-buffer pass per frame)
+            if handle_occlusions: 
+                zcamera = Camera.from_intrinsics(camera.intrinsics)
+                zbuf = ZBuffer(zcamera, discretize=4)
+                points = [obj.points[::3] for obj in objects]
+                for k in xrange(len(poses)): 
+                    if not valid[k].any(): 
+                        continue
+                    zcamera.set_pose(camera_poses[k])
+                    _, _, _, unoccluded = zbuf.rasterize_objects(points).object_bboxes(
+                        min_fraction=min_visible_fraction)
+                    valid[k] &= unoccluded
+            
+            return [[AttrDict(target=objects[ind].label, 
+                              category=UWRGBDDataset.target_unhash[objects[ind].label], 
+                              coords=coords[k,ind], 
+                              depth=depths[k,ind], 
+                              uid=objects[ind].uid) for ind in np.where(valid[k])[0]]
+                    for k in xrange(len(poses))]
+
+        @property
+        def sequence_bboxes(self): 
+            """ Bounding boxes for every frame, computed once for the whole sequence """
+            if getattr(self, 'sequence_bboxes_', None) is None: 
+                self.sequence_bboxes_ = self.get_sequence_bboxes()
+            return self.sequence_bboxes_
 
         def _process_items(self, index, rgb_im, depth_im, bbox, pose): 
             def _process_bbox(bbox): 
@@ -594,7 +618,8 @@ class UWRGBDSceneDataset(UWRGBDDataset):
 
             if self.version == 'v2': 
                 if bbox is None and hasattr(self, 'map_info'): 
-                    bbox = self.get_bboxes(pose)
+                    bbox = self.sequence_bboxes[index] \
+                           if index < len(self.poses) else self.get_bboxes(pose)
 
             # print 'Processing pose', pose, bbox
             return AttrDict(index=index, img=rgb_im, depth=depth_im, 
@@ -625,12 +650,17 @@ class UWRGBDSceneDataset(UWRGBDDataset):
                 yield self._process_items(index, rgb_im, depth_im, bbox, pose)
 
 
-    def __init__(self, version, directory, targets=None, num_targets=None, blacklist=['']):
+    def __init__(self, version, directory, targets=None, num_targets=None, blacklist=[''], cache=None):
+        """
+        cache: Optional decoded-frame cache (FrameCache, or True for the 
+           process-wide cache), shared by all the scene readers
+        """
         if version not in ['v1', 'v2']: 
             raise ValueError('Version %s not supported. '''
                              '''Check dataset and choose either v1 or v2 scene dataset''' % version)
         self.version = version
         self.blacklist = blacklist
+        self.cache = cache
 
         # Recursively read, and categorize items based on folder
         self.dataset_ = read_dir(os.path.expanduser(directory), pattern='*.png', recursive=False)
@@ -685,7 +715,7 @@ class UWRGBDSceneDataset(UWRGBDDataset):
         meta_file = self.meta_.get(key, None)
         aligned_file = self.aligned_.get(key, None) if (self.aligned_ and with_ground_truth) else None
 
-        return UWRGBDSceneDataset._reader(files, meta_file, aligned_file, self.version, key) 
+        return UWRGBDSceneDataset._reader(files, meta_file, aligned_file, self.version, key, cache=self.cache) 
 
     def scenes(self): 
         return self.dataset_.keys()
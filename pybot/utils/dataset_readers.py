@@ -12,7 +12,9 @@ import re
 
 from itertools import izip, imap, chain, islice
 from collections import defaultdict, namedtuple, OrderedDict
-# from .async_utils import async_prefetch
+
+from pybot.utils.async_utils import prefetch_map, ProcessDecoder
+from pybot.utils.frame_cache import get_frame_cache
 
 from pybot.vision.image_utils import im_resize
 
@@ -106,7 +108,8 @@ class FileReader(object):
         self.start_idx_ = start_idx
         self.items_ = process_cb(filename)
 
-    def iteritems(self, every_k_frames=1, reverse=False): 
+    def iteritems(self, every_k_frames=1, reverse=False, prefetch=0, workers=1): 
+        """ Items are already in memory (prefetch is ignored) """
         if reverse: 
             raise NotImplementedError
         return islice(self.items_, self.start_idx_, None, every_k_frames)
@@ -119,14 +122,27 @@ class DatasetReader(object):
     """
     Simple Dataset Reader
     Refer to this class and ImageDatasetWriter for input/output
+
+    cache: Optional decoded-frame cache (FrameCache, or True for 
+       the process-wide cache), used by reader[idx] and iteration, 
+       with frames keyed by (filename,) + cache_key
+    cache_key: Tuple identifying process_cb (required with a cache), 
+       readers that decode differently must use different keys, 
+       since the cache is shared
     """
 
     # Get directory, and filename pattern
     def __init__(self, process_cb=lambda x: x, 
                  template='template_%i.txt', start_idx=0, max_files=10000, 
-                 files=None):
+                 files=None, cache=None, cache_key=None):
         template = os.path.expanduser(template)
         self.process_cb = process_cb
+        self.decoder = None
+        self.cache = get_frame_cache(cache)
+        if self.cache is not None and cache_key is None: 
+            raise ValueError('{} :: cache requires an explicit cache_key identifying process_cb'
+                             .format(self.__class__.__name__))
+        self.cache_key = tuple(cache_key) if cache_key is not None else ()
 
         # Index starts at 0
         if files is None:
@@ -163,31 +179,45 @@ class DatasetReader(object):
     def from_filenames(process_cb, files): 
         return DatasetReader(process_cb=process_cb, files=files)
 
-    def _prefetch(self, fnos): 
-        pass
-    def yield_data(self): 
-        pass
-
     @staticmethod
     def from_directory(process_cb, directory, pattern='*.png'):
         files = read_dir(directory, pattern=pattern, flatten=True)
         sorted_files = natural_sort(files)
         return DatasetReader.from_filenames(process_cb, sorted_files)
 
-    # @async_prefetch
-    def iteritems(self, every_k_frames=1, reverse=False):
+    def _fnos(self, every_k_frames=1, reverse=False): 
         fnos = np.arange(0, len(self.files), every_k_frames).astype(int)
-        if reverse: 
-            fnos = fnos[::-1]
-        for fno in fnos:
-            yield self.process_cb(self.files[fno])
+        return fnos[::-1] if reverse else fnos
+
+    def _iterfnos(self, fnos, prefetch=0, workers=1): 
+        """
+        Decode the files fnos in order, optionally in the background 
+        (prefetch frames ahead, with workers threads), see prefetch_map. 
+        Readers with a (process) decoder ignore prefetch / workers
+        """
+        if self.decoder is not None: 
+            return self.decoder.imap(self.files[fno] for fno in fnos)
+        return prefetch_map(self.__getitem__, fnos, prefetch=prefetch, workers=workers)
+
+    def __getitem__(self, idx): 
+        """ Decoded frame idx (via the frame cache, if any) """
+        fn = self.files[idx]
+        if self.cache is None: 
+            return self.process_cb(fn)
+        return self.cache.get((fn,) + self.cache_key, lambda: self.process_cb(fn))
+
+    def __len__(self): 
+        return len(self.files)
 
-    def iterinds(self, inds, reverse=False): 
-        fnos = inds.astype(int)
+    def iteritems(self, every_k_frames=1, reverse=False, prefetch=0, workers=1):
+        return self._iterfnos(self._fnos(every_k_frames, reverse=reverse), 
+                              prefetch=prefetch, workers=workers)
+
+    def iterinds(self, inds, reverse=False, prefetch=0, workers=1): 
+        fnos = np.asarray(inds).astype(int)
         if reverse: 
             fnos = fnos[::-1]
-        for fno in fnos: 
-            yield self.process_cb(self.files[fno])
+        return self._iterfnos(fnos, prefetch=prefetch, workers=workers)
 
     @property
     def length(self): 
@@ -197,6 +227,81 @@ class DatasetReader(object):
     def frames(self): 
         return self.iteritems()
 
+# KITTI Velodyne scans: [N x 4] float32 (x, y, z, intensity)
+VELODYNE_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('intensity', '<f4')])
+
+def read_velodyne_bin(fn, mmap=True, structured=False): 
+    """
+    Read a KITTI Velodyne .bin scan as [N x 4] float32 (x, y, z, intensity), 
+    memory-mapped (read-only, zero-copy) if mmap=True, or as a [N] 
+    structured (VELODYNE_DTYPE) view if structured=True
+    """
+    if not os.path.getsize(fn): 
+        X = np.zeros(0, dtype=np.float32)
+    elif mmap: 
+        X = np.memmap(fn, dtype=np.float32, mode='r')
+    else: 
+        X = np.fromfile(fn, dtype=np.float32)
+    X = X.reshape(-1,4)
+    return X.view(VELODYNE_DTYPE).reshape(-1) if structured else X
+
+def velodyne_filter_mask(X, min_range=None, max_range=None, fov=None): 
+    """
+    Mask [N] of the points [N x 4] within the (horizontal) range [m], 
+    and the horizontal field of view fov=(min, max) [deg] (azimuth, 
+    counter-clockwise from the x-axis, in [-180, 180])
+    """
+    x, y = X[:,0], X[:,1]
+    mask = np.ones(len(X), dtype=np.bool)
+    if min_range is not None or max_range is not None: 
+        r2 = x * x + y * y
+        if min_range is not None: 
+            mask &= r2 >= min_range * min_range
+        if max_range is not None: 
+            mask &= r2 <= max_range * max_range
+    if fov is not None: 
+        az = np.degrees(np.arctan2(y, x))
+        mask &= (az >= fov[0]) & (az <= fov[1])
+    return mask
+
+def voxel_downsample(X, voxel_size): 
+    """
+    Keep the first point [N x D] (D >= 3) in every voxel of size 
+    voxel_size [m], in the order of the input points
+    """
+    if not len(X): 
+        return X
+    ijk = np.floor(X[:,:3] / np.float32(voxel_size)).astype(np.int64)
+    ijk -= ijk.min(axis=0)
+    if ijk.max() < 1 << 21: 
+        # Pack voxel indices into a single (21-bit per axis) key
+        key = (ijk[:,0] << 42) | (ijk[:,1] << 21) | ijk[:,2]
+        _, first = np.unique(key, return_index=True)
+    else: 
+        # Wider extents would alias in the packed key, sort the voxel 
+        # indices lexicographically instead (stable, keeps the first point)
+        order = np.lexsort(ijk.T[::-1])
+        ijk = ijk[order]
+        first = order[np.r_[True, np.any(ijk[1:] != ijk[:-1], axis=1)]]
+    return X[np.sort(first)]
+
+def velodyne_process_cb(mmap=True, structured=False, min_range=None, max_range=None, 
+                        fov=None, voxel_size=None): 
+    """
+    Velodyne .bin reader, with range, field-of-view and voxel-grid 
+    filters applied on load. Unfiltered scans are memory-mapped views, 
+    filtered scans only copy the selected points.
+    """
+    filtered = min_range is not None or max_range is not None or fov is not None
+    def process_cb(fn): 
+        X = read_velodyne_bin(fn, mmap=mmap)
+        if filtered: 
+            X = X[velodyne_filter_mask(X, min_range=min_range, max_range=max_range, fov=fov)]
+        if voxel_size is not None: 
+            X = voxel_downsample(X, voxel_size)
+        return X.view(VELODYNE_DTYPE).reshape(-1) if structured else X
+    return process_cb
+
 class VelodyneDatasetReader(DatasetReader): 
     """
     Velodyne reader
@@ -205,18 +310,57 @@ class VelodyneDatasetReader(DatasetReader):
     >> reader = DatasetReader(process_cb=lambda fn: read_velodyne_pc(fn), ...)
     >> reader = DatasetReader(process_cb=lambda fn: read_velodyne_pc(fn), 
                     template='data_%i.txt', start_idx=1, max_files=10000)
-    """
 
+    KITTI .bin scans are read with numpy (see velodyne_process_cb) if 
+    mmap=True, any filter is set, or pybot_vision is not available: 
+       mmap: Memory-mapped (zero-copy) scans
+       structured: [N] VELODYNE_DTYPE (x, y, z, intensity) scans, 
+          instead of [N x 4] float32
+       min_range, max_range [m], fov (min, max) [deg]: Horizontal 
+          range and field-of-view filters
+       voxel_size [m]: Voxel-grid downsampling
+
+    >> reader = VelodyneDatasetReader(template=..., mmap=True, max_range=40, voxel_size=0.1)
+    >> for X, offsets in reader.iterbatches(batch_size=8): ...
+    """
 
-    def __init__(self, template='template_%i.txt', start_idx=0, max_files=10000, files=None):
-        try: 
-            from pybot_vision import read_velodyne_pc
-        except: 
-            raise RuntimeError('read_velodyne_pc missing in pybot_vision. Compile it first!')
-        DatasetReader.__init__(self, process_cb=lambda fn: read_velodyne_pc(fn), template=template, 
+    def __init__(self, template='template_%i.txt', start_idx=0, max_files=10000, files=None, 
+                 mmap=False, structured=False, min_range=None, max_range=None, fov=None, voxel_size=None):
+        kwargs = dict(min_range=min_range, max_range=max_range, fov=fov, voxel_size=voxel_size)
+        process_cb = None
+        if not mmap and not structured and all(v is None for v in kwargs.values()): 
+            try: 
+                from pybot_vision import read_velodyne_pc
+                process_cb = lambda fn: read_velodyne_pc(fn)
+            except: 
+                pass
+        if process_cb is None: 
+            process_cb = velodyne_process_cb(mmap=mmap, structured=structured, **kwargs)
+        self.structured = structured
+        DatasetReader.__init__(self, process_cb=process_cb, template=template, 
                                start_idx=start_idx, max_files=max_files, files=files)
-        
 
+    def iterbatches(self, batch_size=8, every_k_frames=1, reverse=False, prefetch=0, workers=1): 
+        """
+        Yield batches of batch_size scans, concatenated into a single 
+        preallocated (and reused) [sum(N_i) x 4] buffer, with offsets 
+        [K+1] such that scan i is X[offsets[i]:offsets[i+1]]. Batches 
+        are only valid until the next iteration.
+        """
+        fnos = self._fnos(every_k_frames, reverse=reverse)
+        scans = self._iterfnos(fnos, prefetch=prefetch, workers=workers)
+        buf = np.empty(0, dtype=VELODYNE_DTYPE if self.structured else np.float32)
+        for st in xrange(0, len(fnos), batch_size): 
+            batch = list(islice(scans, batch_size))
+            offsets = np.zeros(len(batch)+1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(X) for X in batch])
+            if len(buf) < offsets[-1] * (1 if self.structured else 4): 
+                buf = np.empty(int(offsets[-1] * 1.25) * (1 if self.structured else 4), dtype=buf.dtype)
+            out = buf[:offsets[-1]] if self.structured else buf[:offsets[-1] * 4].reshape(-1,4)
+            for j, X in enumerate(batch): 
+                out[offsets[j]:offsets[j+1]] = X
+            yield out, offsets
+        
 class ImageDatasetReader(DatasetReader): 
     """
     ImageDatasetReader
@@ -225,39 +369,80 @@ class ImageDatasetReader(DatasetReader):
     >> reader = DatasetReader(process_cb=lambda fn: cv2.imread(fn, 0), ...)
     >> reader = DatasetReader(process_cb=lambda fn: cv2.imread(fn, 0), 
                     template='data_%i.txt', start_idx=1, max_files=10000)
+
+    processes: If > 0, frames are decoded (imread, resize, undistort) 
+       by a pool of worker processes, and returned via a ring of 
+       ring_size shared-memory slots (see ProcessDecoder)
+    >> reader = ImageDatasetReader.from_directory(directory, scale=0.5, processes=8)
+
+    cache: Decoded frames are cached by (filename, scale, grayscale, 
+       calib K, D), see DatasetReader (not with processes > 0)
     """
 
     @staticmethod
-    def imread_process_cb(scale=1.0, grayscale=False):
-        return lambda fn: im_resize(cv2.imread(fn, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_UNCHANGED), scale=scale)
+    def imread_cache_key(scale=1.0, grayscale=False, calib=None): 
+        """ Cache key of the frames decoded by imread_process_cb """
+        calib_key = None if calib is None else \
+                    (tuple(np.float64(calib.K).ravel()), tuple(np.float64(calib.D).ravel()))
+        return (float(scale), bool(grayscale), calib_key)
+
+    @staticmethod
+    def imread_process_cb(scale=1.0, grayscale=False, calib=None):
+        """
+        calib: Optional CameraIntrinsic (of the full-resolution images), 
+           images are undistorted and rescaled with a single (cached) remap
+        """
+        flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_UNCHANGED
+        if calib is not None: 
+            return lambda fn: calib.undistort(cv2.imread(fn, flags), scale=scale)
+        return lambda fn: im_resize(cv2.imread(fn, flags), scale=scale)
     
-    def __init__(self, template='template_%i.txt', start_idx=0, max_files=10000, files=None, scale=1.0, grayscale=False): 
+    def __init__(self, template='template_%i.txt', start_idx=0, max_files=10000, files=None, scale=1.0, grayscale=False, calib=None, 
+                 processes=0, ring_size=None, cache=None): 
+        if processes > 0 and get_frame_cache(cache) is not None: 
+            raise ValueError('{} :: cache is not supported with processes > 0 '
+                             '(the process decoder bypasses it)'.format(self.__class__.__name__))
         DatasetReader.__init__(self, 
-                               process_cb=ImageDatasetReader.imread_process_cb(scale=scale, grayscale=grayscale), template=template, 
-                               start_idx=start_idx, max_files=max_files, files=files)
+                               process_cb=ImageDatasetReader.imread_process_cb(scale=scale, grayscale=grayscale, calib=calib), template=template, 
+                               start_idx=start_idx, max_files=max_files, files=files, cache=cache, 
+                               cache_key=ImageDatasetReader.imread_cache_key(scale=scale, grayscale=grayscale, calib=calib))
+        if processes > 0: 
+            self.decoder = ProcessDecoder(self.process_cb, processes=processes, ring_size=ring_size)
 
     @staticmethod
     def from_filenames(files, **kwargs): 
-        return DatasetReader(process_cb=ImageDatasetReader.imread_process_cb(), files=files, **kwargs)
+        return ImageDatasetReader(files=files, **kwargs)
 
     @staticmethod
     def from_directory(directory, pattern='*.png', **kwargs):
-        return DatasetReader.from_directory(process_cb=ImageDatasetReader.imread_process_cb(),
-                                          directory=directory, pattern=pattern)
+        files = read_dir(directory, pattern=pattern, flatten=True)
+        return ImageDatasetReader.from_filenames(natural_sort(files), **kwargs)
         
 class StereoDatasetReader(object): 
     """
     KITTIDatasetReader: ImageDatasetReader (left) + ImageDatasetReader (right)
+
+    calib: Optional StereoCamera (of the full-resolution images), 
+       frames are undistorted (and rescaled) on read
+    processes, ring_size: Multi-process decoding of each 
+       of the left and right streams (see ImageDatasetReader)
+    cache: Decoded-frame cache (see DatasetReader), 
+       not with processes > 0
     """
 
     def __init__(self, directory='', 
                  left_template='image_0/%06i.png', 
                  right_template='image_1/%06i.png', 
-                 start_idx=0, max_files=10000, scale=1.0, grayscale=False): 
+                 start_idx=0, max_files=10000, scale=1.0, grayscale=False, calib=None, 
+                 processes=0, ring_size=None, cache=None): 
         self.left = ImageDatasetReader(template=os.path.join(os.path.expanduser(directory),left_template), 
-                                       start_idx=start_idx, max_files=max_files, scale=scale, grayscale=grayscale)
+                                       start_idx=start_idx, max_files=max_files, scale=scale, grayscale=grayscale, 
+                                       calib=calib.left if calib is not None else None, 
+                                       processes=processes, ring_size=ring_size, cache=cache)
         self.right = ImageDatasetReader(template=os.path.join(os.path.expanduser(directory),right_template), 
-                                        start_idx=start_idx, max_files=max_files, scale=scale, grayscale=grayscale)
+                                        start_idx=start_idx, max_files=max_files, scale=scale, grayscale=grayscale, 
+                                        calib=calib.right if calib is not None else None, 
+                                        processes=processes, ring_size=ring_size, cache=cache)
 
     @classmethod 
     def from_filenames(cls, left_files, right_files, **kwargs): 
@@ -278,9 +463,32 @@ class StereoDatasetReader(object):
         assert(self.left.length == self.right.length)
         return self.left.length
 
-    def iteritems(self, *args, **kwargs): 
-        return izip(self.left.iteritems(*args, **kwargs), 
-                    self.right.iteritems(*args, **kwargs))
+    def _iterfnos(self, fnos, prefetch=0, workers=1): 
+        """ 
+        Decode (left, right) pairs, each pair as a single prefetch task 
+        (or with the left and right process decoders)
+        """
+        if self.left.decoder is not None or self.right.decoder is not None: 
+            return izip(self.left._iterfnos(fnos), self.right._iterfnos(fnos))
+        return prefetch_map(self.__getitem__, fnos, prefetch=prefetch, workers=workers)
+
+    def __getitem__(self, idx): 
+        return self.left[idx], self.right[idx]
+
+    def __len__(self): 
+        return self.length
+
+    def iteritems(self, every_k_frames=1, reverse=False, prefetch=0, workers=1): 
+        fnos = np.arange(0, min(self.left.length, self.right.length), every_k_frames).astype(int)
+        if reverse: 
+            fnos = fnos[::-1]
+        return self._iterfnos(fnos, prefetch=prefetch, workers=workers)
+
+    def iterinds(self, inds, reverse=False, prefetch=0, workers=1): 
+        fnos = np.asarray(inds).astype(int)
+        if reverse: 
+            fnos = fnos[::-1]
+        return self._iterfnos(fnos, prefetch=prefetch, workers=workers)
 
     def iter_stereo_frames(self, *args, **kwargs):         
         return self.iteritems(*args, **kwargs)
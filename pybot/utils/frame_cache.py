@@ -0,0 +1,235 @@
+"""
+Decoded-frame cache for dataset readers
+
+Byte-budgeted LRU of decoded frames, keyed by (filename, *decode
+params) (e.g. scale, grayscale), shared by all the readers in the
+process (see DatasetReader.__getitem__). Frames evicted from memory
+can optionally be spilled to a compressed on-disk tier, so that
+re-reading them avoids the full decode (and resize / undistort).
+The on-disk tier persists across runs, its files are keyed by the
+source file's modification time and size as well (so modified
+sources are decoded again), and it is capped at maxdiskbytes
+(least-recently used files are deleted first).
+Cached frames are returned read-only, since they are shared.
+"""
+
+# License: MIT
+
+import os
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+
+class FrameCache(object):
+    """
+    LRU cache of decoded frames
+
+    maxbytes: Memory budget [bytes] for the cached frames
+    directory: Optional directory for the on-disk tier, frames
+       evicted from memory are written as compressed .npz files
+    maxdiskbytes: Size budget [bytes] of the on-disk tier
+
+    >> cache = FrameCache(maxbytes=4 << 30)
+    >> reader = ImageDatasetReader(template=..., cache=cache)
+    >> for im in reader.iterinds(inds): ...
+    >> cache.stats
+    """
+    def __init__(self, maxbytes=1 << 30, directory=None, maxdiskbytes=8 << 30):
+        self.maxbytes_ = int(maxbytes)
+        self.maxdiskbytes_ = int(maxdiskbytes)
+        self.directory_ = os.path.expanduser(directory) if directory is not None else None
+        if self.directory_ is not None and not os.path.exists(self.directory_):
+            os.makedirs(self.directory_)
+        self.frames_ = OrderedDict()
+        self.nbytes_ = 0
+        self.disk_nbytes_ = sum(os.path.getsize(fn) for fn in self._disk_files()) \
+                            if self.directory_ is not None else 0
+        self.lock_ = threading.Lock()
+        self.reset_stats()
+
+    def __repr__(self):
+        return '{}: frames: {}, bytes: {}/{}, hits: {}, misses: {}, disk hits: {}'.format(
+            self.__class__.__name__, len(self.frames_), self.nbytes_, self.maxbytes_,
+            self.hits_, self.misses_, self.disk_hits_)
+
+    def __len__(self):
+        return len(self.frames_)
+
+    def __contains__(self, key):
+        return key in self.frames_
+
+    def reset_stats(self):
+        self.hits_, self.misses_, self.disk_hits_, self.evictions_ = 0, 0, 0, 0
+
+    @property
+    def stats(self):
+        lookups = self.hits_ + self.misses_
+        return dict(hits=self.hits_, misses=self.misses_, disk_hits=self.disk_hits_,
+                    evictions=self.evictions_, frames=len(self.frames_), nbytes=self.nbytes_,
+                    disk_nbytes=self.disk_nbytes_,
+                    hit_rate=float(self.hits_) / lookups if lookups else 0.)
+
+    @property
+    def nbytes(self):
+        return self.nbytes_
+
+    # On-disk tier
+
+    @staticmethod
+    def _source_stamp(key):
+        """ (mtime, size) of the source file key[0], None if it is not a file """
+        try:
+            st = os.stat(key[0])
+            return (st.st_mtime, st.st_size)
+        except (TypeError, IndexError, OSError):
+            return None
+
+    def filename(self, key):
+        """ On-disk tier file of key (and the current version of its source file) """
+        return os.path.join(self.directory_, '{}.npz'.format(
+            hashlib.sha1(repr((key, FrameCache._source_stamp(key)))).hexdigest()))
+
+    def _disk_files(self):
+        return [os.path.join(self.directory_, fn)
+                for fn in os.listdir(self.directory_) if fn.endswith('.npz')]
+
+    def _load(self, key):
+        fn = self.filename(key)
+        if not os.path.exists(fn):
+            return None
+        try:
+            frame = np.load(fn)['frame']
+        except Exception, e:
+            print('{} :: Failed to load {} ({})'.format(self.__class__.__name__, fn, e))
+            return None
+
+        # Mark as recently used (for pruning)
+        try:
+            os.utime(fn, None)
+        except OSError:
+            pass
+        return frame
+
+    def _save(self, key, frame):
+        """ Atomically write the frame (ignored if the directory is not writable) """
+        fn = self.filename(key)
+        if os.path.exists(fn):
+            return
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(suffix='.npz.tmp', dir=self.directory_)
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, frame=frame)
+            os.rename(tmp, fn)
+        except (IOError, OSError), e:
+            print('{} :: Failed to save {} ({})'.format(self.__class__.__name__, fn, e))
+            return
+        finally:
+            # Partially written frames are not counted, nor pruned
+            if tmp is not None and os.path.exists(tmp):
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+        with self.lock_:
+            self.disk_nbytes_ += os.path.getsize(fn)
+            prune = self.disk_nbytes_ > self.maxdiskbytes_
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """ Delete the least-recently used files until within maxdiskbytes """
+        files = []
+        for fn in self._disk_files():
+            try:
+                st = os.stat(fn)
+                files.append((st.st_mtime, st.st_size, fn))
+            except OSError:
+                pass
+        files.sort()
+        nbytes = sum(size for (_, size, _) in files)
+        for (_, size, fn) in files:
+            if nbytes <= self.maxdiskbytes_:
+                break
+            try:
+                os.remove(fn)
+                nbytes -= size
+            except OSError:
+                pass
+        with self.lock_:
+            self.disk_nbytes_ = nbytes
+
+    def clear_disk(self):
+        """ Delete the on-disk tier """
+        if self.directory_ is None:
+            return
+        for fn in self._disk_files():
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+        with self.lock_:
+            self.disk_nbytes_ = 0
+
+    # Lookup
+
+    def _insert(self, key, frame):
+        evicted = []
+        with self.lock_:
+            if key in self.frames_:
+                return self.frames_[key]
+            self.frames_[key] = frame
+            self.nbytes_ += frame.nbytes
+            while self.nbytes_ > self.maxbytes_ and len(self.frames_) > 1:
+                k, f = self.frames_.popitem(last=False)
+                self.nbytes_ -= f.nbytes
+                self.evictions_ += 1
+                evicted.append((k, f))
+
+        # Spill outside of the lock
+        if self.directory_ is not None:
+            for k, f in evicted:
+                self._save(k, f)
+        return frame
+
+    def get(self, key, loader):
+        """
+        Cached frame for key, or loader() (inserted into the cache)
+        """
+        with self.lock_:
+            frame = self.frames_.pop(key, None)
+            if frame is not None:
+                self.frames_[key] = frame
+                self.hits_ += 1
+                return frame
+            self.misses_ += 1
+
+        frame = self._load(key) if self.directory_ is not None else None
+        if frame is not None:
+            with self.lock_:
+                self.disk_hits_ += 1
+        else:
+            frame = loader()
+            if not isinstance(frame, np.ndarray):
+                return frame
+        frame.flags.writeable = False
+        if frame.nbytes > self.maxbytes_:
+            return frame
+        return self._insert(key, frame)
+
+    def clear(self):
+        with self.lock_:
+            self.frames_.clear()
+            self.nbytes_ = 0
+
+# Process-wide frame cache, shared by readers with cache=True
+frame_cache = FrameCache()
+
+def get_frame_cache(cache):
+    """ FrameCache for a reader's cache argument (True: shared cache, None / False: no cache) """
+    if cache is True:
+        return frame_cache
+    return None if cache is None or cache is False else cache
@@ -0,0 +1,240 @@
+"""
+Packed, memory-mapped dataset format for image / stereo sequences
+
+pack_dataset() converts a sequence of fixed-shape uint8 frames (e.g.
+an ImageDatasetReader, or the (left, right) pairs of a
+StereoDatasetReader) into a single file, with optional timestamps and
+poses. PackedDatasetReader then iterates over it with np.memmap views
+(zero-copy for raw frames), with random access and strided
+every_k_frames, instead of decoding thousands of small PNGs.
+
+File layout:
+   [magic (8 bytes)][header offset (uint64)][padding]
+   [frame data, 4096-aligned]
+   [index (offsets, sizes), timestamps, poses]
+   [JSON header]
+
+Frames are stored raw ([N x S x H x W (x C)] uint8, for S streams),
+or individually zlib-compressed (compress=1..9), in which case they
+are decompressed on access.
+"""
+
+# License: MIT
+
+import os
+import json
+import zlib
+import struct
+import numpy as np
+
+from pybot.geometry.rigid_transform import RigidTransformArray
+
+MAGIC = 'PYBOTPK1'
+ALIGNMENT = 4096
+
+def _as_pose_data(poses):
+    """ [N x 7] (xyzw, tvec) from RigidTransformArray, RigidTransforms, or [N x 4 x 4] """
+    if isinstance(poses, RigidTransformArray):
+        return poses.data
+    elif isinstance(poses, np.ndarray) and poses.ndim == 3:
+        return RigidTransformArray.from_matrix(poses).data
+    return RigidTransformArray.from_list(list(poses)).data
+
+def _align(f, alignment=ALIGNMENT):
+    pad = (-f.tell()) % alignment
+    if pad:
+        f.write('\0' * pad)
+    return f.tell()
+
+def pack_dataset(filename, frames, timestamps=None, poses=None, compress=0,
+                 every_k_frames=1, max_frames=None, verbose=False):
+    """
+    Pack a sequence of fixed-shape uint8 frames into filename
+
+    frames: DatasetReader / StereoDatasetReader (iterated with
+       every_k_frames), or any iterable of frames, or of tuples of
+       frames (one per stream, e.g. (left, right))
+    timestamps: Optional [N] timestamps (of the packed frames)
+    poses: Optional RigidTransformArray, list of RigidTransforms,
+       or [N x 4 x 4] poses (of the packed frames)
+    compress: zlib compression level (0: raw, memory-mappable frames)
+
+    Returns the number of packed frames
+    """
+    if hasattr(frames, 'iteritems'):
+        frames = frames.iteritems(every_k_frames=every_k_frames)
+    elif every_k_frames != 1:
+        raise ValueError('pack_dataset every_k_frames requires a dataset reader')
+
+    filename = os.path.expanduser(filename)
+    tmp = filename + '.tmp'
+    shape, streams, offsets, sizes = None, None, [], []
+
+    # Write to a temporary file, renamed once complete (and removed
+    # if packing fails)
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', 0))
+            data_offset = _align(f)
+
+            for idx, frame in enumerate(frames):
+                if max_frames is not None and idx >= max_frames:
+                    break
+                frame = tuple(frame) if isinstance(frame, (tuple, list)) else (frame,)
+                frame = np.ascontiguousarray(np.stack(frame))
+                if frame.dtype != np.uint8:
+                    raise ValueError('pack_dataset expects uint8 frames, provided {}'.format(frame.dtype))
+                if shape is None:
+                    streams, shape = frame.shape[0], frame.shape[1:]
+                elif frame.shape != (streams,) + shape:
+                    raise ValueError('pack_dataset expects fixed-shape frames, provided {} != {}'
+                                     .format(frame.shape, (streams,) + shape))
+
+                buf = frame.tostring() if not compress else zlib.compress(frame.tostring(), compress)
+                offsets.append(f.tell() - data_offset)
+                sizes.append(len(buf))
+                f.write(buf)
+                if verbose and idx % 100 == 0:
+                    print('pack_dataset :: Packed {} frames'.format(idx+1))
+
+            N = len(offsets)
+            if not N:
+                raise ValueError('pack_dataset :: No frames to pack')
+            header = dict(version=1, count=N, streams=streams, shape=list(shape),
+                          dtype='uint8', compress=int(compress), data_offset=data_offset, arrays={})
+
+            # Index, timestamps and poses
+            arrays = dict(offsets=np.uint64(offsets), sizes=np.uint64(sizes))
+            if timestamps is not None:
+                arrays['timestamps'] = np.float64(timestamps).ravel()
+            if poses is not None:
+                arrays['poses'] = np.float64(_as_pose_data(poses))
+            for name, arr in sorted(arrays.iteritems()):
+                if len(arr) != N:
+                    raise ValueError('pack_dataset {} length mismatch {} != {}'.format(name, len(arr), N))
+                header['arrays'][name] = dict(offset=_align(f, 8), shape=list(arr.shape), dtype=arr.dtype.str)
+                f.write(np.ascontiguousarray(arr).tostring())
+
+            header_offset = f.tell()
+            f.write(json.dumps(header))
+            f.seek(len(MAGIC))
+            f.write(struct.pack('<Q', header_offset))
+        os.rename(tmp, filename)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return N
+
+class PackedDatasetReader(object):
+    """
+    Reader for packed datasets (see pack_dataset)
+
+    Frames [H x W (x C)] are returned as np.memmap views (read-only,
+    zero-copy) for raw files, one per stream: iteration yields a frame
+    for single-stream files, and a tuple of frames (e.g. (left, right))
+    otherwise.
+
+    >> pack_dataset('~/data/kitti_00.pack', StereoDatasetReader(...), poses=...)
+    >> reader = PackedDatasetReader('~/data/kitti_00.pack')
+    >> for left, right in reader.iteritems(every_k_frames=2): ...
+    """
+    def __init__(self, filename):
+        self.filename_ = os.path.expanduser(filename)
+        with open(self.filename_, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError('{} :: {} is not a packed dataset'
+                                 .format(self.__class__.__name__, self.filename_))
+            header_offset, = struct.unpack('<Q', f.read(8))
+            f.seek(header_offset)
+            self.header_ = json.loads(f.read())
+
+        h = self.header_
+        self.count_, self.streams_, self.shape_ = h['count'], h['streams'], tuple(h['shape'])
+        self.compress_ = h['compress']
+        self.arrays_ = dict((name, np.memmap(self.filename_, dtype=np.dtype(str(a['dtype'])), mode='r',
+                                             offset=a['offset'], shape=tuple(a['shape'])))
+                            for name, a in h['arrays'].iteritems())
+        self.data_ = np.memmap(self.filename_, dtype=np.uint8, mode='r',
+                               offset=h['data_offset'], shape=(header_offset - h['data_offset'],))
+        self.frames_ = None if self.compress_ else \
+                       self.data_[:self.count_ * self.frame_size].reshape((self.count_, self.streams_) + self.shape_)
+
+    def __repr__(self):
+        return '{}: {}, frames: {}, streams: {}, shape: {}, compress: {}, arrays: {}'.format(
+            self.__class__.__name__, self.filename_, self.count_, self.streams_, self.shape_,
+            self.compress_, sorted(self.arrays_.keys()))
+
+    def __len__(self):
+        return self.count_
+
+    @property
+    def length(self):
+        return self.count_
+
+    @property
+    def frame_size(self):
+        return self.streams_ * int(np.prod(self.shape_))
+
+    def _frame(self, idx):
+        """ [S x H x W (x C)] frame idx """
+        if self.frames_ is not None:
+            return self.frames_[idx]
+        start = int(self.arrays_['offsets'][idx])
+        buf = zlib.decompress(self.data_[start:start + int(self.arrays_['sizes'][idx])].tostring())
+        return np.frombuffer(buf, dtype=np.uint8).reshape((self.streams_,) + self.shape_)
+
+    def _item(self, frame):
+        return frame[0] if self.streams_ == 1 else tuple(frame)
+
+    def __getitem__(self, idx):
+        if idx < -self.count_ or idx >= self.count_:
+            raise IndexError('{} :: Index {} out of range [0, {})'
+                             .format(self.__class__.__name__, idx, self.count_))
+        return self._item(self._frame(idx % self.count_))
+
+    def iteritems(self, every_k_frames=1, reverse=False, **kwargs):
+        """ Frames (views into the memory-mapped file, for raw files) """
+        inds = np.arange(0, self.count_, every_k_frames)
+        return self.iterinds(inds[::-1] if reverse else inds)
+
+    def iterinds(self, inds, reverse=False, **kwargs):
+        inds = np.asarray(inds).astype(int)
+        if reverse:
+            inds = inds[::-1]
+        for idx in inds:
+            yield self[idx]
+
+    def iter_stereo_frames(self, *args, **kwargs):
+        if self.streams_ != 2:
+            raise RuntimeError('{} :: Not a stereo dataset ({} streams)'
+                               .format(self.__class__.__name__, self.streams_))
+        return self.iteritems(*args, **kwargs)
+
+    @property
+    def frames(self):
+        """ [N x S x H x W (x C)] memory-mapped frames (raw files only) """
+        if self.frames_ is None:
+            raise RuntimeError('{} :: Compressed frames cannot be memory-mapped'
+                               .format(self.__class__.__name__))
+        return self.frames_
+
+    @property
+    def streams(self):
+        return self.streams_
+
+    @property
+    def shape(self):
+        return self.shape_
+
+    @property
+    def timestamps(self):
+        return self.arrays_.get('timestamps', None)
+
+    @property
+    def poses(self):
+        """ Poses of the frames (RigidTransformArray, backed by the file) """
+        if 'poses' not in self.arrays_:
+            return None
+        return RigidTransformArray.from_data(self.arrays_['poses'], copy=False)
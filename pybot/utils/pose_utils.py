@@ -8,6 +8,7 @@ from abc import ABCMeta, abstractmethod
 from itertools import imap
 from pybot.utils.misc import print_green, print_red
 from pybot.utils.misc import Counter, Accumulator, CounterWithPeriodicCallback 
+from pybot.geometry.rigid_transform import RigidTransform, RigidTransformArray
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -142,17 +143,15 @@ class PoseSampler(Sampler):
             return True
 
         pose = self.get_sample(item)
-        pinv = pose.inverse()
 
-        # Check starting from new to old items
-        # print '------------'
-        for p in reversed(self.q_): 
-            newp = pinv * self.get_sample(p)
-            d, r = np.linalg.norm(newp.tvec), np.fabs(newp.to_rpyxyz()[:3])
-            if d < self.displacement_ and (r < self.theta_).all(): 
-                return False
-
-        return True
+        # Relative poses w.r.t. all items in the history,
+        # converted to rpy in a single batched call
+        if not len(self.q_): 
+            return True
+        history = RigidTransformArray.from_list([self.get_sample(p) for p in self.q_])
+        rpyxyz = history.ominus(pose).to_rpyxyz()
+        d, r = np.linalg.norm(rpyxyz[:,3:], axis=1), np.fabs(rpyxyz[:,:3])
+        return not np.any((d < self.displacement_) & (r < self.theta_).all(axis=1))
 
     # def visualize(self, finish=False): 
     #     # # RPY
@@ -197,62 +196,41 @@ class PoseSampler(Sampler):
     #     plt.show(block=finish)
 
 
-# class FrustumVolumeIntersectionPoseSampler(Sampler): 
-#     def __init__(self, iou=0.5, depth=20, fov=np.deg2rad(60), lookup_history=10, 
-#                  get_sample=lambda item: item, 
-#                  on_sampled_cb=lambda index, item: None, verbose=False): 
-#         Sampler.__init__(self, lookup_history=lookup_history, 
-#                          get_sample=get_sample, 
-#                          on_sampled_cb=on_sampled_cb, verbose=verbose)
-#         self.iou_ = iou
-#         self.depth_ = depth
-#         self.fov_ = fov
-        
-#         from pybot.geometry.rigid_transform import RigidTransform
-#         from pybot.vision.camera_utils import Frustum
-#         from bot_graphics.volumes import SweepingFrustum
-
-#         self.volume_ = SweepingFrustum()
-#         self.get_frustum = lambda pose: Frustum(pose, zmin=0.05, zmax=self.depth_, fov=self.fov_)
-
-#         # Get canonical volume
-#         fverts = self.get_frustum(RigidTransform.identity()).get_vertices()
-
-#         print 'Adding basic shape'
-#         self.volume_.add_vertices(fverts)
-#         self.fvol_ = self.volume_.get_volume()
-#         self.volume_.clear()
-
-#     def check_sample(self, item):
-#         if self.force_check(): 
-#             return True
-        
-#         pose = self.get_sample(item)
-#         # pinv = pose.inverse()
+class FrustumVolumeIntersectionPoseSampler(Sampler): 
+    """
+    Sample poses whose view frustum overlaps (volume IoU) less than 
+    iou with the frustums of all the poses in the history. IoU is 
+    estimated with fixed Monte-Carlo samples for the whole history 
+    at once (see camera_utils.batch_frustum_overlap)
 
-#         fverts = self.get_frustum(pose).get_vertices()
-        
-#         # Check starting from new to old items
-#         # print '------------'
-#         for p in reversed(self.q_): 
-#             verts = self.get_frustum(self.get_sample(p)).get_vertices()
+    depth: Far plane of the frustum [m]
+    fov: Horizontal field of view (4:3 aspect ratio)
+    """
+    def __init__(self, iou=0.5, depth=20, fov=np.deg2rad(60), zmin=0.05, num_samples=500, 
+                 lookup_history=10, 
+                 get_sample=lambda item: item, 
+                 on_sampled_cb=lambda index, item: None, verbose=False): 
+        Sampler.__init__(self, lookup_history=lookup_history, 
+                         get_sample=get_sample, 
+                         on_sampled_cb=on_sampled_cb, verbose=verbose)
+        if fov >= np.pi: 
+            raise ValueError('Frustum fov cannot be {} radians'.format(fov))
 
-#             self.volume_.clear()
-#             self.volume_.add_vertices(fverts)
-#             self.volume_.add_vertices(verts)
-#             assert(self.volume_.volume_.getNumComponents() > 0)
-#             intersection = self.volume_.get_volume()
-#             union = self.fvol_ * 2 - intersection
-#             print intersection, self.fvol_ * 2, self.fvol_
-#             # print p, self.volume_.get_volume()
+        from pybot.vision.camera_utils import batch_frustum_overlap
+        rx = np.tan(fov / 2)
+        self.iou_ = iou
+        self.get_overlap = lambda poses, pose: batch_frustum_overlap(
+            poses, [pose], zmin=zmin, zmax=depth, rx=rx, ry=rx * 0.75, num_samples=num_samples)
 
-#             # newp = pinv * self.get_sample(p)
-#             # d, r = np.linalg.norm(newp.tvec), np.fabs(newp.to_rpyxyz()[:3])
-#             # print r, d < self.displacement_, (r < self.theta_).all(), newp
-#             # if d < self.displacement_ and (r < self.theta_).all(): 
-#             #     return False
+    def check_sample(self, item):
+        if self.force_check(): 
+            return True
+        if not len(self.q_): 
+            return True
 
-#         return True
+        pose = self.get_sample(item)
+        history = RigidTransformArray.from_list([self.get_sample(p) for p in self.q_])
+        return not np.any(self.get_overlap(history, pose) >= self.iou_)
 
 
 Keyframe = namedtuple('Keyframe', ['img', 'pose', 'index'], verbose=False)
@@ -266,14 +244,14 @@ class KeyframeSampler(PoseSampler):
                              get_sample=get_sample, 
                              on_sampled_cb=on_sampled_cb, verbose=verbose)
 
-# class KeyframeVolumeSampler(FrustumVolumeIntersectionPoseSampler): 
-#     def __init__(self, iou=0.5, depth=20, fov=np.deg2rad(60), lookup_history=10, 
-#                  get_sample=lambda item: item.pose,  
-#                  on_sampled_cb=lambda index, item: None, verbose=False): 
-#         FrustumVolumeIntersectionPoseSampler.__init__(self, iou=iou, depth=depth, fov=fov, 
-#                                                       lookup_history=lookup_history, 
-#                                                       get_sample=get_sample, 
-#                                                       on_sampled_cb=on_sampled_cb, verbose=verbose)
+class KeyframeVolumeSampler(FrustumVolumeIntersectionPoseSampler): 
+    def __init__(self, iou=0.5, depth=20, fov=np.deg2rad(60), lookup_history=10, 
+                 get_sample=lambda item: item.pose,  
+                 on_sampled_cb=lambda index, item: None, verbose=False): 
+        FrustumVolumeIntersectionPoseSampler.__init__(self, iou=iou, depth=depth, fov=fov, 
+                                                      lookup_history=lookup_history, 
+                                                      get_sample=get_sample, 
+                                                      on_sampled_cb=on_sampled_cb, verbose=verbose)
 
 
 class PoseAccumulator(Accumulator): 
@@ -298,18 +276,183 @@ class PoseAccumulator(Accumulator):
         """ pose of [t] wrt [0]:  p_0t = p_w0.inverse() * p_wt """  
         return (self.init_.inverse()).oplus(pose_wt)
 
+class PoseTrajectory(object): 
+    """
+    Timestamp-indexed trajectory store 
+
+    Poses are kept sorted by timestamp in a RigidTransformArray, and
+    queried with a binary search over the timestamps followed by a
+    batched SLERP (rotation) / linear (translation) interpolation
+    between the bracketing poses.
+
+    max_gap: Do not interpolate between poses further apart than this
+    max_extrapolation: Hold the first/last pose for queries at most
+       this far outside the trajectory, anything beyond is invalid
+    (both in the units of the provided timestamps)
+
+    """
+    def __init__(self, timestamps=[], poses=[], max_gap=np.inf, max_extrapolation=0.): 
+        self.max_gap_ = max_gap
+        self.max_extrapolation_ = max_extrapolation
+
+        self.ts_ = np.empty(0, dtype=np.float64)
+        self.poses_ = RigidTransformArray.from_list([])
+        self.pending_ = []
+        self.extend(timestamps, poses)
+
+    def __repr__(self): 
+        self._consolidate()
+        return '{}: poses: {}, t: [{}, {}]'.format(
+            self.__class__.__name__, len(self), 
+            self.ts_[0] if len(self) else None, 
+            self.ts_[-1] if len(self) else None)
+
+    def __len__(self): 
+        self._consolidate()
+        return len(self.ts_)
+
+    def __getitem__(self, i): 
+        self._consolidate()
+        return self.ts_[i], self.poses_[i]
+
+    @classmethod
+    def from_items(cls, items, **kwargs): 
+        """ From (timestamp, pose) tuples """
+        items = list(items)
+        if not len(items): 
+            return cls(**kwargs)
+        ts, poses = zip(*items)
+        return cls(ts, list(poses), **kwargs)
+
+    def append(self, t, pose): 
+        self.extend([t], [pose])
+
+    def extend(self, timestamps, poses): 
+        """ 
+        Add (timestamp, pose) measurements, poses are either a list of
+        RigidTransforms or a RigidTransformArray. Measurements are
+        buffered, and sorted into the trajectory on the next query.
+        """
+        if not isinstance(poses, RigidTransformArray): 
+            poses = RigidTransformArray.from_list(poses)
+        ts = np.asarray(timestamps, dtype=np.float64).ravel()
+        if len(ts) != len(poses): 
+            raise ValueError('Timestamps and poses have different lengths {} != {}'
+                             .format(len(ts), len(poses)))
+        if len(ts): 
+            self.pending_.append((ts, poses.data))
+
+    def _consolidate(self): 
+        if not len(self.pending_): 
+            return
+
+        ts = np.concatenate([self.ts_] + [t for (t, _) in self.pending_])
+        data = np.vstack([self.poses_.data] + [d for (_, d) in self.pending_])
+        self.pending_ = []
+        
+        # Streams are typically in order, only sort when necessary
+        if np.any(np.diff(ts) < 0): 
+            inds = np.argsort(ts, kind='mergesort')
+            ts, data = ts[inds], data[inds]
+        self.ts_, self.poses_ = ts, RigidTransformArray.from_data(data, copy=False)
+
+    def find(self, t): 
+        """ 
+        Binary search for the index of the last pose at or before t 
+        (-1 if t is before the trajectory)
+        """
+        self._consolidate()
+        return np.searchsorted(self.ts_, t, side='right') - 1
+
+    def nearest(self, t): 
+        """ Index of the pose closest in time to t """
+        self._consolidate()
+        N = len(self.ts_)
+        i = np.clip(self.find(t), 0, max(N-2, 0))
+        j = np.minimum(i + 1, N-1)
+        return np.where(np.fabs(t - self.ts_[i]) <= np.fabs(self.ts_[j] - t), i, j)
+
+    def query(self, t): 
+        """
+        Interpolated poses at the query timestamps t 
+
+        t [scalar]: returns RigidTransform, or None if the 
+           query is outside the extrapolation limits 
+        t [N]: returns (RigidTransformArray [N], valid [N])
+        """
+        self._consolidate()
+        N = len(self.ts_)
+        if N == 0: 
+            raise RuntimeError('{} :: Cannot query an empty trajectory'
+                               .format(self.__class__.__name__))
+
+        tq = np.asarray(t, dtype=np.float64)
+        scalar = tq.ndim == 0
+        tq = np.atleast_1d(tq).ravel()
+
+        ts = self.ts_
+        valid = (tq >= ts[0] - self.max_extrapolation_) & \
+                (tq <= ts[-1] + self.max_extrapolation_)
+
+        if N == 1: 
+            poses = self.poses_[np.zeros(len(tq), dtype=np.int64)]
+        else: 
+            # Bracketing poses [i, i+1], and weights (clamped when
+            # extrapolating, i.e. hold the first/last pose)
+            i = np.clip(np.searchsorted(ts, tq, side='right') - 1, 0, N-2)
+            dt = ts[i+1] - ts[i]
+            w = np.clip((tq - ts[i]) / np.where(dt > 0, dt, 1), 0, 1)
+            # (queries exactly at a measurement are valid across gaps)
+            inside = (tq > ts[0]) & (tq < ts[-1])
+            valid &= ~inside | (dt <= self.max_gap_) | (tq == ts[i])
+            poses = self.poses_[i].interpolate(self.poses_[i+1], w)
+
+        if scalar: 
+            return poses[0] if valid[0] else None
+        return poses, valid
+
+    @property
+    def timestamps(self): 
+        self._consolidate()
+        return self.ts_
+
+    @property
+    def poses(self): 
+        self._consolidate()
+        return self.poses_
+
 class PoseInterpolator(PoseAccumulator): 
-    def __init__(self, maxlen=100, relative=False): 
+    """
+    Sliding window over the latest (timestamp, pose) measurements,
+    that can be queried at arbitrary timestamps (see PoseTrajectory). 
+    The trajectory of the window is built once, and re-used by all 
+    the queries until the next add()
+    """
+    def __init__(self, maxlen=100, relative=False, max_gap=np.inf, max_extrapolation=0.): 
         PoseAccumulator.__init__(self, maxlen=maxlen, relative=relative)
 
         self.relative_ = relative
         self.init_ = None
+        self.timestamps_ = deque(maxlen=maxlen)
+        self.max_gap_ = max_gap
+        self.max_extrapolation_ = max_extrapolation
+        self.trajectory_ = None
         
-    def add(self, pose): 
+    def add(self, t, pose): 
+        self.timestamps_.append(t)
         super(PoseAccumulator, self).accumulate(pose)
+        self.trajectory_ = None
 
-    def query(self, pose): 
-        raise NotImplementedError()
+    @property
+    def trajectory(self): 
+        if self.trajectory_ is None: 
+            self.trajectory_ = PoseTrajectory(self.timestamps_, list(self.items_), 
+                                              max_gap=self.max_gap_, 
+                                              max_extrapolation=self.max_extrapolation_)
+        return self.trajectory_
+
+    def query(self, t): 
+        return self.trajectory.query(t)
 
 class SkippedPoseAccumulator(PoseAccumulator): 
     def __init__(self, skip=10, **kwargs): 
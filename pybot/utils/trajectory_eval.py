@@ -0,0 +1,231 @@
+"""
+Vectorized trajectory evaluation: Umeyama (SE(3) / Sim(3)) alignment,
+absolute trajectory error (ATE), and KITTI-style relative pose error
+(RPE) over multiple segment lengths.
+
+All metrics operate on RigidTransformArray stacks (or KITTI-format
+pose files), and evaluate every pose / segment in a single vectorized
+pass. Multiple runs can be evaluated in parallel across processes
+with evaluate_trajectories.
+
+Ref:
+   S. Umeyama, Least-squares estimation of transformation parameters
+   between two point patterns, PAMI 1991
+   J. Sturm et al., A Benchmark for the Evaluation of RGB-D SLAM
+   Systems, IROS 2012
+   A. Geiger et al., Are we ready for Autonomous Driving? The KITTI
+   Vision Benchmark Suite, CVPR 2012
+"""
+# License: MIT
+
+import numpy as np
+from collections import namedtuple
+from multiprocessing import Pool
+
+from pybot.geometry.rigid_transform import RigidTransformArray
+from pybot.utils.dataset.kitti import kitti_load_pose_array
+
+# KITTI odometry benchmark segment lengths [m]
+KITTI_SEGMENT_LENGTHS = (100, 200, 300, 400, 500, 600, 700, 800)
+
+ErrorStats = namedtuple('ErrorStats', ['rmse', 'mean', 'median', 'std', 'min', 'max'])
+Alignment = namedtuple('Alignment', ['R', 't', 'scale'])
+SegmentErrors = namedtuple('SegmentErrors', ['first', 'last', 'length', 'speed', 't_err', 'r_err'])
+TrajectoryEvaluation = namedtuple('TrajectoryEvaluation',
+                                  ['ate', 'ate_stats', 'rpe', 't_err', 'r_err', 'alignment'])
+
+###############################################################################
+# Helpers
+
+def _as_pose_array(poses):
+    """ RigidTransformArray from a KITTI pose file, list of poses, or [N x 4 x 4] """
+    if isinstance(poses, RigidTransformArray):
+        return poses
+    elif isinstance(poses, basestring):
+        return kitti_load_pose_array(poses)
+    elif isinstance(poses, np.ndarray):
+        return RigidTransformArray.from_matrix(poses)
+    return RigidTransformArray.from_list(poses)
+
+def error_stats(err):
+    """ Summary statistics of a set of errors """
+    err = np.asarray(err, dtype=np.float64)
+    if not len(err):
+        return ErrorStats(*([np.nan] * 6))
+    return ErrorStats(rmse=np.sqrt(np.mean(err * err)), mean=np.mean(err),
+                      median=np.median(err), std=np.std(err),
+                      min=np.min(err), max=np.max(err))
+
+def rotation_angle(quat):
+    """ Rotation angles [rad] of [N x 4] (xyzw) quaternions, in [0, pi] """
+    q = np.asarray(quat, dtype=np.float64)
+    return 2. * np.arctan2(np.linalg.norm(q[:,:3], axis=1), np.fabs(q[:,3]))
+
+###############################################################################
+# Alignment
+
+def umeyama_alignment(X, Y, with_scale=False):
+    """
+    Least-squares similarity (R, t, s) that aligns the [N x 3]
+    point set X to Y, i.e. Y ~= s * R * X + t
+
+    with_scale: estimate scale (Sim(3)), else s = 1 (SE(3))
+    Returns Alignment(R, t, scale)
+    """
+    X, Y = np.asarray(X, dtype=np.float64), np.asarray(Y, dtype=np.float64)
+    if X.shape != Y.shape or X.ndim != 2 or X.shape[1] != 3:
+        raise ValueError('umeyama_alignment expects two [N x 3] point sets, provided {:}, {:}'
+                         .format(X.shape, Y.shape))
+    if len(X) < 3:
+        raise ValueError('umeyama_alignment requires at least 3 points, provided {:}'.format(len(X)))
+
+    mx, my = X.mean(axis=0), Y.mean(axis=0)
+    Xc, Yc = X - mx, Y - my
+    var_x = np.sum(Xc * Xc) / len(X)
+    U, D, Vt = np.linalg.svd(np.dot(Yc.T, Xc) / len(X))
+
+    # Reflection correction
+    S = np.ones(3)
+    if np.linalg.det(U) * np.linalg.det(Vt) < 0:
+        S[2] = -1
+    R = np.dot(U * S, Vt)
+    s = np.dot(D, S) / var_x if with_scale else 1.0
+    t = my - s * np.dot(R, mx)
+    return Alignment(R=R, t=t, scale=s)
+
+def align_trajectory(est, gt, with_scale=False, num_poses=None):
+    """
+    Align the estimated trajectory to ground truth using the
+    positions of the first num_poses poses (default: all)
+
+    Returns the aligned RigidTransformArray, and the Alignment
+    """
+    est, gt = _as_pose_array(est), _as_pose_array(gt)
+    if len(est) != len(gt):
+        raise ValueError('align_trajectory length mismatch {:} != {:}'.format(len(est), len(gt)))
+    n = len(est) if num_poses is None else num_poses
+    A = umeyama_alignment(est.tvec[:n], gt.tvec[:n], with_scale=with_scale)
+
+    T = np.zeros((len(est),4,4))
+    T[:,:3,:3] = np.matmul(A.R, est.R)
+    T[:,:3,3] = A.scale * np.dot(est.tvec, A.R.T) + A.t
+    T[:,3,3] = 1
+    return RigidTransformArray.from_matrix(T), A
+
+###############################################################################
+# Metrics
+
+def absolute_trajectory_error(est, gt, align=True, with_scale=False):
+    """
+    Absolute trajectory error: per-pose translational error [N]
+    after (optionally) aligning est to gt
+    """
+    est, gt = _as_pose_array(est), _as_pose_array(gt)
+    if align:
+        est, _ = align_trajectory(est, gt, with_scale=with_scale)
+    return np.linalg.norm(est.tvec - gt.tvec, axis=1)
+
+def trajectory_distances(poses):
+    """ Cumulative distance travelled [N] along the trajectory """
+    poses = _as_pose_array(poses)
+    d = np.zeros(len(poses))
+    d[1:] = np.cumsum(np.linalg.norm(np.diff(poses.tvec, axis=0), axis=1))
+    return d
+
+def segment_indices(dist, length, step=10):
+    """
+    KITTI-style sliding windows: for every step-th first frame,
+    the first frame that is more than length further along the
+    trajectory (given cumulative distances dist [N])
+
+    Returns (first, last) index arrays of the valid windows
+    """
+    dist = np.asarray(dist, dtype=np.float64)
+    first = np.arange(0, len(dist), step)
+    last = np.searchsorted(dist, dist[first] + length, side='right')
+    valid = last < len(dist)
+    return first[valid], last[valid]
+
+def relative_pose_error(est, gt, lengths=KITTI_SEGMENT_LENGTHS, step=10, fps=10.):
+    """
+    Relative pose error over segments of the given lengths [m]
+    (measured along the ground truth), KITTI odometry devkit style
+
+    For each segment (first, last), the error between the
+    relative motions is E = (est_f^-1 est_l)^-1 (gt_f^-1 gt_l), and
+       t_err = |t(E)| / length [m/m]
+       r_err = angle(E) / length [rad/m]
+       speed = length / ((last - first + 1) / fps) [m/s]
+
+    Returns a list of SegmentErrors, one for every length
+    """
+    est, gt = _as_pose_array(est), _as_pose_array(gt)
+    if len(est) != len(gt):
+        raise ValueError('relative_pose_error length mismatch {:} != {:}'.format(len(est), len(gt)))
+
+    dist = trajectory_distances(gt)
+    errors = []
+    for length in lengths:
+        first, last = segment_indices(dist, length, step=step)
+        dgt = gt[last].ominus(gt[first])
+        dest = est[last].ominus(est[first])
+        E = dgt.ominus(dest)
+        errors.append(SegmentErrors(
+            first=first, last=last, length=length,
+            speed=length / ((last - first + 1) / float(fps)),
+            t_err=np.linalg.norm(E.tvec, axis=1) / length,
+            r_err=rotation_angle(E.xyzw) / length))
+    return errors
+
+def evaluate_trajectory(est, gt, align=True, with_scale=False,
+                        lengths=KITTI_SEGMENT_LENGTHS, step=10, fps=10.):
+    """
+    Evaluate an estimated trajectory against ground truth
+    (RigidTransformArrays or KITTI-format pose files)
+
+    Returns TrajectoryEvaluation with the per-pose ATE [N] and its
+    statistics, the per-length RPE segments, the average translational
+    [m/m] and rotational [rad/m] RPE over all segments, and the alignment
+    """
+    est, gt = _as_pose_array(est), _as_pose_array(gt)
+    alignment = None
+    if align:
+        aligned, alignment = align_trajectory(est, gt, with_scale=with_scale)
+    else:
+        aligned = est
+    ate = np.linalg.norm(aligned.tvec - gt.tvec, axis=1)
+
+    # RPE is invariant to (SE(3)) alignment, but not to scale
+    rpe = relative_pose_error(aligned if with_scale else est, gt,
+                              lengths=lengths, step=step, fps=fps)
+    t_err = np.concatenate([e.t_err for e in rpe])
+    r_err = np.concatenate([e.r_err for e in rpe])
+    return TrajectoryEvaluation(ate=ate, ate_stats=error_stats(ate), rpe=rpe,
+                                t_err=np.mean(t_err) if len(t_err) else np.nan,
+                                r_err=np.mean(r_err) if len(r_err) else np.nan,
+                                alignment=alignment)
+
+def _evaluate_trajectory_star(args):
+    est, gt, kwargs = args
+    return evaluate_trajectory(est, gt, **kwargs)
+
+def evaluate_trajectories(pairs, processes=None, chunksize=1, **kwargs):
+    """
+    Evaluate many (est, gt) trajectory pairs across processes,
+    see evaluate_trajectory for kwargs. Passing filenames avoids
+    pickling the trajectories to the workers.
+
+    processes: number of worker processes (default: cpu_count),
+       1 evaluates serially in this process
+    Returns a list of TrajectoryEvaluation (in the order of pairs)
+    """
+    jobs = [(est, gt, kwargs) for (est, gt) in pairs]
+    if processes == 1 or len(jobs) <= 1:
+        return map(_evaluate_trajectory_star, jobs)
+
+    pool = Pool(processes=processes)
+    try:
+        return pool.map(_evaluate_trajectory_star, jobs, chunksize=chunksize)
+    finally:
+        pool.close()
+        pool.join()
@@ -1,17 +1,24 @@
 # Author: Sudeep Pillai <spillai@csail.mit.edu>
 # License: MIT
 
+import os
 import cv2
+import warnings
 
 import numpy as np
 from numpy.linalg import det, norm
+from collections import OrderedDict
 import numpy.matlib as npm
 from scipy import linalg
 
 from pybot.vision.color_utils import get_color_by_label
 from pybot.vision.image_utils import to_color
 from pybot.utils.db_utils import AttrDict
-from pybot.geometry.rigid_transform import Quaternion, RigidTransform
+from pybot.geometry.rigid_transform import Quaternion, RigidTransform, RigidTransformArray, skew
+from pybot.vision.zbuffer import ZBuffer
+from pybot.vision.undistort_utils import get_undistort_rectify_map, undistort_rectify_image
+from pybot.vision.reconstruction_utils import CloudReconstructor
+from pybot.vision.stereo_geometry import StereoGeometry
 
 kinect_v1_params = AttrDict(
     K_depth = np.array([[576.09757860, 0, 319.5],
@@ -90,6 +97,134 @@ def triangulate_points(cam1, pts1, cam2, pts2):
     assert(isinstance(pts1, np.ndarray) and isinstance(pts2, np.ndarray))
     X = cv2.triangulatePoints(cam1.P, cam2.P, pts1.reshape(-1,1,2), pts2.reshape(-1,1,2)).T 
     return X[:,:3] / colvec(X[:,3])
+
+def _projection_stack(cameras): 
+    """ [V x 3 x 4] projection matrices from a list of Cameras (or matrices) """
+    return np.float64([c.P if isinstance(c, Camera) else c for c in cameras]).reshape(-1,3,4)
+
+def reprojection_errors(cameras, X, pts, mask=None): 
+    """
+    Reprojection errors [V x N] (in pixels, NaN for unobserved 
+    points, or points behind the camera) of [N x 3] points, 
+    observed at [V x N x 2] pts in V cameras (or [V x 3 x 4] 
+    projection matrices)
+    """
+    P = _projection_stack(cameras)
+    pts = np.asarray(pts, dtype=np.float64)
+    x = np.einsum('vij,nj->vni', P[:,:,:3], X) + P[:,np.newaxis,:,3]
+    with np.errstate(divide='ignore', invalid='ignore'): 
+        err = np.linalg.norm(x[...,:2] / x[...,2:] - pts, axis=2)
+        err[~(x[...,2] > 0)] = np.nan
+    if mask is not None: 
+        err[~mask] = np.nan
+    return err
+
+def triangulate_nview(cameras, pts, mask=None, min_views=2, return_errors=False): 
+    """
+    Vectorized multi-view (linear, DLT) triangulation of N tracks 
+    observed in V views, solved for all tracks at once as the 
+    smallest eigenvector of the (row-normalized) [N x 4 x 4] 
+    normal equations A^T A (HZ, Sec 12.2)
+
+    cameras: V Cameras (or [V x 3 x 4] projection matrices)
+    pts: [V x N x 2] observations (NaN for unobserved)
+    mask: Optional [V x N] observation mask
+    min_views: Tracks observed in fewer views are NaN
+
+    Returns X [N x 3], and optionally the [V x N] reprojection 
+    errors (see reprojection_errors)
+    """
+    P = _projection_stack(cameras)
+    pts = np.asarray(pts, dtype=np.float64)
+    V, N = pts.shape[:2]
+    if len(P) != V: 
+        raise ValueError('triangulate_nview: {} cameras, but {} views of observations'.format(len(P), V))
+    
+    observed = np.isfinite(pts).all(axis=2)
+    if mask is not None: 
+        observed &= mask
+
+    # Rows x * P3 - P1, y * P3 - P2 [V x N x 2 x 4], unit-normalized 
+    # (and zeroed for unobserved points)
+    x = np.where(observed[...,np.newaxis], pts, 0)
+    A = x[...,np.newaxis] * P[:,np.newaxis,np.newaxis,2,:] - P[:,np.newaxis,:2,:]
+    with np.errstate(divide='ignore', invalid='ignore'): 
+        A /= np.linalg.norm(A, axis=3)[...,np.newaxis]
+    A[~observed] = 0
+
+    # Normal equations summed over views [N x 4 x 4], and their 
+    # smallest eigenvector (eigenvalues in ascending order)
+    AtA = np.einsum('vnri,vnrj->nij', A, A)
+    _, vecs = np.linalg.eigh(AtA)
+    Xh = vecs[:,:,0]
+    with np.errstate(divide='ignore', invalid='ignore'): 
+        X = Xh[:,:3] / Xh[:,3:]
+    X[observed.sum(axis=0) < min_views] = np.nan
+
+    if return_errors: 
+        return X, reprojection_errors(P, X, pts, mask=observed)
+    return X
+
+def fundamental_from_projections(P1, P2): 
+    """
+    Fundamental matrices [... x 3 x 3] from (stacked) projection 
+    matrices [... x 3 x 4], such that x_2^T F x_1 = 0, with all 
+    the 9 4x4 determinants evaluated in a single call
+    (HZ, 17.3, p. 412, see vgg_F_from_P)
+    """
+    P1, P2 = np.asarray(P1, dtype=np.float64), np.asarray(P2, dtype=np.float64)
+    rows = [[1,2], [2,0], [0,1]]
+    X = np.stack([P1[...,r,:] for r in rows], axis=-3)
+    Y = np.stack([P2[...,r,:] for r in rows], axis=-3)
+    M = np.concatenate([np.broadcast_to(X[...,np.newaxis,:,:,:], X.shape[:-3] + (3,3,2,4)), 
+                        np.broadcast_to(Y[...,:,np.newaxis,:,:], Y.shape[:-3] + (3,3,2,4))], axis=-2)
+    return np.linalg.det(M)
+
+class EpipolarCache(object): 
+    """
+    LRU cache of pairwise fundamental / essential matrices, 
+    keyed by the identities of both cameras, and validated against 
+    the identities of their (cached) pose matrices and intrinsics, 
+    so entries are recomputed only when either camera changes
+    """
+    def __init__(self, maxsize=256): 
+        self.maxsize_ = maxsize
+        self.entries_ = OrderedDict()
+
+    def __repr__(self): 
+        return '{}: entries: {}, maxsize: {}'.format(
+            self.__class__.__name__, len(self.entries_), self.maxsize_)
+
+    def __len__(self): 
+        return len(self.entries_)
+
+    def _get(self, kind, cam1, cam2, compute): 
+        key = (kind, id(cam1), id(cam2))
+        refs = (cam1, cam2, cam1.matrix, cam2.matrix, cam1.K, cam2.K)
+        entry = self.entries_.pop(key, None)
+        if entry is None or any(a is not b for a, b in zip(entry[0], refs)): 
+            entry = (refs, compute(cam1, cam2))
+        self.entries_[key] = entry
+        while len(self.entries_) > self.maxsize_: 
+            self.entries_.popitem(last=False)
+        return entry[1]
+
+    def F(self, cam1, cam2): 
+        """ F such that x_2^T F x_1 = 0 (see Camera.F) """
+        return self._get('F', cam1, cam2, lambda c1, c2: fundamental_from_projections(c1.P, c2.P))
+
+    def E(self, cam1, cam2): 
+        """ E such that x_2^T E x_1 = 0, for normalized coordinates (see Camera.E) """
+        def compute(c1, c2): 
+            p21 = c2.oplus(c1.inverse())
+            return skew(p21.tvec).dot(p21.R)
+        return self._get('E', cam1, cam2, compute)
+
+    def clear(self): 
+        self.entries_.clear()
+
+# Process-wide epipolar geometry cache
+epipolar_cache = EpipolarCache()
     
 def construct_K(fx=500.0, fy=500.0, cx=319.5, cy=239.5): 
     """
@@ -106,14 +241,15 @@ def construct_D(k1=0, k2=0, k3=0, p1=0, p2=0):
     """
     return np.float64([k1,k2,p1,p2,k3])
 
-def undistort_image(im, K, D): 
+def undistort_image(im, K, D, scale=1.0, directory=None): 
     """
+    Undistort (keeping the camera matrix K) with a single remap, 
+    using the shared undistortion map cache (see undistort_utils)
+
     Optionally: 
         newcamera, roi = cv2.getOptimalNewCameraMatrix(self.K, self.D, (W,H), 0) 
     """
-    H,W = im.shape[:2]
-    Kprime, roi = cv2.getOptimalNewCameraMatrix(K, D, (W,H), 1, (W,H))
-    return cv2.undistort(im, K, D, None, K)
+    return undistort_rectify_image(im, K, D, scale=scale, directory=directory)
 
 # def camera_from_P(P): 
     
@@ -145,6 +281,9 @@ def get_calib_params(fx, fy, cx, cy, baseline=None, baseline_px=None):
                     D0=D0, D1=D1, fx=fx, fy=fy, cx=cx, cy=cy, baseline=baseline, baseline_px=baseline * fx)
 
 class CameraIntrinsic(object): 
+    # Directory for persisting undistortion maps (set on load)
+    cache_directory = None
+
     def __init__(self, K, D=np.zeros(5, dtype=np.float64), shape=None): 
         """
         K: Calibration matrix
@@ -231,40 +370,139 @@ class CameraIntrinsic(object):
         from resizing the image by the appropriate scale parameter
         """
         shape = np.int32(self.shape * scale) if self.shape is not None else None
-        return CameraIntrinsic.from_calib_params(self.fx * scale, self.fy * scale, 
-                                                 self.cx * scale, self.cy * scale, 
-                                                 k1=self.k1, k2=self.k2, k3=self.k3, 
-                                                 p1=self.p1, p2=self.p2, 
-                                                 shape=shape)
+        intrinsic = CameraIntrinsic.from_calib_params(self.fx * scale, self.fy * scale, 
+                                                      self.cx * scale, self.cy * scale, 
+                                                      k1=self.k1, k2=self.k2, k3=self.k3, 
+                                                      p1=self.p1, p2=self.p2, 
+                                                      shape=shape)
+        intrinsic.cache_directory = self.cache_directory
+        return intrinsic
+
+    def _undistort_normalized(self, pts): 
+        """
+        Undistorted normalized coordinates [N x 2] of pixels [N x 2], 
+        via the (iterative) OpenCV solver
+        """
+        pts = np.asarray(pts, dtype=np.float64).reshape(-1,1,2)
+        if not len(pts): 
+            return np.zeros((0,2), dtype=np.float64)
+        if hasattr(cv2, 'undistortPointsIter'): 
+            criteria = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 50, 1e-10)
+            out = cv2.undistortPointsIter(pts, self.K, self.D, None, None, criteria)
+        else: 
+            out = cv2.undistortPoints(pts, self.K, self.D)
+        return out.reshape(-1,2)
+
+    def ray_lut(self, shape=None): 
+        """
+        Dense lookup table [H x W x 2] (float32) of the undistorted 
+        normalized coordinates of every pixel, computed once per 
+        (K, D, shape) (defaults to self.shape)
+        """
+        shape = tuple(int(s) for s in (self.shape if shape is None else shape)[:2])
+        key = (np.asarray(self.K, dtype=np.float64).tostring(), 
+               np.asarray(self.D, dtype=np.float64).tostring(), shape)
+        cached = getattr(self, 'ray_lut_', None)
+        if cached is None or cached[0] != key: 
+            H, W = shape
+            grid = np.dstack(np.meshgrid(np.arange(W), np.arange(H))).reshape(-1,2)
+            lut = self._undistort_normalized(grid).reshape(H,W,2).astype(np.float32)
+            self.ray_lut_ = (key, lut)
+        return self.ray_lut_[1]
+
+    def normalized_points(self, pts, undistort=True): 
+        """
+        Normalized (x/z, y/z) coordinates [... x 2] (float32) of 
+        pixels [... x 2]. With distortion, sub-pixel queries are 
+        bilinearly interpolated from the ray LUT (see ray_lut), and 
+        pixels outside the image fall back to the iterative solver
+        """
+        pts = np.asarray(pts)
+        shape = pts.shape
+        pts = pts.reshape(-1,2)
+        c = np.float32([self.cx, self.cy])
+        f = np.float32([self.fx, self.fy])
+
+        if not undistort or self.D is None or not np.any(np.asarray(self.D) != 0): 
+            out = (pts.astype(np.float32) - c) / f
+            return out.reshape(shape)
+
+        if self.shape is None: 
+            return self._undistort_normalized(pts).astype(np.float32).reshape(shape)
+
+        lut = self.ray_lut()
+        H, W = lut.shape[:2]
+        x, y = pts[:,0].astype(np.float32), pts[:,1].astype(np.float32)
+        inside = (x >= 0) & (x <= W-1) & (y >= 0) & (y <= H-1)
+
+        out = np.empty((len(pts),2), dtype=np.float32)
+        x, y = x[inside], y[inside]
+        x0 = np.minimum(x.astype(np.int32), W-2)
+        y0 = np.minimum(y.astype(np.int32), H-2)
+        ax, ay = (x - x0)[:,np.newaxis], (y - y0)[:,np.newaxis]
+        idx, flat = y0 * W + x0, lut.reshape(-1,2)
+        top = flat.take(idx, axis=0) * (1 - ax) + flat.take(idx+1, axis=0) * ax
+        bottom = flat.take(idx+W, axis=0) * (1 - ax) + flat.take(idx+W+1, axis=0) * ax
+        out[inside] = top * (1 - ay) + bottom * ay
+        if not inside.all(): 
+            out[~inside] = self._undistort_normalized(pts[~inside])
+        return out.reshape(shape)
 
     def ray(self, pts, undistort=True, rotate=False, normalize=False): 
         """
-        Returns the ray corresponding to the points. 
-        Optionally undistort (defaults to true), and 
-        rotate ray to the camera's viewpoint 
+        Returns the ray [... x 3] (float32) corresponding to the 
+        points [... x 2]. Optionally undistort (defaults to true, 
+        see normalized_points), and rotate ray to the camera's viewpoint 
         """
-        upts = self.undistort_points(pts) if undistort else pts
-        ret = unproject_points(
-            np.hstack([ (colvec(upts[:,0])-self.cx) / self.fx, (colvec(upts[:,1])-self.cy) / self.fy ])
-        )
+        xy = self.normalized_points(pts, undistort=undistort)
+        ret = np.empty(xy.shape[:-1] + (3,), dtype=np.float32)
+        ret[...,:2] = xy
+        ret[...,2] = 1
 
         if rotate: 
-            ret = self.extrinsics.rotate_vec(ret)
+            ret = self.extrinsics.rotate_vec(ret.reshape(-1,3)).reshape(ret.shape)
 
         if normalize: 
-            ret = ret / np.linalg.norm(ret, axis=1)[:, np.newaxis]
+            ret = ret / np.linalg.norm(ret, axis=-1)[...,np.newaxis]
 
         return ret
 
     def reconstruct(self, xyZ, undistort=True): 
         """
-        Reproject to 3D with calib params
+        Reproject [... x 3] (x, y, Z) to 3D with calib params
         """
-        Z = colvec(xyZ[:,2])
-        return self.ray(xyZ[:,:2], undistort=undistort) * Z
+        xyZ = np.asarray(xyZ)
+        return self.ray(xyZ[...,:2], undistort=undistort) * xyZ[...,2:3]
         
-    def undistort(self, im): 
-        return undistort_image(im, self.K, self.D)
+    def undistort(self, im, scale=1.0, interpolation=cv2.INTER_LINEAR): 
+        """
+        Undistort (and optionally rescale) the image with a 
+        single remap, the maps are cached (and persisted to 
+        the cache_directory, if set)
+        """
+        return undistort_rectify_image(im, self.K, self.D, scale=scale, 
+                                       directory=self.cache_directory, 
+                                       interpolation=interpolation)
+
+    def _cloud_reconstructor(self, baseline=None): 
+        """
+        Cached depth / disparity reconstruction engine (with its ray 
+        grids), rebuilt only if the intrinsics (or baseline) change
+        """
+        params = (float(self.fx), float(self.fy), float(self.cx), float(self.cy), baseline)
+        cached = getattr(self, 'reconstructor_', None)
+        if cached is None or cached[0] != params: 
+            self.reconstructor_ = (params, CloudReconstructor(*params))
+        return self.reconstructor_[1]
+
+    def undistort_rectify_map(self, R=None, P=None, shape=None, scale=1.0): 
+        """
+        Cached (CV_16SC2) undistortion / rectification maps 
+        for images of the provided shape (defaults to self.shape)
+        """
+        shape = self.shape if shape is None else shape
+        return get_undistort_rectify_map(self.K, self.D, R=R, P=P, shape=shape, scale=scale, 
+                                         directory=self.cache_directory)
 
     def undistort_points(self, pts): 
         """
@@ -298,9 +536,11 @@ class CameraIntrinsic(object):
     @classmethod
     def load(cls, filename):
         db = AttrDict.load_yaml(filename)
-        shape = np.int32([db.width, db.height]) if hasattr(db, 'width') and hasattr(db, 'height') else None 
-        return cls.from_calib_params(db.fx, db.fy, db.cx, db.cy, 
-                                     k1=db.k1, k2=db.k2, k3=db.k3, p1=db.p1, p2=db.p2, shape=shape)
+        shape = np.int32([db.height, db.width]) if hasattr(db, 'width') and hasattr(db, 'height') else None 
+        intrinsic = cls.from_calib_params(db.fx, db.fy, db.cx, db.cy, 
+                                          k1=db.k1, k2=db.k2, k3=db.k3, p1=db.p1, p2=db.p2, shape=shape)
+        intrinsic.cache_directory = os.path.dirname(os.path.abspath(os.path.expanduser(filename)))
+        return intrinsic
     
 class CameraExtrinsic(RigidTransform): 
     def __init__(self, R=npm.eye(3), t=npm.zeros(3)):
@@ -312,24 +552,28 @@ class CameraExtrinsic(RigidTransform):
         self.__cached_inverse = None
 
     def inverse(self): 
-        if self.__cached_inverse is None: 
-            self.__cached_inverse = super(CameraExtrinsic, self).inverse()
-        return self.__cached_inverse
+        # Re-use the inverse until the pose changes (new cached matrix)
+        T = self.matrix
+        if self.__cached_inverse is None or self.__cached_inverse[0] is not T: 
+            self.__cached_inverse = (T, super(CameraExtrinsic, self).inverse())
+        return self.__cached_inverse[1]
 
     def __repr__(self): 
         return 'CameraExtrinsic =======>\npose = {:}'.format(RigidTransform.__repr__(self))
 
-    def c2w(self, X): 
+    def c2w(self, X, out=None): 
         """
         Transform points in camera coordinates to world
+        (optionally into a preallocated buffer, see RigidTransform.apply)
         """
-        return self * X
+        return self.apply(X, out=out)
 
-    def w2c(self, X): 
+    def w2c(self, X, out=None): 
         """
         Transform points from world coordinates to camera
+        (optionally into a preallocated buffer, see RigidTransform.apply)
         """
-        return self.inverse() * X
+        return self.inverse().apply(X, out=out)
         
     @classmethod
     def from_rigid_transform(cls, p): 
@@ -402,7 +646,9 @@ class Camera(CameraIntrinsic, CameraExtrinsic):
 
     @classmethod
     def from_intrinsics_extrinsics(cls, intrinsic, extrinsic): 
-        return cls(intrinsic.K, extrinsic.R, extrinsic.t, D=intrinsic.D, shape=intrinsic.shape)
+        camera = cls(intrinsic.K, extrinsic.R, extrinsic.t, D=intrinsic.D, shape=intrinsic.shape)
+        camera.cache_directory = intrinsic.cache_directory
+        return camera
 
     @classmethod
     def from_intrinsics(cls, intrinsic): 
@@ -414,43 +660,120 @@ class Camera(CameraIntrinsic, CameraExtrinsic):
 
     @property
     def intrinsics(self): 
-        return CameraIntrinsic(self.K, self.D, shape=self.shape)
+        intrinsic = CameraIntrinsic(self.K, self.D, shape=self.shape)
+        intrinsic.cache_directory = self.cache_directory
+        return intrinsic
 
     @property
     def extrinsics(self): 
         return CameraExtrinsic(self.R, self.t)
 
-    def project(self, X, check_bounds=False, check_depth=False, return_depth=False, min_depth=0.1):
+    def _projection_params(self): 
         """
-        Project [Nx3] points onto 2-D image plane [Nx2]
+        Cached rotation vector, and whether the distortion-free 
+        fast path applies (R, t are cached with the pose itself, 
+        see RigidTransform.apply). Re-computed only when the 
+        pose (cached matrix), K or D change.
         """
-        R, t = self.to_Rt()
-	rvec,_ = cv2.Rodrigues(R)
-	proj,_ = cv2.projectPoints(X, rvec, t, self.K, self.D)
-        x = proj.reshape(-1,2)
+        T, K, D = self.matrix, self.K, self.D
+        cache = getattr(self, '_Camera__cached_projection', None)
+        if cache is None or cache[0] is not T or cache[1] is not K or cache[2] is not D: 
+            rvec, _ = cv2.Rodrigues(T[:3,:3])
+            distorted = D is not None and np.any(np.asarray(D) != 0)
+            cache = (T, K, D, rvec, distorted)
+            self.__cached_projection = cache
+        return cache[3:]
 
+    @property
+    def rvec(self): 
+        """ Rotation vector (Rodrigues) of the camera pose """
+        return self._projection_params()[0]
+
+    def project_all(self, X, out=None, depth_out=None): 
+        """
+        Project [N x 3] points onto the 2-D image plane, without 
+        filtering, in a single transform pass. 
+
+        Returns [N x 2] projections and [N] depths (float32 for 
+        float32 points, float64 otherwise), optionally written into 
+        preallocated out [N x 2], and depth_out [N] buffers. 
+        The pure-NumPy path is used for cameras without distortion.
+        """
+        _, distorted = self._projection_params()
+        X = np.asarray(X).reshape(-1,3)
+        dtype = np.float32 if X.dtype == np.float32 else np.float64
+
+        # Points in camera frame [p_c = T_cw * p_w]
+        Xc = self.apply(X, dtype=dtype)
+        depth = Xc[:,2]
+        if depth_out is not None: 
+            depth_out[...] = depth
+            depth = depth_out
+
+        if distorted: 
+            proj, _ = cv2.projectPoints(Xc.reshape(-1,1,3), np.zeros(3), np.zeros(3), self.K, self.D)
+            if out is None: 
+                return proj.reshape(-1,2).astype(dtype, copy=False), depth
+            out[...] = proj.reshape(-1,2)
+            return out, depth
+            
+        x = np.empty((len(Xc),2), dtype=dtype) if out is None else out
+        with np.errstate(divide='ignore', invalid='ignore'): 
+            iz = np.reciprocal(Xc[:,2])
+        iz[Xc[:,2] == 0] = 1
+        np.multiply(Xc[:,0], iz, out=Xc[:,0])
+        np.multiply(Xc[:,1], iz, out=Xc[:,1])
+
+        K = self.K
+        np.multiply(Xc[:,0], K[0,0], out=x[:,0])
+        if K[0,1] != 0: 
+            x[:,0] += K[0,1] * Xc[:,1]
+        x[:,0] += K[0,2]
+        np.multiply(Xc[:,1], K[1,1], out=x[:,1])
+        x[:,1] += K[1,2]
+        return x, depth
+
+    def projection_mask(self, x, depth=None, check_bounds=True, check_depth=False, min_depth=0.1): 
+        """
+        Mask of projections [N x 2] (with depths [N]) that are within 
+        image bounds, and in front of the camera (depth >= min_depth)
+        """
+        valid = np.ones(len(x), dtype=np.bool)
         if check_depth: 
-            # Only return positive depths
-            depths = self.depth_from_projection(X)
-            valid = depths >= min_depth
-        else:
-            valid = np.ones(len(x), dtype=np.bool)
-        
+            np.greater_equal(depth, min_depth, out=valid)
+
         if check_bounds: 
             if self.shape is None: 
                 raise ValueError('check_bounds cannot proceed. Camera.shape is not set')
-        
-            # Only return points within-image bounds
-            valid = np.bitwise_and(
-                valid, np.bitwise_and(
-                    np.bitwise_and(x[:,0] >= 0, x[:,0] < self.shape[1]), \
-                    np.bitwise_and(x[:,1] >= 0, x[:,1] < self.shape[0]))
-            )
+            H, W = self.shape[:2]
+            valid &= (x[:,0] >= 0) & (x[:,0] < W) & (x[:,1] >= 0) & (x[:,1] < H)
+        return valid
 
-        if return_depth: 
-            return x[valid], depths[valid]
+    def project(self, X, check_bounds=False, check_depth=False, return_depth=False, min_depth=0.1, 
+                return_mask=False, out=None, depth_out=None):
+        """
+        Project [Nx3] points onto 2-D image plane [Nx2]
 
-        return x[valid]
+        check_bounds: only return points within image bounds
+        check_depth: only return points with depth >= min_depth
+        return_depth: also return depths of the returned points
+        return_mask: also return the [N] mask of returned points
+        out, depth_out: see project_all
+        """
+        x, depth = self.project_all(X, out=out, depth_out=depth_out)
+        if not check_bounds and not check_depth: 
+            valid = None
+        else: 
+            valid = self.projection_mask(x, depth, check_bounds=check_bounds, 
+                                         check_depth=check_depth, min_depth=min_depth)
+            x, depth = x[valid], depth[valid]
+
+        ret = (x,)
+        if return_depth: 
+            ret += (depth,)
+        if return_mask: 
+            ret += (valid if valid is not None else np.ones(len(x), dtype=np.bool),)
+        return ret if len(ret) > 1 else x
 
     def depth_from_projection(self, X): 
         """
@@ -459,7 +782,7 @@ class Camera(CameraIntrinsic, CameraExtrinsic):
         Transform points in camera frame, and check z-vector: 
         [p_c = T_cw * p_w]
         """
-        return (self.extrinsics * X)[:,2]
+        return self.apply(np.asarray(X).reshape(-1,3))[:,2]
 
     def factor(self): 
         """
@@ -505,30 +828,19 @@ class Camera(CameraIntrinsic, CameraExtrinsic):
             F_10 = poses[0].F(poses[1])
             l_1 = F_10 * x_0
 
+        Cached per camera pair until either camera changes 
+        (see EpipolarCache)
         """
-
-        X1 = self.P[[1,2],:]
-        X2 = self.P[[2,0],:]
-        X3 = self.P[[0,1],:]
-        Y1 = other.P[[1,2],:]
-        Y2 = other.P[[2,0],:]
-        Y3 = other.P[[0,1],:]
-
-        F = np.float64([
-            [det(np.vstack([X1, Y1])), det(np.vstack([X2, Y1])), det(np.vstack([X3, Y1]))],
-            [det(np.vstack([X1, Y2])), det(np.vstack([X2, Y2])), det(np.vstack([X3, Y2]))],
-            [det(np.vstack([X1, Y3])), det(np.vstack([X2, Y3])), det(np.vstack([X3, Y3]))] 
-        ])
-
-        return F #  / F[2,2]
+        return epipolar_cache.F(self, other) #  / F[2,2]
 
     def E(self, other): 
         """ 
         Computes the essential matrix between this camera 
-        and the other, via E = [t]_x * R
+        and the other, via E = [t]_x * R of the relative 
+        pose p_21 (x_2^T E x_1 = 0, normalized coordinates)
         See HZ, Sec 9.6, p 257
         """
-        return skew(self.t).dot(self.R)
+        return epipolar_cache.E(self, other)
 
     def triangulate(self, pts, other_cam, other_pts): 
         return triangulate_points(self, pts, other_cam, other_pts)
@@ -652,32 +964,67 @@ class StereoCamera(Camera):
         right = self.right.scaled(scale)
         return StereoCamera(left, right, baseline=self.baseline)
 
-    def disparity_from_plane(self, rows, height): 
+    @property
+    def geometry(self): 
+        """
+        Cached disparity / depth tables and ground-plane thresholds 
+        (see StereoGeometry), rebuilt only if the intrinsics (e.g. 
+        scale) or baseline change
+        """
+        params = (float(self.left.fx), float(self.left.fy), 
+                  float(self.left.cx), float(self.left.cy), float(self.baseline))
+        cached = getattr(self, 'geometry_', None)
+        if cached is None or cached[0] != params: 
+            self.geometry_ = (params, StereoGeometry(*params))
+        return self.geometry_[1]
+
+    def disparity_from_plane(self, rows, height, subpixel=1): 
         """
         Computes the disparity image from expected height for each of
         the provided rows
         """
-        Z = height * self.left.fy  /  (np.arange(rows) - self.left.cy + 1e-9)
-        return self.left.fx * self.baseline / Z 
+        return self.geometry.plane_disparity(rows, height, subpixel=subpixel)
 
-    def depth_from_disparity(self, disp): 
+    def depth_from_disparity(self, disp, subpixel=1): 
         """
-        Computes the depth given disparity
+        Computes the depth given disparity (table lookup for 
+        integer / fixed-point disparities)
         """
-        return self.left.fx * self.baseline / disp
+        return self.geometry.depth_from_disparity(disp, subpixel=subpixel)
 
-    def disparity_from_depth(self, depth): 
+    def disparity_from_depth(self, depth, scale=1.0): 
         """
-        Computes the disparity given depth 
+        Computes the disparity given depth (table lookup for 
+        integer depths in units of scale)
         """
-        return self.left.fx * self.baseline / depth
+        return self.geometry.disparity_from_depth(depth, scale=scale)
 
-    def reconstruct(self, disp): 
+    def obstacle_mask(self, disp, height, min_height=0.2, min_disparity=0, subpixel=1): 
         """
-        Reproject to 3D with calib params
+        Pixels more than min_height above the ground plane at 
+        height below the camera (see StereoGeometry.obstacle_mask)
         """
-        X = cv2.reprojectImageTo3D(disp, self.Q)
-        return X
+        return self.geometry.obstacle_mask(disp, height, min_height=min_height, 
+                                           min_disparity=min_disparity, subpixel=subpixel)
+
+    def free_space_mask(self, disp, height, tol=0.1, subpixel=1): 
+        """
+        Pixels within tol of the ground plane at height below 
+        the camera (see StereoGeometry.free_space_mask)
+        """
+        return self.geometry.free_space_mask(disp, height, tol=tol, subpixel=subpixel)
+
+    def reconstruct(self, disp, out=None, **kwargs): 
+        """
+        Reproject disparity to 3D [H' x W' x 3] (float32, NaN for 
+        invalid disparities), optionally into a preallocated buffer. 
+        See CloudReconstructor for kwargs (skip, roi, max_depth, dense)
+        """
+        return self._cloud_reconstructor(self.baseline).reconstruct_disparity(disp, out=out, **kwargs)
+
+    def stream(self, disps, **kwargs): 
+        """ Yield reconstructions from a disparity stream (see CloudReconstructor.stream) """
+        return self._cloud_reconstructor(self.baseline).stream(disps, disparity=True, **kwargs)
 
     def reconstruct_sparse(self, xyd): 
         """
@@ -694,9 +1041,8 @@ class StereoCamera(Camera):
         Reproject to 3D with calib params and texture mapped
         """
         assert(im.ndim == 3)
-        X = cv2.reprojectImageTo3D(disp, self.Q)
-        im_pub, X_pub = np.copy(im[::sample,::sample]).reshape(-1,3 if im.ndim == 3 else 1), \
-                        np.copy(X[::sample,::sample]).reshape(-1,3)
+        X = self.reconstruct(disp, skip=sample)
+        im_pub, X_pub = im[::sample,::sample].reshape(-1,3), X.reshape(-1,3)
         return im_pub, X_pub
 
     def set_pose(self, left_pose): 
@@ -726,31 +1072,26 @@ class DepthCamera(CameraIntrinsic):
         self.shape = shape
         self.skip = skip
 
-        # Construct mesh for quick reconstruction
-        self._build_mesh(shape=shape)
-        
-    def _build_mesh(self, shape): 
-        H, W = shape
-        xs,ys = np.arange(0,W), np.arange(0,H);
-        fx_inv = 1.0 / self.fx;
-
-        self.xs = (xs-self.cx) * fx_inv
-        self.xs = self.xs[::self.skip]
-        self.ys = (ys-self.cy) * fx_inv
-        self.ys = self.ys[::self.skip]
+        # Precompute ray grid for quick reconstruction
+        self._cloud_reconstructor().grid(shape, skip=skip)
 
-        self.xs, self.ys = np.meshgrid(self.xs, self.ys);
+    def reconstruct(self, depth, out=None, **kwargs): 
+        """
+        Reconstruct [H/skip x W/skip x 3] (float32, NaN for invalid 
+        depths), optionally into a preallocated buffer. See 
+        CloudReconstructor for kwargs (roi, scale, min/max_depth, dense)
+        """
+        kwargs.setdefault('skip', self.skip)
+        return self._cloud_reconstructor().reconstruct(depth, out=out, **kwargs)
 
-    def reconstruct(self, depth): 
-        s = self.skip
-        depth_sampled = depth[::s,::s]
-        assert(depth_sampled.shape == self.xs.shape)
-        return np.dstack([self.xs * depth_sampled, self.ys * depth_sampled, depth_sampled])
+    def stream(self, depths, **kwargs): 
+        """ Yield reconstructions from a depth stream (see CloudReconstructor.stream) """
+        kwargs.setdefault('skip', self.skip)
+        return self._cloud_reconstructor().stream(depths, **kwargs)
 
     def reconstruct_sparse(self, pts, depth): 
-        return np.vstack([(pts[:,0] - self.cx) * 1.0 / self.fx * depth,
-                          (pts[:,1] - self.cy) * 1.0 / self.fx * depth, 
-                          depth]).T
+        """ Reconstruct [... x 3] from pixels [... x 2] and their depths [...] """
+        return self.ray(pts) * np.asarray(depth, dtype=np.float32)[...,np.newaxis]
 
     def save(self, filename): 
         raise NotImplementedError()
@@ -831,9 +1172,9 @@ def check_visibility(camera, pts_w, zmin=0, zmax=100):
     hangle, vangle = np.arctan2(v[:,0], v[:,2]), np.arctan2(-v[:,1], v[:,2])
 
     # Provides inds mask for all points that are within fov
-    return np.fabs(hangle) < camera.fov[0] * 0.5 and \
-        np.fabs(vangle) < camera.fov[1] * 0.5 and \
-        z >= zmin and z <= zmax
+    return (np.fabs(hangle) < camera.fov[0] * 0.5) & \
+        (np.fabs(vangle) < camera.fov[1] * 0.5) & \
+        (z >= zmin) & (z <= zmax)
 
 def get_median_depth(camera, pts, subsample=10): 
     """ 
@@ -847,29 +1188,23 @@ def get_median_depth(camera, pts, subsample=10):
 def get_bounded_projection(camera, pts, subsample=10): 
     """ Project points and only return points that are within image bounds """
 
-    # Project points
-    pts2d = camera.project(pts[::subsample].astype(np.float32))
-
-    # Only return points within-image bounds
-    valid = np.bitwise_and(np.bitwise_and(pts2d[:,0] >= 0, pts2d[:,0] < camera.shape[1]), \
-                           np.bitwise_and(pts2d[:,1] >= 0, pts2d[:,1] < camera.shape[0]))
-    return pts2d[valid], valid
+    # Project points, only return points within-image bounds
+    return camera.project(pts[::subsample].astype(np.float32), 
+                          check_bounds=True, return_mask=True)
 
 def get_discretized_projection(camera, pts, subsample=10, discretize=4): 
-
-    vis = np.ones(shape=(camera.shape[0]/discretize, camera.shape[1]/discretize), dtype=np.float32) * 10000.0
-    pts2d, valid = get_bounded_projection(camera, pts, subsample=subsample)
-
-    if True: 
-        pts3d = pts[valid]
-        depth = (camera * pts3d[::subsample])[:,2]
-        vis[pts2d[::subsample,1], pts2d[::subsample,0]] = depth 
-    else: 
-        pts2d = pts2d.astype(np.int32) / discretize
-        depth = get_median_depth(camera, pts, subsample=subsample)
-        vis[pts2d[:,1], pts2d[:,0]] = depth 
-
-    return vis, depth
+    """
+    Discretized (discretize x downscaled) depth map of the 
+    points (closest point per cell, 10000.0 for empty cells), 
+    and the depths of the occupied cells
+    """
+    zbuf = ZBuffer(camera, discretize=discretize, min_depth=0)
+    pts = pts[::subsample]
+    zbuf.rasterize(pts, np.zeros(len(pts), dtype=np.int32), num_labels=1)
+    vis = zbuf.depth.copy()
+    occupied = np.isfinite(vis)
+    vis[~occupied] = 10000.0
+    return vis, vis[occupied]
 
 def get_object_bbox(camera, pts, subsample=10, scale=1.0, min_height=10, min_width=10): 
     """
@@ -907,6 +1242,193 @@ def get_object_bbox(camera, pts, subsample=10, scale=1.0, min_height=10, min_wid
     else: 
         return [None] * 3
 
+###############################################################################
+# Multi-pose (batched) projection and visibility
+
+def _as_pose_array(poses): 
+    if isinstance(poses, RigidTransformArray): 
+        return poses
+    return RigidTransformArray.from_list(list(poses))
+
+def _pose_chunks(num_poses, num_points, chunksize=None, max_points=2**22): 
+    """ Slices over the poses, such that each chunk holds at most max_points """
+    if chunksize is None: 
+        chunksize = max(1, max_points // max(num_points, 1))
+    return [slice(k, min(k + chunksize, num_poses)) for k in xrange(0, num_poses, chunksize)]
+
+def _map_chunks(fn, chunks, num_threads=None): 
+    """ Evaluate fn over chunks, optionally in a thread pool (NumPy releases the GIL) """
+    if num_threads is None or num_threads <= 1 or len(chunks) <= 1: 
+        return map(fn, chunks)
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(processes=num_threads)
+    try: 
+        return pool.map(fn, chunks)
+    finally: 
+        pool.close()
+
+def _batch_camera_points(R, t, X): 
+    """ 
+    Points in the frame of each camera p_c = R_k * p_w + t_k, 
+    computed with a single GEMM, and returned as [K x 3 x N] 
+    (i.e. contiguous x, y, z rows for each camera)
+    """
+    Xc = np.dot(R.reshape(-1,3), X.T).reshape(len(R),3,len(X))
+    Xc += t[:,:,np.newaxis]
+    return Xc
+
+def batch_project(camera, poses, X, check_bounds=False, check_depth=False, min_depth=0.1, 
+                  chunksize=None, num_threads=None, max_points=2**22): 
+    """
+    Project [N x 3] world points with the intrinsics of camera, 
+    from each of the K camera poses (p_cw, as in CameraExtrinsic), 
+    provided as a RigidTransformArray or a list of RigidTransforms
+
+    The K poses are processed in chunks (at most max_points 
+    points per chunk), optionally with a pool of num_threads.
+
+    Returns [K x N x 2] projections, [K x N] depths, and the [K x N]
+    mask of projections that pass the bounds / depth checks
+    (float32 for float32 points, float64 otherwise)
+    """
+    poses = _as_pose_array(poses)
+    X = np.asarray(X).reshape(-1,3)
+    dtype = np.float32 if X.dtype == np.float32 else np.float64
+    X = X.astype(dtype, copy=False)
+    if check_bounds and camera.shape is None: 
+        raise ValueError('check_bounds cannot proceed. Camera.shape is not set')
+
+    K, N = len(poses), len(X)
+    x = np.empty((K,N,2), dtype=dtype)
+    depth = np.empty((K,N), dtype=dtype)
+    valid = np.ones((K,N), dtype=np.bool)
+    R, t = poses.R.astype(dtype), poses.tvec.astype(dtype)
+    distorted = np.any(np.asarray(camera.D) != 0)
+    
+    def project_chunk(sl): 
+        Xc = _batch_camera_points(R[sl], t[sl], X)
+        depth[sl] = Xc[:,2]
+        if distorted: 
+            for k, Xck in zip(xrange(sl.start, sl.stop), Xc): 
+                proj, _ = cv2.projectPoints(np.ascontiguousarray(Xck.T).reshape(-1,1,3), 
+                                            np.zeros(3), np.zeros(3), camera.K, camera.D)
+                x[k] = proj.reshape(-1,2)
+        else: 
+            z = Xc[:,2]
+            z[z == 0] = 1
+            np.reciprocal(z, out=z)
+            Xc[:,:2] *= z[:,np.newaxis]
+            Kc = camera.K
+            Xc[:,0] *= Kc[0,0]
+            if Kc[0,1] != 0: 
+                Xc[:,0] += Kc[0,1] * Xc[:,1]
+            Xc[:,0] += Kc[0,2]
+            Xc[:,1] *= Kc[1,1]
+            Xc[:,1] += Kc[1,2]
+            x[sl] = np.transpose(Xc[:,:2], (0,2,1))
+
+        # (NaN points are invalid)
+        with np.errstate(invalid='ignore'): 
+            if check_depth: 
+                valid[sl] &= depth[sl] >= min_depth
+            if check_bounds: 
+                H, W = camera.shape[:2]
+                xs, ys = x[sl,:,0], x[sl,:,1]
+                valid[sl] &= (xs >= 0) & (xs < W) & (ys >= 0) & (ys < H)
+
+    _map_chunks(project_chunk, _pose_chunks(K, N, chunksize=chunksize, max_points=max_points), 
+                num_threads=num_threads)
+    return x, depth, valid
+
+def batch_check_visibility(camera, poses, pts_w, zmin=0, zmax=100, 
+                           chunksize=None, num_threads=None, max_points=2**22): 
+    """
+    Check if [N] points are visible given the fov of the camera, 
+    from each of the K camera poses (see check_visibility)
+
+    Returns [K x N] visibility mask
+    """
+    poses = _as_pose_array(poses)
+    X = np.asarray(pts_w, dtype=np.float64).reshape(-1,3)
+    K, N = len(poses), len(X)
+    hfov, vfov = camera.fov * 0.5
+    visible = np.empty((K,N), dtype=np.bool)
+    R, t = poses.R, poses.tvec
+
+    def visibility_chunk(sl): 
+        Xc = _batch_camera_points(R[sl], t[sl], X)
+        z = Xc[:,2]
+        visible[sl] = (np.fabs(np.arctan2(Xc[:,0], z)) < hfov) & \
+                      (np.fabs(np.arctan2(-Xc[:,1], z)) < vfov) & \
+                      (z >= zmin) & (z <= zmax)
+
+    _map_chunks(visibility_chunk, _pose_chunks(K, N, chunksize=chunksize, max_points=max_points), 
+                num_threads=num_threads)
+    return visible
+
+def batch_get_object_bbox(camera, poses, objects, subsample=10, scale=1.0, min_height=10, min_width=10, 
+                          chunksize=None, num_threads=None, max_points=2**22): 
+    """
+    Bounding boxes of M objects (list of [N_i x 3] point sets), 
+    from each of the K camera poses, as in get_object_bbox
+
+    Returns: 
+       bbox: [K x M x 4] bounding boxes [l, t, r, b] (NaN if invalid)
+       depth: [K x M] median depths of the object points (NaN if invalid)
+       valid: [K x M] mask of valid bounding boxes
+    """
+    poses = _as_pose_array(poses)
+    K, M = len(poses), len(objects)
+    if camera.shape is None: 
+        raise ValueError('batch_get_object_bbox cannot proceed. Camera.shape is not set')
+    H, W = camera.shape[:2]
+
+    # Objects padded (with NaNs) to a single [M x L x 3] array
+    pts = [np.asarray(p, dtype=np.float32).reshape(-1,3)[::subsample] for p in objects]
+    L = max([len(p) for p in pts] + [1])
+    P = np.empty((M,L,3), dtype=np.float32)
+    P.fill(np.nan)
+    for j, p in enumerate(pts): 
+        P[j,:len(p)] = p
+
+    bbox = np.empty((K,M,4), dtype=np.float32)
+    depth = np.empty((K,M), dtype=np.float32)
+    
+    def bbox_chunk(sl): 
+        x, d, v = batch_project(camera, poses[sl], P.reshape(-1,3), check_bounds=True)
+        k = len(x)
+        x, d, v = x.reshape(k,M,L,2), d.reshape(k,M,L), v.reshape(k,M,L)
+        x[~v] = np.nan
+
+        # Per-object statistics over the valid (non-NaN) projections
+        with np.errstate(invalid='ignore'), warnings.catch_warnings(): 
+            warnings.simplefilter('ignore', RuntimeWarning)
+            lo, hi, med = np.nanmin(x, axis=2), np.nanmax(x, axis=2), np.nanmedian(x, axis=2)
+            depth[sl] = np.nanmedian(d, axis=2)
+
+            # Min-max bounds
+            x0, x1 = np.floor(np.maximum(0, lo[...,0])), np.floor(np.minimum(W-1, hi[...,0]))
+            y0, y1 = np.floor(np.maximum(0, lo[...,1])), np.floor(np.minimum(H-1, hi[...,1]))
+
+            # Check median center, and bbox size
+            ok = np.any(v, axis=2) & \
+                 (med[...,0] >= 0) & (med[...,1] >= 0) & (med[...,0] <= W) & (med[...,1] < H) & \
+                 ((y1-y0) >= min_height) & ((x1-x0) >= min_width) & (depth[sl] >= 0)
+
+        if scale != 1.0: 
+            w2, h2 = (scale-1.0) * (x1-x0) / 2, (scale-1.0) * (y1-y0) / 2
+            x0, x1 = np.floor(np.maximum(0, x0 - w2)), np.floor(np.minimum(x1 + w2, W-1))
+            y0, y1 = np.floor(np.maximum(0, y0 - h2)), np.floor(np.minimum(y1 + h2, H-1))
+
+        bbox[sl] = np.stack([x0, y0, x1, y1], axis=-1)
+        bbox[sl][~ok] = np.nan
+        depth[sl][~ok] = np.nan
+
+    _map_chunks(bbox_chunk, _pose_chunks(K, M * L, chunksize=chunksize, max_points=max_points), 
+                num_threads=num_threads)
+    return bbox, depth, ~np.isnan(depth)
+
+
 def epipolar_line(F_10, x_0): 
     """
     l_1 = F_10 * x_0
@@ -1029,20 +1551,7 @@ class Frustum(object):
         #        far +  np.array([ 1,  1,  0]) * far_off, 
         #        far +  np.array([ 1, -1,  0]) * far_off]
 
-        # FoV derived from fx,fy,cx,cy=500,500,320,240
-        # fovx, fovy = 65.23848614  51.28201165
-        rx, ry = 0.638, 0.478
-        arr = [np.array([-rx, -ry, 1.]) * zmin,
-               np.array([-rx,  ry, 1.]) * zmin,
-               np.array([ rx,  ry, 1.]) * zmin,
-               np.array([ rx, -ry, 1.]) * zmin,
-
-               np.array([-rx, -ry, 1.]) * zmax,
-               np.array([-rx,  ry, 1.]) * zmax,
-               np.array([ rx,  ry, 1.]) * zmax,
-               np.array([ rx, -ry, 1.]) * zmax]
-
-        return cls(pose * np.vstack(arr))
+        return cls(pose * frustum_vertices(zmin=zmin, zmax=zmax))
 
     @classmethod
     def from_camera(cls, c, zmin=0.01, zmax=0.1, pts=None):
@@ -1096,6 +1605,137 @@ class Frustum(object):
         pts, normals = self.points_and_normals
         return np.hstack([normals, -np.sum(np.multiply(pts, normals), axis=1).reshape(-1,1)])
 
+    @property
+    def inward_planes(self): 
+        """
+        Planes [6 x 4] oriented such that points inside 
+        the frustum have non-negative signed distances
+        """
+        planes = self.planes
+        c = np.r_[self.vertices_.mean(axis=0), 1]
+        return planes * np.where(planes.dot(c) < 0, -1, 1).reshape(-1,1)
+
+    def contains(self, X, tol=0.): 
+        """ Points [N x 3] inside the frustum [N] """
+        return batch_frustum_contains(self.inward_planes[np.newaxis], X, tol=tol)[0]
+
+###############################################################################
+# Batched frustum culling, and frustum overlap
+
+# FoV derived from fx,fy,cx,cy=500,500,320,240
+# fovx, fovy = 65.23848614  51.28201165
+FRUSTUM_RX, FRUSTUM_RY = 0.638, 0.478
+
+def frustum_vertices(zmin=0.01, zmax=0.1, rx=FRUSTUM_RX, ry=FRUSTUM_RY): 
+    """
+    Canonical frustum vertices [8 x 3] in the camera frame 
+    (x/z in [-rx, rx], y/z in [-ry, ry], z in [zmin, zmax]) 
+    Order: nul, nll, nlr, nur, ful, fll, flr, fur
+    """
+    corners = np.float64([[-rx, -ry, 1.], [-rx, ry, 1.], [rx, ry, 1.], [rx, -ry, 1.]])
+    return np.vstack([corners * zmin, corners * zmax])
+
+def frustum_volume(zmin=0.01, zmax=0.1, rx=FRUSTUM_RX, ry=FRUSTUM_RY): 
+    return 4. * rx * ry * (zmax ** 3 - zmin ** 3) / 3.
+
+def frustum_planes(zmin=0.01, zmax=0.1, rx=FRUSTUM_RX, ry=FRUSTUM_RY): 
+    """ Inward-facing planes [6 x 4] of the canonical frustum (camera frame) """
+    nx, ny = np.float64([1., 0., rx]), np.float64([0., 1., ry])
+    nx, ny = nx / np.linalg.norm(nx), ny / np.linalg.norm(ny)
+    return np.vstack([np.r_[nx, 0], np.r_[-nx[0], 0, nx[2], 0], 
+                      np.r_[ny, 0], np.r_[0, -ny[1], ny[2], 0], 
+                      [0, 0, 1, -zmin], [0, 0, -1, zmax]])
+
+def batch_frustum_planes(poses, zmin=0.01, zmax=0.1, rx=FRUSTUM_RX, ry=FRUSTUM_RY): 
+    """
+    Inward-facing planes [K x 6 x 4] (world frame) of the frustums 
+    at the K camera poses (p_wc, as in Frustum.from_pose)
+    """
+    poses = _as_pose_array(poses)
+    planes = frustum_planes(zmin=zmin, zmax=zmax, rx=rx, ry=ry)
+    n = np.einsum('kij,pj->kpi', poses.R, planes[:,:3])
+    d = planes[:,3] - np.einsum('kpi,ki->kp', n, poses.tvec)
+    return np.concatenate([n, d[...,np.newaxis]], axis=2)
+
+def batch_frustum_contains(planes, X, tol=0., chunksize=2**18): 
+    """
+    Cull [N x 3] points against K frustums given their inward 
+    planes [K x P x 4] (see batch_frustum_planes, Frustum.inward_planes), 
+    with a single (float32, homogeneous) [K*P x 4] x [4 x N] product 
+    per chunk of points
+
+    Returns [K x N] mask of points inside each frustum
+    """
+    planes = np.asarray(planes, dtype=np.float64)
+    K, P = planes.shape[:2]
+    X = np.asarray(X).reshape(-1,3)
+    planes = planes.reshape(K*P, 4).astype(np.float32)
+
+    inside = np.empty((K, len(X)), dtype=np.bool)
+    Xh = np.empty((4, min(chunksize, len(X))), dtype=np.float32)
+    Xh[3] = 1
+    for s in xrange(0, len(X), chunksize): 
+        e = min(s + chunksize, len(X))
+        Xh[:3,:e-s] = X[s:e].T
+        D = np.dot(planes, Xh[:,:e-s]) >= -tol
+        D = D.reshape(K, P, e-s)
+        mask = inside[:,s:e]
+        mask[:] = D[:,0]
+        for p in xrange(1, P): 
+            mask &= D[:,p]
+    return inside
+
+def batch_frustum_cull(poses, X, zmin=0.01, zmax=0.1, rx=FRUSTUM_RX, ry=FRUSTUM_RY, tol=0.): 
+    """ Cull [N x 3] (world) points against the frustums at K poses [K x N] """
+    return batch_frustum_contains(batch_frustum_planes(poses, zmin=zmin, zmax=zmax, rx=rx, ry=ry), 
+                                  X, tol=tol)
+
+def frustum_samples(num_samples=1000, zmin=0.01, zmax=0.1, rx=FRUSTUM_RX, ry=FRUSTUM_RY, seed=0): 
+    """
+    Uniform samples [S x 3] within the canonical frustum volume 
+    (inverse-CDF sampled depths, with density proportional to z^2)
+    """
+    rng = np.random.RandomState(seed)
+    u = rng.uniform(size=(num_samples, 3))
+    z = np.cbrt(zmin ** 3 + u[:,2] * (zmax ** 3 - zmin ** 3))
+    return np.vstack([(2 * u[:,0] - 1) * rx * z, (2 * u[:,1] - 1) * ry * z, z]).T
+
+def _in_canonical_frustum(X, zmin, zmax, rx, ry): 
+    """ Points [... x S x 3] (camera frame) inside the canonical frustum """
+    x, y, z = X[...,0], X[...,1], X[...,2]
+    return (z >= zmin) & (z <= zmax) & (np.fabs(x) <= rx * z) & (np.fabs(y) <= ry * z)
+
+def batch_frustum_overlap(poses_a, poses_b, zmin=0.01, zmax=0.1, 
+                          rx=FRUSTUM_RX, ry=FRUSTUM_RY, num_samples=1000, seed=0): 
+    """
+    Monte-Carlo estimate of the volume intersection-over-union 
+    of the (identically shaped) frustums at pose pairs (poses_a[k], 
+    poses_b[k]), broadcasting a single pose against K poses. 
+
+    Fixed uniform samples within the canonical frustum are mapped 
+    from each frustum into the other one (in both directions), with 
+    the intersection I ~= V * (f_ab + f_ba) / 2 for the fractions f 
+    of contained samples, and IoU = I / (2V - I)
+
+    Returns IoU [K] in [0, 1]
+    """
+    poses_a, poses_b = _as_pose_array(poses_a), _as_pose_array(poses_b)
+    K = max(len(poses_a), len(poses_b))
+    S = frustum_samples(num_samples, zmin=zmin, zmax=zmax, rx=rx, ry=ry, seed=seed)
+
+    def fraction(p_ba): 
+        # Samples of frustum a, in the camera frame of b [K x S x 3]
+        Xb = np.einsum('kij,sj->ksi', p_ba.R, S) + p_ba.tvec[:,np.newaxis,:]
+        return _in_canonical_frustum(Xb, zmin, zmax, rx, ry).mean(axis=1)
+
+    p_ba = poses_a.ominus(poses_b)
+    f = 0.5 * (fraction(p_ba) + fraction(p_ba.inverse()))
+    return np.broadcast_to(f / (2. - f), (K,)).copy()
+
+def frustum_overlap(pose_a, pose_b, **kwargs): 
+    """ Frustum IoU between two poses (see batch_frustum_overlap) """
+    return batch_frustum_overlap([pose_a], [pose_b], **kwargs)[0]
+
 
 def test_Frustum(): 
     pass
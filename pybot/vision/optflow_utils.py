@@ -6,6 +6,7 @@ import numpy as np
 
 from pybot.vision.image_utils import to_gray, to_color
 from pybot.vision.camera_utils import Camera, CameraIntrinsic, CameraExtrinsic
+from pybot.vision.reconstruction_utils import CloudReconstructor
 
 def dense_optical_flow(im1, im2, pyr_scale=0.5, levels=3, winsize=5, 
                        iterations=3, poly_n=5, poly_sigma=1.2, fb_threshold=-1, 
@@ -114,40 +115,131 @@ def test_flow(img1, img2):
 class SceneFlow(object):
     """
     Computes the scene flow vectors given relative pose and scene depth
-    (Note: assuming static scenes)
+    (Note: assuming static scenes, and a pinhole camera)
+
+    Normalized pixel rays (shared with the camera's CloudReconstructor) 
+    and the pixel grid are precomputed once for the (strided / roi) 
+    evaluation grid, and flows are computed in float32 into reusable 
+    buffers.
+
+    skip: Stride in pixels (rows and columns)
+    roi: Optional (x0, y0, x1, y1) pixel region (before striding)
     """
-    def __init__(self, cam):
+    def __init__(self, cam, skip=1, roi=None):
         assert(cam.shape is not None)
         H,W = cam.shape[:2]
         self.cam_ = Camera.from_intrinsics_extrinsics(cam, CameraExtrinsic.identity())
-        
-        self.xs_, self.ys_ = np.meshgrid(np.arange(0,W), np.arange(0,H))
-        self.grid_ = np.dstack([self.xs_,self.ys_]).astype(np.float32)
-        
+        self.skip_, self.roi_ = skip, roi
+
+        # Normalized rays [w'], [h' x 1], and pixel grid [h' x w' x 2]
+        self.xs_, self.ys_ = self.cam_._cloud_reconstructor().grid((H,W), skip=skip, roi=roi)
+        self.rows_, self.cols_ = CloudReconstructor._slices((H,W), skip=skip, roi=roi)
+        us = np.arange(self.cols_.start, self.cols_.stop, skip, dtype=np.float32)
+        vs = np.arange(self.rows_.start, self.rows_.stop, skip, dtype=np.float32)
+        self.us_, self.vs_ = us, vs[:,np.newaxis]
+        self.grid_ = np.dstack(np.meshgrid(us, vs)).astype(np.float32)
+        self.X_ = np.empty((4,) + self.grid_.shape[:2], dtype=np.float32)
+
+    @property
+    def shape(self): 
+        """ Shape of the (strided / roi) evaluation grid """
+        return self.grid_.shape[:2]
+
+    def _transform(self, depth, pose, scale=1.0): 
+        """
+        Points of the evaluation grid (with depth Z in camera 1) 
+        in camera 2 [3 x h' x w'], i.e. p_21 * (Z * ray), in-place
+        """
+        X, Z = self.X_[:3], self.X_[3]
+        np.multiply(depth[self.rows_, self.cols_], np.float32(scale), out=Z, casting='unsafe')
+        R, t = np.asarray(pose.R, dtype=np.float32), np.asarray(pose.tvec, dtype=np.float32)
+        for i in xrange(3): 
+            np.multiply(self.xs_, R[i,0], out=X[i])
+            X[i] += R[i,1] * self.ys_
+            X[i] += R[i,2]
+            X[i] *= Z
+            X[i] += t[i]
+        return X, Z
+
+    def induced_flow(self, depth, pose, out=None, scale=1.0, min_depth=0., return_mask=False): 
+        """
+        Optical flow [h' x w' x 2] induced by the relative pose p_21 
+        (camera 1 => camera 2), given the depth image of camera 1: 
+        x_2 - x_1 for every pixel x_1 of the evaluation grid 
+        (NaN for invalid depths, or points behind camera 2)
+
+        return_mask: Also return the [h' x w'] mask of valid flows 
+           that land within the image bounds
+        """
+        H, W = self.cam_.shape[:2]
+        X, Z = self._transform(depth, pose, scale=scale)
+        if out is None: 
+            out = np.empty(self.grid_.shape, dtype=np.float32)
+
+        with np.errstate(divide='ignore', invalid='ignore'): 
+            valid = (Z > min_depth) & (X[2] > 0)
+            u, v = out[...,0], out[...,1]
+            np.divide(X[0], X[2], out=u)
+            u *= np.float32(self.cam_.fx)
+            u += np.float32(self.cam_.cx)
+            np.divide(X[1], X[2], out=v)
+            v *= np.float32(self.cam_.fy)
+            v += np.float32(self.cam_.cy)
+            if return_mask: 
+                inside = (u >= 0) & (u < W) & (v >= 0) & (v < H)
+            u -= self.us_
+            v -= self.vs_
+        out[~valid] = np.nan
+        return (out, valid & inside) if return_mask else out
+
+    def induced_flows(self, depth, poses, out=None, **kwargs): 
+        """
+        Induced optical flows [K x h' x w' x 2] for a batch of 
+        K relative poses (see induced_flow)
+        """
+        poses = list(poses)
+        if out is None: 
+            out = np.empty((len(poses),) + self.grid_.shape, dtype=np.float32)
+        for k, pose in enumerate(poses): 
+            self.induced_flow(depth, pose, out=out[k], **kwargs)
+        return out
+
+    def _splat(self, X, Y, Z): 
+        """
+        Forward-splat the evaluation grid into the grid cells the 
+        (camera 2) points project to, and return the backward 
+        flow (source - target) at each target cell
+        """
+        h, w = self.grid_.shape[:2]
+        with np.errstate(divide='ignore', invalid='ignore'): 
+            ix = np.floor((X / Z * self.cam_.fx + self.cam_.cx - self.cols_.start) / self.skip_)
+            iy = np.floor((Y / Z * self.cam_.fy + self.cam_.cy - self.rows_.start) / self.skip_)
+            valid = (Z > 0) & (ix >= 0) & (ix < w) & (iy >= 0) & (iy < h)
+
+        new_grid = np.empty_like(self.grid_)
+        new_grid.fill(np.nan)
+        new_grid[iy[valid].astype(np.int32), ix[valid].astype(np.int32)] = self.grid_[valid]
+        new_grid -= self.grid_
+        return new_grid
+
     def process(self, dX):
         """
-        
+        Backward flow [h' x w' x 2] at each grid cell, given the 
+        (camera 2) points dX [h' x w' x 3] of the evaluation grid
         """
-        if (np.int32(dX.shape[:2]) != self.cam_.shape[:2]).any():
-            raise ValueError('''dX shape does not agree with cam.shape, '''
+        if dX.shape[:2] != self.grid_.shape[:2]:
+            raise ValueError('''dX shape does not agree with the evaluation grid, '''
                              '''dX.shape needs to be [H x W x 3] '''
-                             '''dX: {}, cam.shape: {}'''.format(np.int32(dX.shape[:2]), self.cam_.shape[:2]))
-        
-        # Project scene points 
-        x2 = self.cam_.project(dX.reshape(-1,3)).astype(np.int32)
-        
-        # Only return points within-image bounds
-        valid = np.bitwise_and(
-                np.bitwise_and(x2[:,0] >= 0, x2[:,0] < self.cam_.shape[1]), \
-                np.bitwise_and(x2[:,1] >= 0, x2[:,1] < self.cam_.shape[0]))
-        xs, ys = x2[:,0], x2[:,1]
-
-        # Compare against expected image points based on VO
-        gxs, gys = self.xs_.ravel(), self.ys_.ravel()
-        new_grid = np.copy(self.grid_) * np.nan
-        new_grid[ys[valid], xs[valid]] = self.grid_[gys[valid], gxs[valid]]
-
-        return new_grid - self.grid_
+                             '''dX: {}, grid: {}'''.format(np.int32(dX.shape[:2]), self.grid_.shape[:2]))
+        return self._splat(dX[...,0], dX[...,1], dX[...,2])
+
+    def process_depth(self, depth, pose, scale=1.0): 
+        """
+        Backward flow (see process) given the depth image of 
+        camera 1, and the relative pose p_21
+        """
+        X, _ = self._transform(depth, pose, scale=scale)
+        return self._splat(X[0], X[1], X[2])
 
     
 # def flow_pts(flow):
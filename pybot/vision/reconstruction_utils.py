@@ -0,0 +1,154 @@
+"""
+Streaming depth / disparity to point cloud reconstruction
+
+Reconstructs (float32) point clouds from depth or disparity images
+with precomputed (separable) ray grids per (shape, skip, roi), where
+the ROI / stride selection is a view taken before any arithmetic, and
+the cloud is written into (reusable) output buffers. stream() yields
+clouds from a depth / disparity stream with a single output buffer.
+"""
+
+# License: MIT
+
+import numpy as np
+
+class CloudReconstructor(object):
+    """
+    Depth / disparity => point cloud reconstruction
+
+    fx, fy, cx, cy: Intrinsics
+    baseline: Stereo baseline [m] (required for disparity images),
+       with depth = fx * baseline / disparity
+
+    Common kwargs:
+       skip: Stride in pixels (rows and columns)
+       roi: Optional (x0, y0, x1, y1) pixel region (before striding)
+       scale: Depth scale (e.g. 0.001 for [mm] depth images)
+       min_depth, max_depth: Valid depth range (exclusive)
+       dense: Returns [H' x W' x 3] (NaN for invalid depths) if True,
+          else the [N x 3] valid points
+    """
+    def __init__(self, fx, fy, cx, cy, baseline=None):
+        self.fx, self.fy = float(fx), float(fy)
+        self.cx, self.cy = float(cx), float(cy)
+        self.baseline = baseline
+        self.grids_ = {}
+
+    def __repr__(self):
+        return '{}: fx: {:3.2f}, fy: {:3.2f}, cx: {:3.2f}, cy: {:3.2f}, baseline: {}, grids: {}'.format(
+            self.__class__.__name__, self.fx, self.fy, self.cx, self.cy, self.baseline, len(self.grids_))
+
+    @classmethod
+    def from_intrinsics(cls, intrinsic, baseline=None):
+        return cls(intrinsic.fx, intrinsic.fy, intrinsic.cx, intrinsic.cy, baseline=baseline)
+
+    @classmethod
+    def from_stereo(cls, stereo):
+        return cls.from_intrinsics(stereo.left, baseline=stereo.baseline)
+
+    # Ray grids
+
+    @staticmethod
+    def _slices(shape, skip=1, roi=None):
+        H, W = shape[:2]
+        x0, y0, x1, y1 = (0, 0, W, H) if roi is None else roi
+        x0, y0 = max(int(x0), 0), max(int(y0), 0)
+        x1, y1 = min(int(x1), W), min(int(y1), H)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError('CloudReconstructor :: Empty roi {} for shape {}'.format(roi, (H,W)))
+        return slice(y0, y1, skip), slice(x0, x1, skip)
+
+    def grid(self, shape, skip=1, roi=None):
+        """
+        Cached (separable) ray grid for the shape, stride and roi:
+        [W'] x-rays (u - cx) / fx, and [H' x 1] y-rays (v - cy) / fy
+        """
+        key = (int(shape[0]), int(shape[1]), int(skip), None if roi is None else tuple(roi))
+        try:
+            return self.grids_[key]
+        except KeyError:
+            pass
+        rows, cols = CloudReconstructor._slices(shape, skip=skip, roi=roi)
+        xs = ((np.arange(cols.start, cols.stop, cols.step) - self.cx) / self.fx).astype(np.float32)
+        ys = ((np.arange(rows.start, rows.stop, rows.step) - self.cy) / self.fy).astype(np.float32)
+        self.grids_[key] = (xs, ys[:,np.newaxis])
+        return self.grids_[key]
+
+    def output_shape(self, shape, skip=1, roi=None, dense=True):
+        xs, ys = self.grid(shape, skip=skip, roi=roi)
+        return (len(ys), len(xs), 3) if dense else (len(ys) * len(xs), 3)
+
+    def empty(self, shape, skip=1, roi=None, dense=True):
+        """ Output buffer for images of the provided shape """
+        return np.empty(self.output_shape(shape, skip=skip, roi=roi, dense=dense), dtype=np.float32)
+
+    # Reconstruction
+
+    def _reconstruct(self, im, disparity, skip=1, roi=None, scale=1.0,
+                     min_depth=0., max_depth=np.inf, dense=True, out=None, return_mask=False):
+        xs, ys = self.grid(im.shape, skip=skip, roi=roi)
+        rows, cols = CloudReconstructor._slices(im.shape, skip=skip, roi=roi)
+        sub = im[rows, cols]
+        h, w = sub.shape[:2]
+
+        if out is None:
+            out = self.empty(im.shape, skip=skip, roi=roi, dense=dense)
+        elif out.dtype != np.float32 or out.shape != self.output_shape(im.shape, skip=skip, roi=roi, dense=dense):
+            raise ValueError('{} :: Output buffer mismatch {} {}, expected {} float32'
+                             .format(self.__class__.__name__, out.shape, out.dtype,
+                                     self.output_shape(im.shape, skip=skip, roi=roi, dense=dense)))
+
+        # Depth (float32, written in-place for dense output) 
+        # and valid mask, on the strided view only
+        if disparity and self.baseline is None:
+            raise RuntimeError('{} :: Disparity reconstruction requires baseline'
+                               .format(self.__class__.__name__))
+        Z = out[...,2] if dense else np.empty((h, w), dtype=np.float32)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if disparity:
+                np.divide(np.float32(self.fx * self.baseline * scale), sub, out=Z, casting='unsafe')
+            else:
+                np.multiply(sub, np.float32(scale), out=Z, casting='unsafe')
+            mask = (Z > min_depth) & (Z < max_depth)
+
+        if dense:
+            Z[~mask] = np.nan
+            np.multiply(Z, xs, out=out[...,0])
+            np.multiply(Z, ys, out=out[...,1])
+            X = out
+        else:
+            vs, us = np.nonzero(mask)
+            Zv = Z[vs, us]
+            X = out[:len(Zv)]
+            np.multiply(Zv, xs[us], out=X[:,0])
+            np.multiply(Zv, ys[vs,0], out=X[:,1])
+            X[:,2] = Zv
+
+        return (X, mask) if return_mask else X
+
+    def reconstruct(self, depth, **kwargs):
+        """ Point cloud from a depth image (see class kwargs) """
+        return self._reconstruct(depth, False, **kwargs)
+
+    def reconstruct_disparity(self, disp, **kwargs):
+        """ Point cloud from a disparity image (see class kwargs) """
+        return self._reconstruct(disp, True, **kwargs)
+
+    def stream(self, images, disparity=False, copy=False, **kwargs):
+        """
+        Yield point clouds from a stream of depth (or disparity)
+        images, reusing a single output buffer (bounded memory).
+        Yielded clouds are only valid until the next iteration,
+        unless copy=True
+        """
+        out, shape = None, None
+        for im in images:
+            if im.shape[:2] != shape:
+                shape = im.shape[:2]
+                out = self.empty(shape, skip=kwargs.get('skip', 1), roi=kwargs.get('roi', None),
+                                 dense=kwargs.get('dense', True))
+            X = self._reconstruct(im, disparity, out=out, **kwargs)
+            if isinstance(X, tuple):
+                yield tuple(x.copy() for x in X) if copy else X
+            else:
+                yield X.copy() if copy else X
@@ -0,0 +1,176 @@
+"""
+Precomputed stereo geometry: disparity <=> depth lookup tables,
+per-row ground-plane disparities, and obstacle / free-space masks
+
+For a rectified stereo pair (fx, fy, cx, cy, baseline), depth and
+disparity are related by Z = fx * baseline / d. Integer disparity
+images (and sub-pixel fixed-point ones, e.g. CV_16S StereoSGBM output
+with 4 fractional bits, subpixel=16) are converted to depth with a
+single table lookup instead of a per-pixel division.
+
+A ground plane at a distance height below the (level) camera projects
+to row v with disparity
+
+   d_g(v) = fx * baseline * (v - cy) / (fy * height)
+
+so that a pixel (v, d) lies more than h above the ground iff
+d > d_g(v; height - h), i.e. obstacle / free-space tests reduce to
+comparing the disparity image against precomputed per-row thresholds.
+"""
+
+# License: MIT
+
+import numpy as np
+
+class StereoGeometry(object):
+    """
+    Cached stereo conversion tables for a (scaled) stereo camera
+
+    fx, fy, cx, cy: Intrinsics of the (rectified) left camera
+    baseline: Stereo baseline [m]
+
+    Disparities are expected in units of 1/subpixel pixels
+    (subpixel=1 for integer / float disparities). Non-positive
+    disparities are invalid (depth = inf, never obstacle / free).
+    """
+    def __init__(self, fx, fy, cx, cy, baseline):
+        if baseline is None or baseline <= 0:
+            raise ValueError('StereoGeometry :: Invalid baseline {}'.format(baseline))
+        self.fx, self.fy = float(fx), float(fy)
+        self.cx, self.cy = float(cx), float(cy)
+        self.baseline = float(baseline)
+        self.depth_luts_ = {}
+        self.disparity_luts_ = {}
+        self.planes_ = {}
+
+    def __repr__(self):
+        return '{}: fx: {:3.2f}, fy: {:3.2f}, cx: {:3.2f}, cy: {:3.2f}, baseline: {}, tables: {}'.format(
+            self.__class__.__name__, self.fx, self.fy, self.cx, self.cy, self.baseline,
+            len(self.depth_luts_) + len(self.disparity_luts_) + len(self.planes_))
+
+    @classmethod
+    def from_stereo(cls, stereo):
+        return cls(stereo.left.fx, stereo.left.fy, stereo.left.cx, stereo.left.cy, stereo.baseline)
+
+    @property
+    def baseline_px(self):
+        return self.fx * self.baseline
+
+    def clear(self):
+        self.depth_luts_.clear()
+        self.disparity_luts_.clear()
+        self.planes_.clear()
+
+    # Disparity <=> depth
+
+    @staticmethod
+    def _table_size(dtype):
+        """ Number of (non-negative) values of an integer dtype (up to 16-bit) """
+        info = np.iinfo(dtype)
+        if info.bits > 16:
+            return None
+        return int(info.max) + 1
+
+    def depth_lut(self, subpixel=1, size=65536):
+        """
+        Depth [m] (float32) for every fixed-point disparity 0..size-1
+        in units of 1/subpixel pixels (inf for zero disparity)
+        """
+        key = (int(subpixel), int(size))
+        try:
+            return self.depth_luts_[key]
+        except KeyError:
+            pass
+        lut = np.empty(size, dtype=np.float32)
+        lut[0] = np.inf
+        lut[1:] = self.baseline_px * subpixel / np.arange(1, size, dtype=np.float64)
+        self.depth_luts_[key] = lut
+        return lut
+
+    def disparity_lut(self, scale=1.0, size=65536):
+        """
+        Disparity [px] (float32) for every integer depth 0..size-1,
+        in units of scale [m] (e.g. 0.001 for [mm] depth images),
+        0 for zero (invalid) depth
+        """
+        key = (float(scale), int(size))
+        try:
+            return self.disparity_luts_[key]
+        except KeyError:
+            pass
+        lut = np.zeros(size, dtype=np.float32)
+        lut[1:] = self.baseline_px / (np.arange(1, size, dtype=np.float64) * scale)
+        self.disparity_luts_[key] = lut
+        return lut
+
+    def depth_from_disparity(self, disp, subpixel=1):
+        """
+        Depth [m] (float32) from a disparity image. Integer (up to
+        16-bit) disparities are looked up (negative, i.e. invalid,
+        disparities map to inf), others are divided
+        """
+        disp = np.asarray(disp)
+        size = StereoGeometry._table_size(disp.dtype) if disp.dtype.kind in 'iu' else None
+        if size is not None:
+            return self.depth_lut(subpixel=subpixel, size=size).take(disp, mode='clip')
+        with np.errstate(divide='ignore'):
+            return np.float32(self.baseline_px * subpixel) / disp.astype(np.float32)
+
+    def disparity_from_depth(self, depth, scale=1.0):
+        """
+        Disparity [px] (float32) from a depth image in units of
+        scale [m]. Integer (up to 16-bit) depths are looked up
+        (0 for zero depth), others are divided
+        """
+        depth = np.asarray(depth)
+        size = StereoGeometry._table_size(depth.dtype) if depth.dtype.kind in 'iu' else None
+        if size is not None:
+            return self.disparity_lut(scale=scale, size=size).take(depth, mode='clip')
+        with np.errstate(divide='ignore'):
+            return np.float32(self.baseline_px / scale) / depth.astype(np.float32)
+
+    # Ground plane
+
+    def plane_disparity(self, rows, height, subpixel=1):
+        """
+        Expected disparity [rows] (float32, in units of 1/subpixel
+        pixels) of a ground plane at height [m] below the camera, for
+        each image row (negative above the horizon)
+        """
+        key = (int(rows), float(height), int(subpixel))
+        try:
+            return self.planes_[key]
+        except KeyError:
+            pass
+        d = self.baseline_px * subpixel * (np.arange(rows) - self.cy) / (self.fy * height)
+        self.planes_[key] = d.astype(np.float32)
+        self.planes_[key].flags.writeable = False
+        return self.planes_[key]
+
+    def obstacle_mask(self, disp, height, min_height=0.2, min_disparity=0, subpixel=1):
+        """
+        Pixels [H x W] (bool) whose 3D point lies more than min_height
+        [m] above the ground plane at height [m] below the camera,
+        with disparity > min_disparity (in units of 1/subpixel pixels)
+        """
+        if min_height >= height:
+            raise ValueError('{} :: min_height {} must be below the camera height {}'
+                             .format(self.__class__.__name__, min_height, height))
+        disp = np.asarray(disp)
+        thresh = np.maximum(self.plane_disparity(disp.shape[0], height - min_height, subpixel=subpixel),
+                            max(min_disparity, 0))
+        return disp > thresh[:,np.newaxis]
+
+    def free_space_mask(self, disp, height, tol=0.1, subpixel=1):
+        """
+        Pixels [H x W] (bool) whose 3D point lies within tol [m]
+        of the ground plane at height [m] below the camera
+        """
+        if tol >= height:
+            raise ValueError('{} :: tol {} must be below the camera height {}'
+                             .format(self.__class__.__name__, tol, height))
+        disp = np.asarray(disp)
+        rows = disp.shape[0]
+        lo = self.plane_disparity(rows, height + tol, subpixel=subpixel)[:,np.newaxis]
+        hi = self.plane_disparity(rows, height - tol, subpixel=subpixel)[:,np.newaxis]
+        return (disp > 0) & (disp >= lo) & (disp <= hi)
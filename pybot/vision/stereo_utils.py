@@ -11,6 +11,7 @@ from pybot.utils.timer import timeitmethod
 from pybot.utils.db_utils import AttrDict
 
 from pybot.vision.camera_utils import StereoCamera
+from pybot.vision.undistort_utils import get_undistort_rectify_map
 from pybot.vision.image_utils import im_resize, gaussian_blur, to_color, to_gray, valid_pixels
 from pybot.vision.imshow_utils import imshow_cv, trackbar_create, trackbar_value
 from pybot.vision.color_utils import colormap
@@ -99,22 +100,29 @@ class StereoBM:
 
 
 class CalibratedStereo(object): 
-    def __init__(self, left, right):
+    def __init__(self, left, right, directory=None, interpolation=cv2.INTER_NEAREST):
+        """
+        Undistortion / rectification maps are shared via the 
+        map cache (see undistort_utils), and persisted to directory 
+        (defaults to the cameras' cache_directory) if available
+        """
         self.cams = [left, right]
+        self.interpolation = interpolation
         self.undistortion_map = {}
         self.rectification_map = {}
         
         for cidx, cam in enumerate(self.cams):
-            (self.undistortion_map[cidx], self.rectification_map[cidx]) = cv2.initUndistortRectifyMap(
-                cam.K, cam.D, cam.R, cam.P, cam.shape[:2], cv2.CV_32FC1)
+            (self.undistortion_map[cidx], self.rectification_map[cidx]) = get_undistort_rectify_map(
+                cam.K, cam.D, cam.R, cam.P, cam.shape[:2], 
+                directory=directory if directory is not None else cam.cache_directory)
 
     def rectify(self, l, r): 
         """
         Rectify frames passed as (left, right) 
         Remapping is done with nearest neighbor for speed.
         """
-        return [cv2.remap(l, self.undistortion_map[cidx], self.rectification_map[cidx], cv2.INTER_NEAREST)
-                for cidx in range(len(self.cams))]
+        return [cv2.remap(im, self.undistortion_map[cidx], self.rectification_map[cidx], self.interpolation)
+                for cidx, im in enumerate([l, r])]
         
 
 class CalibratedFastStereo(object): 
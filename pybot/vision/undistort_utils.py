@@ -0,0 +1,157 @@
+"""
+Undistortion / rectification map cache
+
+Maps are built once per (K, D, R, P, shape, scale) with
+cv2.initUndistortRectifyMap as compact fixed-point maps (CV_16SC2),
+shared across all users in the process (CameraIntrinsic.undistort,
+CalibratedStereo.rectify, and the dataset readers), and optionally
+persisted to disk (next to the calibration file) so that they are
+only ever computed once. Undistorting (and rescaling) a frame is then
+a single cv2.remap.
+"""
+
+# License: MIT
+
+import os
+import hashlib
+import tempfile
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict
+
+class UndistortRectifyMapCache(object):
+    """
+    LRU cache of undistortion / rectification maps
+
+    For input images with intrinsics K, distortion D (of shape
+    (H,W)), the maps produce the image rectified by R, with the new
+    camera matrix P, and resized by scale, i.e. the output image has
+    shape (H,W) * scale and camera matrix diag(scale,scale,1) * P.
+
+    R [None]: Identity (no rectification)
+    P [None]: K (undistort only, keeps the camera matrix)
+
+    directory: If provided, maps are loaded from (or saved to)
+       directory/undistort_map_<key>.npz
+    """
+    prefix = 'undistort_map_'
+
+    def __init__(self, maxsize=16):
+        self.maxsize_ = maxsize
+        self.maps_ = OrderedDict()
+        self.lock_ = threading.Lock()
+
+    def __repr__(self):
+        return '{}: maps: {}, maxsize: {}'.format(
+            self.__class__.__name__, len(self.maps_), self.maxsize_)
+
+    def __len__(self):
+        return len(self.maps_)
+
+    @staticmethod
+    def _params(K, D, R=None, P=None, shape=None, scale=1.0):
+        if shape is None:
+            raise ValueError('UndistortRectifyMapCache requires the image shape')
+        K = np.float64(K).reshape(3,3)
+        D = np.float64(D).ravel() if D is not None else np.zeros(5)
+        R = np.float64(R).reshape(3,3) if R is not None else np.eye(3)
+        P = np.float64(P)[:3,:3] if P is not None else K
+        H, W = int(shape[0]), int(shape[1])
+        return K, D, R, P, (H, W), float(scale)
+
+    @staticmethod
+    def key(K, D, R=None, P=None, shape=None, scale=1.0):
+        """ Hex digest of the (K, D, R, P, shape, scale) parameters """
+        K, D, R, P, shape, scale = UndistortRectifyMapCache._params(K, D, R, P, shape, scale)
+        h = hashlib.sha1(cv2.__version__)
+        for arr in [K, D, R, P, np.float64(shape), np.float64([scale])]:
+            h.update(np.ascontiguousarray(np.round(arr, 9)).tostring())
+        return h.hexdigest()[:20]
+
+    @staticmethod
+    def build(K, D, R=None, P=None, shape=None, scale=1.0):
+        """
+        Build the fixed-point (CV_16SC2, CV_16UC1) maps
+        """
+        K, D, R, P, (H, W), scale = UndistortRectifyMapCache._params(K, D, R, P, shape, scale)
+        P = np.dot(np.diag([scale, scale, 1.0]), P)
+        size = (int(W * scale), int(H * scale))
+        return cv2.initUndistortRectifyMap(K, D, R, P, size, cv2.CV_16SC2)
+
+    def filename(self, directory, key):
+        return os.path.join(os.path.expanduser(directory), '{}{}.npz'.format(self.prefix, key))
+
+    def _load(self, fn):
+        try:
+            data = np.load(fn)
+            return data['map1'], data['map2']
+        except Exception, e:
+            print('{} :: Failed to load {}, rebuilding maps ({})'
+                  .format(self.__class__.__name__, fn, e))
+            return None
+
+    def _save(self, fn, maps):
+        """ Atomically write the maps (ignored if the directory is not writable) """
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(suffix='.npz.tmp', dir=os.path.dirname(fn))
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, map1=maps[0], map2=maps[1])
+            os.rename(tmp, fn)
+        except (IOError, OSError), e:
+            print('{} :: Failed to save {} ({})'.format(self.__class__.__name__, fn, e))
+        finally:
+            if tmp is not None and os.path.exists(tmp):
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def get(self, K, D, R=None, P=None, shape=None, scale=1.0, directory=None):
+        """
+        Undistortion / rectification maps (map1 [H' x W' x 2] int16,
+        map2 [H' x W'] uint16), built (or loaded) once and cached
+        """
+        key = self.key(K, D, R=R, P=P, shape=shape, scale=scale)
+        with self.lock_:
+            maps = self.maps_.pop(key, None)
+            if maps is not None:
+                self.maps_[key] = maps
+                return maps
+
+        fn = self.filename(directory, key) if directory is not None else None
+        maps = self._load(fn) if fn is not None and os.path.exists(fn) else None
+        if maps is None:
+            maps = self.build(K, D, R=R, P=P, shape=shape, scale=scale)
+            if fn is not None:
+                self._save(fn, maps)
+
+        with self.lock_:
+            self.maps_[key] = maps
+            while len(self.maps_) > self.maxsize_:
+                self.maps_.popitem(last=False)
+        return maps
+
+    def remap(self, im, K, D, R=None, P=None, scale=1.0, directory=None,
+              interpolation=cv2.INTER_LINEAR):
+        """ Undistort / rectify (and rescale) an image with a single remap """
+        map1, map2 = self.get(K, D, R=R, P=P, shape=im.shape[:2], scale=scale, directory=directory)
+        return cv2.remap(im, map1, map2, interpolation)
+
+    def clear(self):
+        with self.lock_:
+            self.maps_.clear()
+
+# Process-wide map cache
+undistort_map_cache = UndistortRectifyMapCache()
+
+def get_undistort_rectify_map(K, D, R=None, P=None, shape=None, scale=1.0, directory=None):
+    """ Shared (cached) undistortion / rectification maps """
+    return undistort_map_cache.get(K, D, R=R, P=P, shape=shape, scale=scale, directory=directory)
+
+def undistort_rectify_image(im, K, D, R=None, P=None, scale=1.0, directory=None,
+                            interpolation=cv2.INTER_LINEAR):
+    """ Undistort / rectify (and rescale) an image with the shared map cache """
+    return undistort_map_cache.remap(im, K, D, R=R, P=P, scale=scale, directory=directory,
+                                     interpolation=interpolation)
@@ -0,0 +1,164 @@
+"""
+Occlusion-aware point-splatting z-buffer
+
+Rasterizes the labeled point clouds of many objects into a
+(downscaled) depth / label buffer in a single projection pass,
+keeping the closest point per pixel (scatter-min on depth).
+Per-object visible bounding boxes, visible fractions and median
+depths are then read back from the buffer.
+"""
+
+# License: MIT
+
+import numpy as np
+
+class ZBuffer(object):
+    """
+    Point-splatting z-buffer for a Camera (with shape set)
+
+    discretize: Downscale factor of the buffer w.r.t. the image,
+       each point is splatted into a discretize x discretize cell
+    min_depth: Points closer than min_depth are ignored
+
+    Usage:
+       zbuf = ZBuffer(camera, discretize=4).rasterize_objects([obj.points for obj in objects])
+       bboxes, fraction, depth, valid = zbuf.object_bboxes(min_fraction=0.25)
+    """
+    def __init__(self, camera, discretize=4, min_depth=0.1):
+        if camera.shape is None:
+            raise ValueError('ZBuffer cannot proceed. Camera.shape is not set')
+        self.camera_ = camera
+        self.discretize_ = int(discretize)
+        self.min_depth_ = min_depth
+
+        H, W = camera.shape[:2]
+        self.shape_ = ((H + self.discretize_ - 1) // self.discretize_,
+                       (W + self.discretize_ - 1) // self.discretize_)
+        self.clear()
+
+    def __repr__(self):
+        return '{}: shape: {}, discretize: {}, labels: {}'.format(
+            self.__class__.__name__, self.shape_, self.discretize_, self.num_labels_)
+
+    def clear(self):
+        self.depth_ = np.empty(self.shape_, dtype=np.float32)
+        self.depth_.fill(np.inf)
+        self.label_ = np.empty(self.shape_, dtype=np.int32)
+        self.label_.fill(-1)
+        self.num_labels_ = 0
+        self.footprint_ = np.zeros(0, dtype=np.int64)
+
+    def rasterize(self, points, labels, num_labels=None):
+        """
+        Rasterize [N x 3] world points with [N] non-negative integer
+        labels (0..num_labels-1), projected with a single Camera.project
+        pass. For every cell, the label and depth of the closest point
+        are kept.
+
+        Also records the footprint (number of cells covered, ignoring
+        occlusions) of each label, used for visible fractions.
+        """
+        self.clear()
+        labels = np.asarray(labels, dtype=np.int32).ravel()
+        self.num_labels_ = int(labels.max()) + 1 if num_labels is None and len(labels) \
+                           else int(num_labels or 0)
+        self.footprint_ = np.zeros(self.num_labels_, dtype=np.int64)
+
+        x, depth, valid = self.camera_.project(
+            np.asarray(points).reshape(-1,3), check_bounds=True, check_depth=True,
+            min_depth=self.min_depth_, return_depth=True, return_mask=True)
+        labels = labels[valid]
+        if not len(labels):
+            return self
+
+        # Linear cell index of each point
+        h, w = self.shape_
+        cells = x.astype(np.int32) // self.discretize_
+        lin = cells[:,1] * w + cells[:,0]
+
+        # Scatter-min: sort by (cell, depth), and keep the first per cell
+        order = np.lexsort((depth, lin))
+        lin, depth, labels = lin[order], depth[order], labels[order]
+        first = np.ones(len(lin), dtype=np.bool)
+        first[1:] = lin[1:] != lin[:-1]
+        self.depth_.flat[lin[first]] = depth[first]
+        self.label_.flat[lin[first]] = labels[first]
+
+        # Footprint: number of unique (label, cell) pairs per label
+        key = np.unique(labels.astype(np.int64) * (h * w) + lin)
+        self.footprint_ = np.bincount(key // (h * w), minlength=self.num_labels_)
+        return self
+
+    def rasterize_objects(self, objects):
+        """ Rasterize a list of [N_i x 3] point clouds, labeled 0..M-1 """
+        if not len(objects):
+            self.clear()
+            return self
+        points = [np.asarray(p).reshape(-1,3) for p in objects]
+        labels = np.repeat(np.arange(len(objects), dtype=np.int32), [len(p) for p in points])
+        return self.rasterize(np.vstack(points), labels, num_labels=len(objects))
+
+    def object_bboxes(self, min_fraction=0., min_cells=1):
+        """
+        Per-label visible bounding boxes, read from the buffer
+        (in image coordinates)
+
+        Returns:
+           bboxes: [M x 4] visible bounding boxes [l, t, r, b] (NaN if invalid)
+           fraction: [M] visible fraction (visible cells / footprint)
+           depth: [M] median depth of the visible cells (NaN if invalid)
+           valid: [M] labels with at least min_cells visible cells,
+              and visible fraction >= min_fraction
+        """
+        M = self.num_labels_
+        bboxes = np.empty((M,4), dtype=np.float32)
+        bboxes.fill(np.nan)
+        depth = np.empty(M, dtype=np.float32)
+        depth.fill(np.nan)
+
+        # Visible cells, grouped by label (and sorted by depth)
+        ys, xs = np.nonzero(self.label_ >= 0)
+        labels, d = self.label_[ys, xs], self.depth_[ys, xs]
+        order = np.lexsort((d, labels))
+        ys, xs, labels, d = ys[order], xs[order], labels[order], d[order]
+        counts = np.bincount(labels, minlength=M)
+        present, = np.where(counts > 0)
+        if len(present):
+            starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+            s = self.discretize_
+            H, W = self.camera_.shape[:2]
+            bboxes[present,0] = np.minimum.reduceat(xs, starts) * s
+            bboxes[present,1] = np.minimum.reduceat(ys, starts) * s
+            bboxes[present,2] = np.minimum((np.maximum.reduceat(xs, starts) + 1) * s, W) - 1
+            bboxes[present,3] = np.minimum((np.maximum.reduceat(ys, starts) + 1) * s, H) - 1
+
+            # Median depth of each (depth-sorted) segment
+            c = counts[present]
+            depth[present] = 0.5 * (d[starts + (c - 1) // 2] + d[starts + c // 2])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(self.footprint_ > 0, counts / self.footprint_.astype(np.float32), 0)
+        valid = (counts >= max(min_cells, 1)) & (fraction >= min_fraction)
+        bboxes[~valid] = np.nan
+        depth[~valid] = np.nan
+        return bboxes, fraction, depth, valid
+
+    # Properties
+
+    @property
+    def depth(self):
+        """ Depth buffer (inf for empty cells) """
+        return self.depth_
+
+    @property
+    def label(self):
+        """ Label buffer (-1 for empty cells) """
+        return self.label_
+
+    @property
+    def discretize(self):
+        return self.discretize_
+
+    @property
+    def footprint(self):
+        return self.footprint_
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import argparse
+import numpy as np
+
+from pybot.geometry import transformations as tf
+from pybot.geometry.rigid_transform import RigidTransform
+
+class LegacyQuaternion(object):
+    """ Reference: per-instance __dict__, matrices rebuilt on every access """
+    def __init__(self, q):
+        self.q = np.array(q, np.float64)
+        norm = np.linalg.norm(self.q)
+        if abs(norm - 1) > 1e-6:
+            self.q /= norm
+
+    @property
+    def R(self):
+        return tf.quaternion_matrix(self.q)[:3,:3]
+
+class LegacyRigidTransform(object):
+    def __init__(self, xyzw, tvec):
+        self.quat = LegacyQuaternion(xyzw)
+        self.tvec = np.array(tvec)
+
+    @property
+    def R(self):
+        return self.quat.R
+
+    @property
+    def matrix(self):
+        result = tf.quaternion_matrix(self.quat.q)
+        result[:3, 3] = self.tvec
+        return result
+
+def footprint(p):
+    """ Bytes held by a pose: objects, their __dict__s and numpy buffers """
+    objs = [p, p.quat, p.tvec, p.quat.q]
+    objs += [o.__dict__ for o in (p, p.quat) if hasattr(o, '__dict__')]
+    return sum(sys.getsizeof(o) for o in objs)
+
+def timed(fn, N):
+    st = time.time()
+    for _ in xrange(N):
+        fn()
+    return (time.time() - st) / N * 1e6
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='RigidTransform memory/latency benchmark')
+    parser.add_argument(
+        '-n', '--num-poses', type=int, required=False, default=100000,
+        help='Number of live poses')
+    parser.add_argument(
+        '-r', '--repeats', type=int, required=False, default=100000,
+        help='Number of repeated .R / .matrix accesses')
+    args = parser.parse_args()
+
+    xyzw = tf.random_quaternion()
+    xyzw = np.roll(xyzw, shift=-1)
+    tvec = np.random.randn(3)
+
+    print('{:<24s} {:>12s} {:>12s} {:>12s} {:>12s}'
+          .format('', 'bytes/pose', 'init [us]', '.R [us]', '.matrix [us]'))
+    for name, cls in [('before (dict, uncached)', LegacyRigidTransform),
+                      ('after (slots, cached)', RigidTransform)]:
+        poses = [cls(xyzw, tvec) for _ in xrange(args.num_poses)]
+        p = poses[0]
+        print('{:<24s} {:>12d} {:>12.2f} {:>12.2f} {:>12.2f}'
+              .format(name, footprint(p),
+                      timed(lambda: cls(xyzw, tvec), args.num_poses),
+                      timed(lambda: p.R, args.repeats),
+                      timed(lambda: p.matrix, args.repeats)))
+        del poses
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing as mp
+import cv2
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from pybot.utils.async_utils import prefetch_map, ProcessDecoder
+from pybot.utils.dataset_readers import ImageDatasetReader
+
+N = 12
+
+class _Images(object):
+    """ Temporary images (the last few larger than the first) """
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.files = []
+        for j in range(N):
+            shape = (24, 32, 3) if j < N - 3 else (48, 64, 3)
+            fn = os.path.join(self.directory, '{:06d}.png'.format(j))
+            cv2.imwrite(fn, rng.randint(0, 256, size=shape).astype(np.uint8))
+            self.files.append(fn)
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def _check(self, frames, expected):
+        frames = list(frames)
+        assert len(frames) == len(expected)
+        for im, im_ in zip(frames, expected):
+            assert_array_equal(im, im_)
+
+class TestPrefetchMap(_Images):
+    def test_order(self):
+        reader = ImageDatasetReader(files=self.files)
+        expected = [cv2.imread(fn, cv2.IMREAD_UNCHANGED) for fn in self.files]
+        self._check(reader.iteritems(), expected)
+        for (prefetch, workers) in [(1, 1), (4, 3), (32, 8)]:
+            self._check(reader.iteritems(prefetch=prefetch, workers=workers), expected)
+            self._check(reader.iteritems(every_k_frames=2, reverse=True, prefetch=prefetch, workers=workers),
+                        expected[::2][::-1])
+            self._check(reader.iterinds([5, 0, 7, 7], prefetch=prefetch, workers=workers),
+                        [expected[j] for j in [5, 0, 7, 7]])
+
+        # Out-of-order completion
+        delays = np.random.RandomState(1).rand(40) * 0.01
+        def func(j):
+            time.sleep(delays[j])
+            return j
+        assert list(prefetch_map(func, range(40), prefetch=8, workers=4)) == range(40)
+
+    def test_exception(self):
+        nthreads = threading.active_count()
+        def func(j):
+            if j == 5:
+                raise KeyError(j)
+            return j
+
+        # Re-raised in the consumer (with the original type), in order
+        out = []
+        try:
+            for j in prefetch_map(func, range(20), prefetch=4, workers=2):
+                out.append(j)
+            assert False, 'Worker exceptions should be re-raised'
+        except KeyError:
+            pass
+        assert out == range(5)
+        assert threading.active_count() == nthreads
+
+    def test_close(self):
+        nthreads = threading.active_count()
+        calls = []
+        def func(j):
+            calls.append(j)
+            return j
+
+        # Closing stops the workers, at most prefetch items ahead
+        it = prefetch_map(func, xrange(1000), prefetch=4, workers=2)
+        assert [next(it) for _ in range(3)] == [0, 1, 2]
+        it.close()
+        assert threading.active_count() == nthreads
+        assert len(calls) <= 3 + 4 + 1
+
+def _imread(fn):
+    return cv2.imread(fn, cv2.IMREAD_UNCHANGED)
+
+def _imread_fail(fn):
+    if fn.endswith('000005.png'):
+        raise IOError('Corrupt image {}'.format(fn))
+    return _imread(fn)
+
+def _imread_exit(fn):
+    if fn.endswith('000005.png'):
+        os._exit(1)
+    return _imread(fn)
+
+class TestProcessDecoder(_Images):
+    def teardown(self):
+        _Images.teardown(self)
+        assert mp.active_children() == []
+
+    def test_order(self):
+        expected = [_imread(fn) for fn in self.files]
+        reader = ImageDatasetReader(files=self.files, processes=2, ring_size=3)
+        self._check(reader.iteritems(), expected)
+        self._check(reader.iteritems(every_k_frames=2, reverse=True), expected[::2][::-1])
+        self._check(reader.iterinds([5, 0, 10, 10, 3]), [expected[j] for j in [5, 0, 10, 10, 3]])
+        self._check(ProcessDecoder(_imread, processes=3, ring_size=1).imap(self.files), expected)
+        assert list(ProcessDecoder(_imread).imap([])) == []
+
+        # Grayscale, rescaled frames match the synchronous reader
+        kwargs = dict(files=self.files, scale=0.5, grayscale=True)
+        self._check(ImageDatasetReader(processes=2, **kwargs).iteritems(),
+                    list(ImageDatasetReader(**kwargs).iteritems()))
+
+    def test_exception(self):
+        # Exceptions are raised in order, while crashed workers can take 
+        # (not yet flushed) earlier frames down with them
+        for (func, msg, exact) in [(_imread_fail, 'Corrupt image', True), 
+                                   (_imread_exit, 'died unexpectedly', False)]:
+            out = []
+            try:
+                for im in ProcessDecoder(func, processes=2, ring_size=2).imap(self.files):
+                    out.append(im)
+                assert False, 'Worker failures should raise RuntimeError'
+            except RuntimeError, e:
+                assert msg in str(e)
+            assert len(out) == 5 if exact else 1 <= len(out) <= 5
+            assert mp.active_children() == []
+
+    def test_close(self):
+        # Closing mid-stream shuts down the workers
+        it = ProcessDecoder(_imread, processes=3, ring_size=4).imap(self.files * 10)
+        for _ in range(5):
+            next(it)
+        assert len(mp.active_children()) == 3
+        it.close()
+        assert mp.active_children() == []
+
+    def test_no_copy(self):
+        expected = [_imread(fn) for fn in self.files[:N-3]]
+        ring_size = 2
+        views = []
+        for j, im in enumerate(ProcessDecoder(_imread, processes=2, ring_size=ring_size, 
+                                              copy=False).imap(self.files[:N-3])):
+            # The current view is not overwritten by the workers
+            time.sleep(0.05)
+            assert_array_equal(im, expected[j])
+            views.append(im)
+
+        # Views (after the first frame, decoded in the calling process)
+        # re-use ring_size shared-memory slots
+        slots = set(im.__array_interface__['data'][0] for im in views[1:])
+        assert len(slots) == ring_size
+        assert not all((im == im_).all() for im, im_ in zip(views, expected))
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pybot.geometry.rigid_transform import RigidTransform
+from pybot.vision.camera_utils import Camera, CameraIntrinsic, batch_project
+
+def _poses(n=5, seed=0):
+    rng = np.random.RandomState(seed)
+    return [RigidTransform.from_rpyxyz(*np.hstack([0.1 * rng.randn(3), rng.randn(3)]))
+            for _ in range(n)]
+
+def test_batch_project_skew():
+    K = np.float64([[500., 3.5, 320.], [0., 480., 240.], [0., 0., 1.]])
+    cam = CameraIntrinsic(K, shape=(480,640))
+    rng = np.random.RandomState(1)
+    X = np.hstack([rng.randn(200, 2), 5 + rng.rand(200, 1)])
+
+    poses = _poses()
+    x, depth, valid = batch_project(cam, poses, X, check_bounds=True, check_depth=True)
+    for k, p in enumerate(poses):
+        camk = Camera(K, p.R, p.tvec, shape=(480,640))
+        xk, dk = camk.project(X, return_depth=True)
+        assert_allclose(x[k], xk, atol=1e-9)
+        assert_allclose(depth[k], dk, atol=1e-12)
+
+        # Against K [R | t] X
+        Xh = np.dot(np.dot(X, p.R.T) + p.tvec, K.T)
+        assert_allclose(x[k], Xh[:,:2] / Xh[:,2:], atol=1e-9)
+
+        vk = camk.projection_mask(xk, dk, check_bounds=True, check_depth=True)
+        assert (valid[k] == vk).all()
+
+    # float32 points
+    x32, _, _ = batch_project(cam, poses, X.astype(np.float32))
+    assert x32.dtype == np.float32
+    assert_allclose(x32, x, atol=1e-2)
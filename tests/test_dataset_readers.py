@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from pybot.utils.dataset_readers import voxel_downsample
+
+def _voxel_downsample(X, voxel_size):
+    """ First point in every voxel (reference) """
+    seen, inds = set(), []
+    for j, ijk in enumerate(np.floor(X[:,:3] / np.float32(voxel_size)).astype(np.int64)):
+        if tuple(ijk) not in seen:
+            seen.add(tuple(ijk))
+            inds.append(j)
+    return X[inds]
+
+def test_voxel_downsample():
+    rng = np.random.RandomState(0)
+    X = np.hstack([rng.randn(2000, 3) * 10, rng.rand(2000, 1)]).astype(np.float32)
+    for voxel_size in [0.5, 2.0]:
+        Xd = voxel_downsample(X, voxel_size)
+        assert 0 < len(Xd) < len(X)
+        assert_array_equal(Xd, _voxel_downsample(X, voxel_size))
+    assert len(voxel_downsample(X[:0], 1.0)) == 0
+
+def test_voxel_downsample_wide_extent():
+    # Beyond 2^21 voxels per axis, e.g. (0, 0, 2^21) and (0, 1, 0)
+    # share a packed key
+    X = np.float64([[0, 0, 0], [0, 1, 0], [0, 0, 1 << 21], [0, 1, 0.5]])
+    assert_array_equal(voxel_downsample(X, 1.0), X[:3])
+
+    rng = np.random.RandomState(1)
+    X = rng.randn(2000, 3) * 1000
+    X[::2] = X[1::2]
+    Xd = voxel_downsample(X, 1e-4)
+    assert_array_equal(Xd, X[::2])
+    assert_array_equal(Xd, _voxel_downsample(X, 1e-4))
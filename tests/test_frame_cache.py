@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from pybot.utils.frame_cache import FrameCache
+from pybot.utils.dataset_readers import DatasetReader, ImageDatasetReader
+from pybot.vision.camera_utils import CameraIntrinsic
+
+class TestFrameCache(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'frame.npy')
+        self.cache_dir = os.path.join(self.directory, 'cache')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, value, n=100):
+        np.save(self.source, np.full(n, value, dtype=np.float64))
+
+    def _spill(self, cache, key, loader):
+        # Evict key to disk, by inserting a frame of the full budget
+        cache.get(key, loader)
+        cache.get(('other',), lambda: np.zeros(cache.maxbytes_ // 8))
+        assert key not in cache
+
+    def test_disk_tier_source_change(self):
+        cache = FrameCache(maxbytes=800, directory=self.cache_dir)
+        key = (self.source, 1.0)
+        loader = lambda: np.load(self.source)
+
+        self._write(1.)
+        self._spill(cache, key, loader)
+        assert_array_equal(cache.get(key, loader), 1.)
+        assert cache.stats['disk_hits'] == 1
+
+        # Modified source at the same path is decoded again
+        cache.clear()
+        time.sleep(0.01)
+        self._write(2., n=99)
+        assert_array_equal(cache.get(key, loader), 2.)
+        assert cache.stats['disk_hits'] == 1
+
+    def test_disk_tier_cap(self):
+        cache = FrameCache(maxbytes=8000, directory=self.cache_dir, maxdiskbytes=4000)
+        for j in range(20):
+            cache.get(('frame', j), lambda: np.arange(1000.) + j)
+        assert len(cache) == 1
+        files = os.listdir(self.cache_dir)
+        assert 0 < len(files) < 19
+        assert sum(os.path.getsize(os.path.join(self.cache_dir, fn)) for fn in files) <= 4000
+        assert cache.stats['disk_nbytes'] <= 4000
+
+        cache.clear_disk()
+        assert os.listdir(self.cache_dir) == []
+
+    def test_disk_tier_failed_save(self):
+        cache = FrameCache(maxbytes=800, directory=self.cache_dir)
+        def _raise(*args, **kwargs):
+            raise IOError('No space left on device')
+
+        savez = np.savez_compressed
+        np.savez_compressed = _raise
+        try:
+            self._spill(cache, ('frame',), lambda: np.arange(100.))
+        finally:
+            np.savez_compressed = savez
+
+        # No partial .npz.tmp files are left behind
+        assert os.listdir(self.cache_dir) == []
+        assert cache.stats['disk_nbytes'] == 0
+
+def test_reader_cache_key():
+    files = ['a.png', 'b.png']
+    try:
+        DatasetReader(process_cb=lambda fn: fn, files=files, cache=FrameCache())
+        assert False, 'DatasetReader with a cache requires a cache_key'
+    except ValueError:
+        pass
+    DatasetReader(process_cb=lambda fn: fn, files=files, cache=FrameCache(), cache_key=('id',))
+    DatasetReader(process_cb=lambda fn: fn, files=files)
+
+    # Calibrations are keyed by their values
+    K = np.float64([[500, 0, 320], [0, 500, 240], [0, 0, 1]])
+    keys = [ImageDatasetReader(files=files, cache=True, calib=calib).cache_key
+            for calib in [None, CameraIntrinsic(K), CameraIntrinsic(K),
+                          CameraIntrinsic(K, D=np.float64([0.1, 0, 0, 0, 0])),
+                          CameraIntrinsic(K * [[2], [2], [1]])]]
+    assert keys[1] == keys[2]
+    assert len(set(keys)) == 4
+
+def test_reader_cache_processes():
+    # The process decoder would bypass the cache
+    files = ['a.png', 'b.png']
+    for cache in [True, FrameCache()]:
+        try:
+            ImageDatasetReader(files=files, cache=cache, processes=2)
+            assert False, 'cache is not supported with processes > 0'
+        except ValueError:
+            pass
+    assert ImageDatasetReader(files=files, cache=False, processes=0).cache is None
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy.linalg import expm, logm
+
+from pybot.geometry.lie_groups import so3_exp, so3_log, so3_left_jacobian, \
+    so3_left_jacobian_inverse, se3_hat, se3_exp, se3_log, se3_left_jacobian, \
+    se3_left_jacobian_inverse, se3_right_jacobian, sim3_exp, sim3_log
+
+# Rotation angles to exercise both the Taylor and closed-form branches
+# around theta -> 0, and the quaternion log near theta -> pi
+ANGLES = [0., 1e-9, 1e-6, 1e-5, 1e-4, 1e-3 - 1e-9, 1e-3 + 1e-9, 1e-2,
+          0.5, 1., 2., 3., np.pi - 1e-3, np.pi - 1e-6]
+
+def _axes(n, seed=0):
+    a = np.random.RandomState(seed).randn(n, 3)
+    return a / np.linalg.norm(a, axis=1)[:,np.newaxis]
+
+def _twists(seed=0):
+    """ [N x 6] twists (v, w) with |w| swept over ANGLES """
+    rng = np.random.RandomState(seed)
+    w = _axes(len(ANGLES), seed) * np.float64(ANGLES)[:,np.newaxis]
+    return np.hstack([rng.randn(len(ANGLES), 3), w])
+
+def _sim3_hat(zeta):
+    Z = se3_hat(zeta[:6])
+    Z[:3,:3] += zeta[6] * np.eye(3)
+    return Z
+
+def test_se3_exp_vs_expm():
+    for xi in _twists():
+        assert_allclose(se3_exp(xi), expm(se3_hat(xi)), atol=1e-10)
+
+def test_se3_log_vs_logm():
+    for xi in _twists():
+        if np.linalg.norm(xi[3:]) > np.pi - 1e-2:
+            continue
+        assert_allclose(se3_hat(se3_log(se3_exp(xi))),
+                        np.real(logm(se3_exp(xi))), atol=1e-6)
+
+def test_se3_round_trip():
+    xi = _twists()
+    assert_allclose(se3_log(se3_exp(xi)), xi, atol=1e-8)
+    T = se3_exp(xi)
+    assert_allclose(se3_exp(se3_log(T)), T, atol=1e-10)
+
+    # Single elements keep their shape
+    assert se3_exp(xi[3]).shape == (4,4)
+    assert se3_log(T[3]).shape == (6,)
+
+def test_sim3_exp_vs_expm():
+    for xi in _twists(seed=1):
+        for l in [0., 1e-9, 1e-4, 0.3, -0.7]:
+            zeta = np.hstack([xi, l])
+            assert_allclose(sim3_exp(zeta), expm(_sim3_hat(zeta)), atol=1e-9)
+
+def test_sim3_round_trip():
+    xi = _twists(seed=2)
+    for l in [0., 1e-9, 1e-4, 0.3, -0.7]:
+        zeta = np.hstack([xi, np.full((len(xi),1), l)])
+        assert_allclose(sim3_log(sim3_exp(zeta)), zeta, atol=1e-7)
+        S = sim3_exp(zeta)
+        assert_allclose(sim3_exp(sim3_log(S)), S, atol=1e-10)
+
+def test_so3_round_trip():
+    w = _axes(len(ANGLES), seed=3) * np.float64(ANGLES)[:,np.newaxis]
+    assert_allclose(so3_log(so3_exp(w)), w, atol=1e-8)
+
+def _numerical_left_jacobian(exp, log, x, eps=1e-6):
+    """ J_l[:,k] = d/de log(exp(x + e e_k) exp(x)^-1) (central differences) """
+    Tinv = np.linalg.inv(exp(x))
+    J = np.empty((len(x), len(x)))
+    for k in range(len(x)):
+        dx = np.zeros(len(x))
+        dx[k] = eps
+        J[:,k] = (log(np.dot(exp(x + dx), Tinv)) -
+                  log(np.dot(exp(x - dx), Tinv))) / (2 * eps)
+    return J
+
+def test_so3_left_jacobian_numerical():
+    w = _axes(len(ANGLES), seed=4) * np.float64(ANGLES)[:,np.newaxis]
+    J, Jinv = so3_left_jacobian(w), so3_left_jacobian_inverse(w)
+    for wk, Jk, Jinvk in zip(w, J, Jinv):
+        if np.linalg.norm(wk) > np.pi - 1e-4:
+            continue
+        assert_allclose(Jk, _numerical_left_jacobian(so3_exp, so3_log, wk), atol=1e-6)
+        assert_allclose(np.dot(Jk, Jinvk), np.eye(3), atol=1e-9)
+
+def test_se3_left_jacobian_numerical():
+    xi = _twists(seed=5)
+    J, Jinv = se3_left_jacobian(xi), se3_left_jacobian_inverse(xi)
+    for xik, Jk, Jinvk in zip(xi, J, Jinv):
+        if np.linalg.norm(xik[3:]) > np.pi - 1e-4:
+            continue
+        assert_allclose(Jk, _numerical_left_jacobian(se3_exp, se3_log, xik), atol=1e-5)
+        assert_allclose(np.dot(Jk, Jinvk), np.eye(6), atol=1e-8)
+
+    # J_r(xi) = J_l(-xi)
+    assert_allclose(se3_right_jacobian(xi), se3_left_jacobian(-xi), atol=1e-12)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from pybot.geometry import transformations as tf
+from pybot.geometry.rigid_transform import RigidTransformArray
+from pybot.utils.dataset_readers import DatasetReader
+from pybot.utils.packed_dataset import pack_dataset, PackedDatasetReader
+
+N, SHAPE = 12, (6, 8, 3)
+
+def _frames(streams=1, seed=0):
+    rng = np.random.RandomState(seed)
+    return [tuple(rng.randint(0, 256, size=SHAPE).astype(np.uint8) for _ in range(streams))
+            for _ in range(N)]
+
+def _poses(seed=0):
+    rng = np.random.RandomState(seed)
+    q = np.float64([tf.random_quaternion(r) for r in rng.rand(N, 3)])
+    return RigidTransformArray(q, rng.randn(N, 3))
+
+def _item(frame):
+    return frame[0] if len(frame) == 1 else frame
+
+class TestPackedDataset(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'dataset.pack')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def _check_frames(self, reader, frames, inds):
+        items = list(reader.iterinds(inds))
+        assert len(items) == len(inds)
+        for item, idx in zip(items, inds):
+            assert_array_equal(np.asarray(item), np.asarray(_item(frames[idx])))
+
+    def _round_trip(self, streams, compress):
+        frames, poses = _frames(streams), _poses()
+        ts = np.arange(N) * 0.1 + 1e9
+        items = [f[0] for f in frames] if streams == 1 else frames
+        assert pack_dataset(self.filename, items, timestamps=ts, poses=poses, compress=compress) == N
+        assert os.listdir(self.directory) == ['dataset.pack']
+
+        reader = PackedDatasetReader(self.filename)
+        assert len(reader) == N
+        assert reader.streams == streams and reader.shape == SHAPE
+        self._check_frames(reader, frames, range(N))
+
+        # Strided, reversed, and negative indexing
+        self._check_frames(reader, frames, range(0, N, 3))
+        assert_array_equal(np.asarray(list(reader.iteritems(every_k_frames=3))),
+                           np.asarray([_item(f) for f in frames[::3]]))
+        assert_array_equal(np.asarray(list(reader.iteritems(every_k_frames=5, reverse=True))),
+                           np.asarray([_item(f) for f in frames[::5][::-1]]))
+        assert_array_equal(np.asarray(reader[-1]), np.asarray(_item(frames[-1])))
+        assert_array_equal(np.asarray(reader[-N]), np.asarray(_item(frames[0])))
+        for idx in [N, -N-1]:
+            try:
+                reader[idx]
+                assert False, 'Index {} should be out of range'.format(idx)
+            except IndexError:
+                pass
+
+        assert_array_equal(reader.timestamps, ts)
+        assert_allclose(reader.poses.matrix, poses.matrix, atol=1e-12)
+        return reader
+
+    def test_raw_single_stream(self):
+        reader = self._round_trip(streams=1, compress=0)
+
+        # Read-only, zero-copy views into the file
+        frames = reader.frames
+        assert isinstance(frames, np.memmap)
+        assert frames.shape == (N, 1) + SHAPE
+        assert not frames.flags.writeable
+        assert not reader[0].flags.writeable
+        assert not reader.timestamps.flags.writeable
+        try:
+            frames[0,0,0,0,0] = 0
+            assert False, 'Packed frames should be read-only'
+        except ValueError:
+            pass
+
+    def test_raw_stereo(self):
+        reader = self._round_trip(streams=2, compress=0)
+        assert reader.frames.shape == (N, 2) + SHAPE
+        assert len(list(reader.iter_stereo_frames(every_k_frames=2))) == (N + 1) // 2
+
+    def test_compressed_single_stream(self):
+        reader = self._round_trip(streams=1, compress=6)
+        try:
+            reader.frames
+            assert False, 'Compressed frames cannot be memory-mapped'
+        except RuntimeError:
+            pass
+
+    def test_compressed_stereo(self):
+        self._round_trip(streams=2, compress=1)
+
+    def test_reader_every_k_frames(self):
+        frames = [f[0] for f in _frames()]
+        reader = DatasetReader(process_cb=lambda fn: frames[int(fn)],
+                               files=[str(j) for j in range(N)])
+        assert pack_dataset(self.filename, reader, every_k_frames=4) == len(frames[::4])
+        self._check_frames(PackedDatasetReader(self.filename), [(f,) for f in frames[::4]],
+                           range(len(frames[::4])))
+
+        try:
+            pack_dataset(self.filename, frames, every_k_frames=4)
+            assert False, 'every_k_frames requires a dataset reader'
+        except ValueError:
+            pass
+
+    def test_failure_removes_tmp(self):
+        frames = [f[0] for f in _frames()]
+        frames[5] = frames[5][:-1]
+        try:
+            pack_dataset(self.filename, frames)
+            assert False, 'Frames of different shapes cannot be packed'
+        except ValueError:
+            pass
+
+        try:
+            pack_dataset(self.filename, frames[:4], timestamps=np.arange(5))
+            assert False, 'Timestamps of a different length cannot be packed'
+        except ValueError:
+            pass
+        assert os.listdir(self.directory) == []
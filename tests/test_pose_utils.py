@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from pybot.geometry.rigid_transform import RigidTransform, RigidTransformArray
+from pybot.utils.pose_utils import PoseTrajectory, PoseInterpolator
+
+def _poses(ts):
+    """ Poses at (t, 0, 0), with yaw 0.1 t """
+    return [RigidTransform.from_rpyxyz(0, 0, 0.1 * t, t, 0, 0) for t in ts]
+
+def test_query_interpolation():
+    ts = [0., 1., 2., 3.]
+    tr = PoseTrajectory(ts, _poses(ts))
+    assert len(tr) == 4
+
+    # Scalar queries return a RigidTransform, batched ones (poses, valid)
+    p = tr.query(1.25)
+    assert isinstance(p, RigidTransform)
+    assert_allclose(p.tvec, [1.25, 0, 0], atol=1e-12)
+    assert_allclose(p.quat.to_rpy(axes='sxyz')[2], 0.125, atol=1e-12)
+
+    tq = np.float64([0., 0.5, 1.25, 2., 3.])
+    poses, valid = tr.query(tq)
+    assert isinstance(poses, RigidTransformArray)
+    assert valid.all()
+    assert_allclose(poses.tvec[:,0], tq, atol=1e-12)
+    for t, pk in zip(tq, poses):
+        assert_allclose(pk.matrix, tr.query(t).matrix, atol=1e-12)
+
+def test_query_gaps():
+    ts = [0., 1., 2., 10., 11.]
+    tr = PoseTrajectory(ts, _poses(ts), max_gap=1.5)
+
+    # Interpolating across the gap is invalid, but the
+    # measurements on either side of it are not
+    assert tr.query(5.) is None
+    for t in [2., 10., 1.5, 10.5]:
+        assert_allclose(tr.query(t).tvec, [t, 0, 0], atol=1e-12)
+
+    tq = np.float64([1.5, 2., 2.5, 9.9, 10., 11.])
+    _, valid = tr.query(tq)
+    assert_array_equal(valid, [True, True, False, False, True, True])
+
+def test_query_extrapolation():
+    ts = [1., 2., 3.]
+    tr = PoseTrajectory(ts, _poses(ts), max_extrapolation=0.5)
+
+    # End poses are held up to max_extrapolation
+    assert_allclose(tr.query(0.6).tvec, [1, 0, 0], atol=1e-12)
+    assert_allclose(tr.query(3.5).tvec, [3, 0, 0], atol=1e-12)
+    assert tr.query(0.4) is None
+    assert tr.query(3.6) is None
+
+    _, valid = tr.query([0.4, 0.5, 3.5, 3.6])
+    assert_array_equal(valid, [False, True, True, False])
+
+    # Single pose trajectories
+    tr = PoseTrajectory([1.], _poses([1.]))
+    assert_allclose(tr.query(1.).tvec, [1, 0, 0], atol=1e-12)
+    assert tr.query(1.1) is None
+
+def test_extend_out_of_order():
+    ts = np.float64([0., 1., 2., 3., 4., 5.])
+    poses = _poses(ts)
+    tr = PoseTrajectory()
+    tr.extend(ts[3:], poses[3:])
+    tr.extend(ts[:2], poses[:2])
+    tr.append(ts[2], poses[2])
+    assert_array_equal(tr.timestamps, ts)
+    assert_allclose(tr.poses.tvec[:,0], ts, atol=1e-12)
+    assert_allclose(tr.query(2.5).tvec, [2.5, 0, 0], atol=1e-12)
+
+    # Appends after a query are merged on the next one
+    tr.append(6., _poses([6.])[0])
+    assert_allclose(tr.query(5.5).tvec, [5.5, 0, 0], atol=1e-12)
+    assert tr.find(5.5) == 5
+    assert tr.nearest(5.6) == 6
+
+    try:
+        tr.extend([7., 8.], _poses([7.]))
+        assert False, 'Mismatched timestamps and poses'
+    except ValueError:
+        pass
+
+    try:
+        PoseTrajectory().query(0.)
+        assert False, 'Empty trajectories cannot be queried'
+    except RuntimeError:
+        pass
+
+def test_pose_interpolator():
+    pi = PoseInterpolator(maxlen=3)
+    ts = [0., 1., 2., 3.]
+    for t, p in zip(ts, _poses(ts)):
+        pi.add(t, p)
+    assert_allclose(pi.query(1.5).tvec, [1.5, 0, 0], atol=1e-12)
+
+    # The window trajectory is re-used until the next add()
+    tr = pi.trajectory
+    assert pi.trajectory is tr
+    assert pi.query(0.5) is None
+    pi.add(4., _poses([4.])[0])
+    assert pi.trajectory is not tr
+    assert_allclose(pi.query(3.5).tvec, [3.5, 0, 0], atol=1e-12)
+    assert pi.query(1.5) is None
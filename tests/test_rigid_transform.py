@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pybot.geometry.rigid_transform import RigidTransform, RigidTransformArray, \
+    DualQuaternion, DualQuaternionArray
+
+def test_interpolate_weighting():
+    # Rotation is weighted towards self, position towards other
+    # (legacy RigidTransform.interpolate convention)
+    a = RigidTransform.from_rpyxyz(0.1, 0.2, 0.3, 1, 2, 3)
+    b = RigidTransform.from_rpyxyz(0.5, -0.2, 1.3, 4, 2, 0)
+    for w in [0., 0.25, 0.5, 1.]:
+        p = a.interpolate(b, w)
+        assert_allclose(p.R, a.quat.interpolate(b.quat, w).R, atol=1e-12)
+        assert_allclose(p.t, a.t + w * (b.t - a.t), atol=1e-12)
+    assert_allclose(a.interpolate(b, 1.).R, a.R, atol=1e-12)
+    assert_allclose(a.interpolate(b, 0.).R, b.R, atol=1e-12)
+
+def test_interpolate_geodesic():
+    a = RigidTransform.from_rpyxyz(0.1, 0.2, 0.3, 1, 2, 3)
+    b = RigidTransform.from_rpyxyz(0.5, -0.2, 1.3, 4, 2, 0)
+    assert_allclose(a.interpolate_geodesic(b, 0.).matrix, a.matrix, atol=1e-9)
+    assert_allclose(a.interpolate_geodesic(b, 1.).matrix, b.matrix, atol=1e-9)
+
+    # Pure rotations: the geodesic, and RigidTransformArray.interpolate 
+    # weight the rotation towards other (w=0: self)
+    a, b = RigidTransform.identity(), RigidTransform.from_rpyxyz(0, 0, 1., 0, 0, 0)
+    yaw = lambda p: p.quat.to_rpy(axes='sxyz')[2]
+    assert_allclose(yaw(a.interpolate(b, 0.25)), 0.75, atol=1e-12)
+    assert_allclose(yaw(a.interpolate_geodesic(b, 0.25)), 0.25, atol=1e-12)
+
+    A, B = RigidTransformArray.from_list([a]), RigidTransformArray.from_list([b])
+    assert_allclose(yaw(A.interpolate(B, 0.25)[0]), 0.25, atol=1e-12)
+    assert_allclose(A.interpolate_geodesic(B, [0.25]).matrix, 
+                    [a.interpolate_geodesic(b, 0.25).matrix], atol=1e-12)
+
+def test_apply_out():
+    p = RigidTransform.from_rpyxyz(0.1, 0.2, 0.3, 1, 2, 3)
+    X = np.random.RandomState(0).randn(100, 3)
+    expected = np.dot(X, p.R.T) + p.t
+    assert_allclose(p.apply(X), expected, atol=1e-12)
+
+    out = np.empty_like(X)
+    assert p.apply(X, out=out) is out
+    assert_allclose(out, expected, atol=1e-12)
+
+    # In-place, incl. organized [H x W x 3] and float32 point sets
+    Y = X.copy()
+    p.apply(Y, out=Y)
+    assert_allclose(Y, expected, atol=1e-12)
+
+    Y = X.reshape(10, 10, 3).copy()
+    p.apply(Y, out=Y)
+    assert_allclose(Y.reshape(-1,3), expected, atol=1e-12)
+
+    Y = X.astype(np.float32)
+    p.apply(Y, out=Y)
+    assert_allclose(Y, expected, atol=1e-4)
+
+def _dq_array(poses):
+    return DualQuaternionArray.from_rigid_transform_array(RigidTransformArray.from_list(poses))
+
+def _poses(n=5, seed=0):
+    rng = np.random.RandomState(seed)
+    return [RigidTransform.from_rpyxyz(*np.hstack([0.3 * rng.randn(3), rng.randn(3)]))
+            for _ in range(n)]
+
+def test_dq_blend_antipodal():
+    poses = _poses()
+    D = _dq_array(poses)
+
+    # Negated (antipodal) elements represent the same transforms
+    Dn = D.copy()
+    Dn.data[1::2] *= -1
+    w = np.float64([0.1, 0.3, 0.2, 0.15, 0.25])
+    for weights in [None, w]:
+        assert_allclose(Dn.blend(weights).to_matrix(), D.blend(weights).to_matrix(), atol=1e-12)
+        assert_allclose(Dn.average(weights).to_matrix(), D.average(weights).to_matrix(), atol=1e-9)
+
+    # Even when the pivot is negated
+    assert_allclose(Dn.blend(w, pivot=1).to_matrix(), D.blend(w).to_matrix(), atol=1e-12)
+
+    # A transform and its antipode do not cancel out
+    Da = _dq_array([poses[0], poses[0]])
+    Da.data[1] *= -1
+    assert_allclose(Da.blend().to_matrix(), poses[0].matrix, atol=1e-12)
+    assert_allclose(Da.average().to_matrix(), poses[0].matrix, atol=1e-12)
+
+def test_dq_blend_slerp():
+    a = RigidTransform.from_rpyxyz(0.1, 0.2, 0.3, 1, 2, 3)
+    b = RigidTransform.from_rpyxyz(0.5, -0.2, 1.3, 4, 2, 0)
+    D = _dq_array([a, b])
+    A, B = RigidTransformArray.from_list([a]), RigidTransformArray.from_list([b])
+    da, db = DualQuaternion.from_rigid_transform(a), DualQuaternion.from_rigid_transform(b)
+
+    # The (bi-invariant) average of two poses is their geodesic 
+    # interpolation, with the SLERP rotation
+    for w in [0., 0.2, 0.5, 0.7, 1.]:
+        avg = D.average([1 - w, w])
+        assert_allclose(avg.to_matrix(), da.interpolate(db, w).to_matrix(), atol=1e-9)
+        assert_allclose(avg.to_matrix(), a.interpolate_geodesic(b, w).matrix, atol=1e-9)
+        assert_allclose(avg.rotation.R, A.interpolate(B, w)[0].R, atol=1e-9)
+
+    # DLB agrees at the end points, and mid-point
+    for w in [0., 0.5, 1.]:
+        assert_allclose(D.blend([1 - w, w]).to_matrix(), a.interpolate_geodesic(b, w).matrix, atol=1e-9)
+
+def test_dq_blend_edge_cases():
+    poses = _poses()
+    D = _dq_array(poses)
+
+    # Identities
+    I = DualQuaternionArray.identity(4)
+    assert_allclose(I.blend().to_matrix(), np.eye(4), atol=1e-12)
+    assert_allclose(I.average([1, 2, 3, 4]).to_matrix(), np.eye(4), atol=1e-12)
+
+    # Single element, and one-hot weights
+    assert_allclose(D[:1].blend().to_matrix(), poses[0].matrix, atol=1e-12)
+    assert_allclose(D[:1].average().to_matrix(), poses[0].matrix, atol=1e-12)
+    for j in range(len(D)):
+        w = np.zeros(len(D))
+        w[j] = 1
+        assert_allclose(D.blend(w).to_matrix(), poses[j].matrix, atol=1e-12)
+        assert_allclose(D.average(w).to_matrix(), poses[j].matrix, atol=1e-9)
+
+    # Weights are normalized
+    w = np.float64([0.1, 0.3, 0.2, 0.15, 0.25])
+    assert_allclose(D.blend(3 * w).to_matrix(), D.blend(w).to_matrix(), atol=1e-12)
+    assert_allclose(D.average(3 * w).to_matrix(), D.average(w).to_matrix(), atol=1e-9)
+    assert_allclose(D.blend().to_matrix(), D.blend(np.ones(len(D))).to_matrix(), atol=1e-12)
+
+    # [M x N] weights
+    W = np.vstack([w, np.eye(len(D))[2], np.ones(len(D))])
+    B = D.blend(W)
+    assert isinstance(B, DualQuaternionArray) and len(B) == 3
+    for Bk, wk in zip(B, W):
+        assert_allclose(Bk.to_matrix(), D.blend(wk).to_matrix(), atol=1e-12)
+    assert_allclose(np.sum(B.real * B.real, axis=1), 1, atol=1e-12)
+    assert_allclose(np.sum(B.real * B.dual, axis=1), 0, atol=1e-12)
+
+    for (dqs, weights) in [(D, np.ones(3)), (D, np.ones((2, 3))), (DualQuaternionArray.from_list([]), None)]:
+        try:
+            dqs.blend(weights)
+            assert False, 'Mismatched weights, or empty blends'
+        except ValueError:
+            pass
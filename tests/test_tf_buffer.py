@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pybot.geometry.rigid_transform import RigidTransform
+from pybot.externals.ros.tf_buffer import TFBuffer
+
+def _buffer():
+    tfb = TFBuffer()
+    ts = np.arange(10, dtype=np.float64)
+    tfb.extend('map', 'odom', ts, [RigidTransform(tvec=[t, 0, 0]) for t in ts])
+    tfb.set_transform('/odom', '/base_link', 0., RigidTransform(tvec=[0, 1, 0]), static=True)
+    return tfb
+
+def test_leading_slash():
+    tfb = _buffer()
+    assert tfb.frames == set(['map', 'odom', 'base_link'])
+    for frame in ['map', '/map', 'base_link', '/base_link']:
+        assert tfb.has_frame(frame)
+
+    p = tfb.lookup('map', 'base_link', 2.5)
+    assert_allclose(p.tvec, [2.5, 1, 0], atol=1e-12)
+    for (from_tf, to_tf) in [('/map', '/base_link'), ('/map', 'base_link'), ('map', '/base_link')]:
+        assert_allclose(tfb.lookup(from_tf, to_tf, 2.5).matrix, p.matrix, atol=1e-12)
+        assert tfb.chain(from_tf, to_tf) == tfb.chain('map', 'base_link')
+    assert len(tfb.trajectory('/map', '/base_link')) == 10
+    assert tfb.can_transform('/odom', 'base_link')
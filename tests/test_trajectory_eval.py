@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from pybot.geometry import transformations as tf
+from pybot.geometry.rigid_transform import RigidTransformArray
+from pybot.utils.trajectory_eval import umeyama_alignment, align_trajectory, \
+    absolute_trajectory_error, segment_indices, relative_pose_error, \
+    evaluate_trajectory
+
+def _random_trajectory(n=200, seed=0):
+    rng = np.random.RandomState(seed)
+    q = np.float64([tf.random_quaternion(r) for r in rng.rand(n, 3)])
+    return RigidTransformArray(q, np.cumsum(rng.randn(n, 3), axis=0))
+
+def _straight_line(n, step=1., yaw=0.):
+    """ Poses k at (k * step, 0, 0), rotated by k * yaw about z """
+    a = np.arange(n) * yaw
+    q = np.zeros((n,4))
+    q[:,2], q[:,3] = np.sin(a / 2), np.cos(a / 2)
+    t = np.zeros((n,3))
+    t[:,0] = np.arange(n) * step
+    return RigidTransformArray(q, t)
+
+def test_umeyama_recovers_sim3():
+    rng = np.random.RandomState(1)
+    X = rng.randn(100, 3)
+    R = tf.random_rotation_matrix(rng.rand(3))[:3,:3]
+    t, s = rng.randn(3), 2.5
+    Y = s * np.dot(X, R.T) + t
+
+    A = umeyama_alignment(X, Y, with_scale=True)
+    assert_allclose(A.R, R, atol=1e-10)
+    assert_allclose(A.t, t, atol=1e-10)
+    assert_allclose(A.scale, s, atol=1e-10)
+
+    # SE(3) only
+    A = umeyama_alignment(X, np.dot(X, R.T) + t)
+    assert_allclose(A.R, R, atol=1e-10)
+    assert_allclose(A.t, t, atol=1e-10)
+    assert A.scale == 1.0
+
+def test_ate_rigid_copy():
+    gt = _random_trajectory()
+    T = RigidTransformArray.from_matrix(tf.random_rotation_matrix(np.random.RandomState(2).rand(3))[np.newaxis])
+    T.tvec[:] = [1., -2., 3.]
+    est = T.oplus(gt)
+
+    assert absolute_trajectory_error(est, gt, align=False).max() > 1.
+    assert_allclose(absolute_trajectory_error(est, gt), 0., atol=1e-9)
+
+    aligned, A = align_trajectory(est, gt)
+    assert_allclose(aligned.matrix, gt.matrix, atol=1e-9)
+
+    # Scaled copy requires Sim(3) alignment
+    scaled = RigidTransformArray(est.xyzw, 0.5 * est.tvec)
+    assert_allclose(absolute_trajectory_error(scaled, gt, with_scale=True), 0., atol=1e-9)
+
+    ev = evaluate_trajectory(est, gt, lengths=(10, 20), step=1)
+    assert_allclose(ev.ate_stats.max, 0., atol=1e-9)
+    assert_allclose(ev.t_err, 0., atol=1e-9)
+    assert_allclose(ev.r_err, 0., atol=1e-9)
+
+def test_segment_indices():
+    # First frame strictly further than length along the trajectory
+    dist = np.arange(30, dtype=np.float64)
+    first, last = segment_indices(dist, 10, step=5)
+    assert_array_equal(first, [0, 5, 10, 15])
+    assert_array_equal(last, [11, 16, 21, 26])
+
+    first, last = segment_indices([0., 0.5, 2., 2.5, 6.], 2, step=1)
+    assert_array_equal(first, [0, 1, 2, 3])
+    assert_array_equal(last, [3, 4, 4, 4])
+
+def test_rpe_straight_line():
+    n, L = 300, 100
+    gt = _straight_line(n)
+
+    # 10% scale drift: every segment (first, first + L + 1)
+    # is 0.1 * (L + 1) m too long
+    rpe, = relative_pose_error(_straight_line(n, step=1.1), gt, lengths=(L,), step=10)
+    assert_array_equal(rpe.first, np.arange(0, n - L - 1, 10))
+    assert_array_equal(rpe.last, rpe.first + L + 1)
+    assert_allclose(rpe.t_err, 0.1 * (L + 1) / L, atol=1e-12)
+    assert_allclose(rpe.r_err, 0., atol=1e-12)
+    assert_allclose(rpe.speed, L / ((L + 2) / 10.), atol=1e-12)
+
+    # Heading drift of a per frame, on the ground truth positions:
+    # E = (est_f^-1 est_l)^-1 (gt_f^-1 gt_l) rotates by (L + 1) a, and
+    # translates by (L + 1) |1 - exp(-i f a)| = 2 (L + 1) |sin(f a / 2)|
+    a = 1e-3
+    est = _straight_line(n, yaw=a)
+    est = RigidTransformArray(est.xyzw, gt.tvec)
+    rpe, = relative_pose_error(est, gt, lengths=(L,), step=10)
+    f = rpe.first
+    assert_allclose(rpe.r_err, (L + 1) * a / L, atol=1e-12)
+    assert_allclose(rpe.t_err, 2 * (L + 1) * np.fabs(np.sin(f * a / 2)) / L, atol=1e-12)
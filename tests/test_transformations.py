@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pybot.geometry import transformations as tf
+from pybot.geometry.quaternion import Quaternion, QuaternionArray
+
+AXES = sorted(tf._AXES2TUPLE.keys())
+
+def _angles(n=50, seed=0):
+    """ Random Euler angles in [-2 pi, 2 pi], incl. gimbal-locked ones """
+    A = (4.0 * math.pi) * (np.random.RandomState(seed).rand(n, 3) - 0.5)
+    A[0,1], A[1,1], A[2,1] = math.pi / 2, -math.pi / 2, 0.
+    return A
+
+def _quaternions(n=50, seed=0):
+    rng = np.random.RandomState(seed)
+    return np.float64([tf.random_quaternion(rng.rand(3)) for _ in range(n)])
+
+def _rotations(n=50, seed=0):
+    R = [tf.quaternion_matrix(q) for q in _quaternions(n, seed)]
+    R += [tf.rotation_matrix(math.pi, d) for d in np.eye(3)]
+    R += [tf.rotation_matrix(math.pi, d) for d in [[1,1,0], [0,1,1], [1,0,1]]]
+    return np.float64(R)
+
+def test_batch_euler_matrix():
+    A = _angles()
+    for axes in AXES + [tf._AXES2TUPLE['rxyz']]:
+        M0 = [tf.euler_matrix(axes=axes, *a) for a in A]
+        assert_allclose(tf.batch_euler_matrix(axes=axes, *A.T), M0, atol=1e-12)
+
+    # Broadcasting, and single elements
+    M = tf.batch_euler_matrix(A[:,0].reshape(5,10), 0.3, A[:,2].reshape(5,10))
+    assert M.shape == (5,10,4,4)
+    assert tf.batch_euler_matrix(1, 2, 3).shape == (4,4)
+
+def test_batch_euler_from_matrix():
+    A = _angles()
+    for axes in AXES:
+        R = np.float64([tf.euler_matrix(axes=axes, *a) for a in A])
+        A0 = [tf.euler_from_matrix(R0, axes) for R0 in R]
+        assert_allclose(tf.batch_euler_from_matrix(R, axes), A0, atol=1e-9)
+        assert_allclose(tf.batch_euler_from_matrix(R[:,:3,:3], axes), A0, atol=1e-9)
+
+def test_batch_euler_from_quaternion():
+    q = _quaternions()
+    for axes in AXES:
+        A0 = [tf.euler_from_quaternion(q0, axes) for q0 in q]
+        assert_allclose(tf.batch_euler_from_quaternion(q, axes), A0, atol=1e-9)
+
+def test_batch_quaternion_from_euler():
+    A = _angles()
+    for axes in AXES:
+        q0 = [tf.quaternion_from_euler(axes=axes, *a) for a in A]
+        assert_allclose(tf.batch_quaternion_from_euler(axes=axes, *A.T), q0, atol=1e-12)
+
+def test_batch_quaternion_matrix():
+    q = np.vstack([_quaternions(), [[0,0,0,0]], [[0,0,0,2]]])
+    M0 = [tf.quaternion_matrix(q0) for q0 in q]
+    assert_allclose(tf.batch_quaternion_matrix(q), M0, atol=1e-12)
+
+def test_batch_quaternion_from_matrix():
+    R = _rotations()
+    q0 = [tf.quaternion_from_matrix(R0) for R0 in R]
+    assert_allclose(tf.batch_quaternion_from_matrix(R), q0, atol=1e-12)
+    assert_allclose(tf.batch_quaternion_from_matrix(R[:,:3,:3]), q0, atol=1e-12)
+    assert tf.batch_quaternion_from_matrix(R[0]).shape == (4,)
+
+def test_quaternion_array_delegation():
+    qs = _quaternions()
+    qa = QuaternionArray(qs)
+    ql = [Quaternion(q) for q in qs]
+
+    for axes in AXES:
+        assert_allclose(qa.to_rpy(axes=axes), [q.to_rpy(axes=axes) for q in ql], atol=1e-9)
+
+        A = _angles()
+        qe = QuaternionArray.from_rpy(A[:,0], A[:,1], A[:,2], axes=axes)
+        assert_allclose(qe.q, [Quaternion.from_rpy(a[0], a[1], a[2], axes=axes).q
+                               for a in A], atol=1e-12)
+
+    assert_allclose(qa.R, [q.R for q in ql], atol=1e-12)
+    assert_allclose(qa.matrix, [q.matrix for q in ql], atol=1e-12)
+
+    R = _rotations()
+    assert_allclose(QuaternionArray.from_matrix(R).q,
+                    [Quaternion.from_matrix(R0) for R0 in R], atol=1e-12)
+    assert_allclose(QuaternionArray.from_matrix(R[:,:3,:3]).q,
+                    [Quaternion.from_matrix(R0) for R0 in R], atol=1e-12)
+
+    # Multiply, rotate, inverse and interpolate against Quaternion
+    qb = QuaternionArray(qs[::-1])
+    assert_allclose((qa * qb).q, [(q0 * q1).q for q0, q1 in zip(ql, qb)], atol=1e-12)
+    assert_allclose(qa.inverse().q, [q.inverse().q for q in ql], atol=1e-12)
+
+    v = np.random.RandomState(1).randn(len(qs), 3)
+    assert_allclose(qa.rotate(v), [q.rotate(v0) for q, v0 in zip(ql, v)], atol=1e-12)
+
+    for w in [0., 0.3, 1.]:
+        qi = qa.interpolate(qb, w)
+        qi0 = [q0.interpolate(q1, w) for q0, q1 in zip(ql, qb)]
+        # Equal up to the sign of the quaternion
+        assert_allclose(np.fabs(np.sum(qi.q * [q.q for q in qi0], axis=1)), 1., atol=1e-9)
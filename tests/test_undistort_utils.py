@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from pybot.vision.undistort_utils import UndistortRectifyMapCache
+
+K = np.float64([[50., 0, 32.], [0, 50., 24.], [0, 0, 1]])
+D = np.float64([0.1, -0.05, 0, 0, 0])
+
+class TestUndistortRectifyMapCache(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_load(self):
+        maps = UndistortRectifyMapCache().get(K, D, shape=(48,64), directory=self.directory)
+        key = UndistortRectifyMapCache.key(K, D, shape=(48,64))
+        assert os.listdir(self.directory) == ['undistort_map_{}.npz'.format(key)]
+
+        # Loaded (not rebuilt) by a new cache
+        cache = UndistortRectifyMapCache()
+        cache.build = None
+        for m, ml in zip(maps, cache.get(K, D, shape=(48,64), directory=self.directory)):
+            assert_array_equal(m, ml)
+
+    def test_failed_save(self):
+        def _raise(*args, **kwargs):
+            raise IOError('No space left on device')
+
+        savez = np.savez
+        np.savez = _raise
+        try:
+            maps = UndistortRectifyMapCache().get(K, D, shape=(48,64), directory=self.directory)
+        finally:
+            np.savez = savez
+
+        # Maps are still built, and no partial files are left behind
+        assert maps[0].shape == (48, 64, 2)
+        assert os.listdir(self.directory) == []
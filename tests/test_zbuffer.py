@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from pybot.utils.db_utils import AttrDict
+from pybot.geometry.rigid_transform import RigidTransformArray
+from pybot.vision.camera_utils import Camera, CameraIntrinsic, CameraExtrinsic, kinect_v1_params
+from pybot.vision.zbuffer import ZBuffer
+from pybot.utils.dataset.uw_rgbd import UWRGBDSceneDataset
+
+def _camera():
+    intrinsic = CameraIntrinsic(K=kinect_v1_params.K_rgb, shape=(480,640))
+    return Camera.from_intrinsics_extrinsics(intrinsic, CameraExtrinsic.identity())
+
+def _patch(center, size, step):
+    """ Fronto-parallel square patch of points (facing the camera) """
+    s = np.arange(-size / 2., size / 2. + 1e-9, step)
+    x, y = np.meshgrid(s, s)
+    return np.vstack([x.ravel(), y.ravel(), np.zeros(x.size)]).T + center
+
+def _objects():
+    """ Near (0), fully occluded far (1), and unoccluded side (2) objects """
+    return [_patch([0, 0, 2.], 0.6, 0.003),
+            _patch([0, 0, 4.], 0.4, 0.01),
+            _patch([1., 0, 3.], 0.3, 0.005)]
+
+def test_full_occlusion():
+    zbuf = ZBuffer(_camera(), discretize=4).rasterize_objects(_objects())
+    bboxes, fraction, depth, valid = zbuf.object_bboxes(min_fraction=0.25)
+
+    # Far object is entirely behind the near one
+    assert (zbuf.footprint > 0).all()
+    assert fraction[1] == 0 and not valid[1]
+    assert np.isnan(bboxes[1]).all() and np.isnan(depth[1])
+    assert not (zbuf.label == 1).any()
+
+    assert_allclose(fraction[[0,2]], 1.)
+    assert valid[0] and valid[2]
+    assert_allclose(depth[[0,2]], [2., 3.], atol=1e-6)
+
+    # Near bbox (within a cell of its projection)
+    x = _camera().project(_objects()[0])
+    lo, hi = x.min(axis=0), x.max(axis=0)
+    assert_allclose(bboxes[0,:2], lo, atol=4)
+    assert_allclose(bboxes[0,2:], hi, atol=4)
+
+    # Partially occluded, larger far object
+    objects = _objects()
+    objects[1] = _patch([0, 0, 4.], 2.0, 0.01)
+    _, fraction, _, valid = ZBuffer(_camera(), discretize=4).rasterize_objects(objects) \
+                                                           .object_bboxes(min_fraction=0.25)
+    assert 0.25 < fraction[1] < 1 and valid[1]
+    _, _, _, valid = ZBuffer(_camera(), discretize=4).rasterize_objects(objects) \
+                                                     .object_bboxes(min_fraction=0.95)
+    assert not valid[1]
+
+def test_out_of_bounds_and_behind():
+    camera = _camera()
+    behind = _patch([0, 0, -2.], 0.6, 0.01)
+    outside = _patch([50., 0, 2.], 0.6, 0.01)
+    tooclose = _patch([0, 0, 0.05], 0.01, 0.001)
+    mixed = np.vstack([_patch([0.5, 0, 2.], 0.2, 0.005), behind, outside])
+    zbuf = ZBuffer(camera, discretize=4, min_depth=0.1).rasterize_objects(
+        [behind, outside, tooclose, mixed])
+
+    # Invisible objects have no footprint, nor visible cells
+    assert_array_equal(zbuf.footprint[:3], 0)
+    bboxes, fraction, depth, valid = zbuf.object_bboxes()
+    assert_array_equal(fraction[:3], 0)
+    assert_array_equal(valid, [False, False, False, True])
+    assert np.isnan(bboxes[:3]).all() and np.isnan(depth[:3]).all()
+    assert set(np.unique(zbuf.label)) == set([-1, 3])
+    assert np.isinf(zbuf.depth[zbuf.label < 0]).all()
+
+    # Only the in-view part of the mixed object counts
+    assert fraction[3] == 1
+    assert_allclose(depth[3], 2., atol=1e-6)
+    H, W = camera.shape[:2]
+    assert (bboxes[3] >= 0).all() and bboxes[3,2] < W and bboxes[3,3] < H
+
+    # Nothing in view
+    zbuf = ZBuffer(camera).rasterize_objects([behind, outside])
+    _, fraction, _, valid = zbuf.object_bboxes()
+    assert not valid.any() and (zbuf.label < 0).all()
+
+def test_sequence_bboxes_occlusions():
+    labels = [UWRGBDSceneDataset.target_hash[c] for c in ['bowl', 'cap', 'soda_can']]
+    objects = [AttrDict(label=l, uid=j, points=p, center=p.mean(axis=0))
+               for j, (l, p) in enumerate(zip(labels, _objects()))]
+
+    # Scene reader with only the aligned map
+    reader = UWRGBDSceneDataset._reader.__new__(UWRGBDSceneDataset._reader)
+    reader.map_info = AttrDict(camera=_camera(), objects=objects)
+    poses = RigidTransformArray.identity(3)
+    poses.tvec[:] = [[0, 0, 0], [0.01, 0, 0], [0, 0, 0.5]]
+
+    bboxes = reader.get_sequence_bboxes(poses)
+    assert [sorted(bb.uid for bb in frame) for frame in bboxes] == [[0, 1, 2]] * 3
+
+    bboxes = reader.get_sequence_bboxes(poses, handle_occlusions=True)
+    assert [sorted(bb.uid for bb in frame) for frame in bboxes] == [[0, 2]] * 3
+    for frame in bboxes:
+        for bb in frame:
+            assert bb.target == objects[bb.uid].label
+            assert bb.category == UWRGBDSceneDataset.target_unhash[bb.target]
+            assert np.isfinite(bb.coords).all()
+
+    # Single pose
+    assert sorted(bb.uid for bb in reader.get_bboxes(poses[0], handle_occlusions=True)) == [0, 2]